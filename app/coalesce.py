@@ -0,0 +1,93 @@
+import threading
+import time
+from .logs import get_logger
+
+log = get_logger('midi')
+
+
+class CCCoalescer:
+    """Agrupa atualizações de CC de alta taxa.
+
+    Handlers embrulhados com wrap() só guardam o último valor por
+    (canal, CC); uma thread aplica os valores pendentes a cada `interval`
+    segundos (normalmente um período de áudio). Notas, sustain e ações não
+    passam por aqui.
+
+    Contadores: `received` (updates recebidos), `dropped` (valores
+    intermediários descartados por um mais novo), `merged` (flushes que
+    absorveram mais de um update) e `flushed` (valores aplicados)."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.received = 0
+        self.dropped = 0
+        self.merged = 0
+        self.flushed = 0
+        # (canal << 7) | cc -> [handler, canal, valor, updates]
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def wrap(self, ccnum, handler):
+        lock = self._lock
+
+        def coalesced(channel, value):
+            key = (channel << 7) | ccnum
+            with lock:
+                self.received += 1
+                slot = self._pending.get(key)
+                if slot is None:
+                    self._pending[key] = [handler, channel, value, 1]
+                else:
+                    slot[0] = handler
+                    slot[2] = value
+                    slot[3] += 1
+                    self.dropped += 1
+
+        return coalesced
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+        for handler, channel, value, updates in pending.values():
+            if updates > 1:
+                self.merged += 1
+            try:
+                handler(channel, value)
+            except Exception as e:
+                log.error('erro aplicando CC agrupado: %s', e)
+            self.flushed += 1
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name='cc-coalesce', daemon=True
+        )
+        self._thread.start()
+        log.info('CC coalescing a cada %.1f ms', self.interval * 1000)
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        deadline = time.perf_counter()
+        while not self._stop.is_set():
+            deadline += self.interval
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                # Atrasou mais de um período: realinha em vez de acumular
+                deadline = time.perf_counter()
+            self.flush()
+
+    def stats(self):
+        return {
+            'interval_ms': round(self.interval * 1000, 3),
+            'received': self.received,
+            'dropped': self.dropped,
+            'merged': self.merged,
+            'flushed': self.flushed,
+        }
@@ -4,17 +4,55 @@ import yaml
 CFG_FILE = os.environ.get('SF2_CFG', 'config.yaml')
 
 
+def _named(value):
+    """Listas de dicts com 'name' (bancos, instrumentos) viram dicts."""
+    if (isinstance(value, list) and value
+            and all(isinstance(v, dict) and 'name' in v for v in value)):
+        return {v['name']: v for v in value}
+    return None
+
+
+def _diff_into(path, old, new, out):
+    old_named, new_named = _named(old), _named(new)
+    if old_named is not None and new_named is not None:
+        old, new = old_named, new_named
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                out.append((path + (key,), old[key], None))
+        for key in new:
+            if key not in old:
+                out.append((path + (key,), None, new[key]))
+            else:
+                _diff_into(path + (key,), old[key], new[key], out)
+    elif old != new:
+        out.append((path, old, new))
+
+
+def diff_config(old, new):
+    """Diff estrutural entre dois configs: lista de (caminho, antes, depois).
+
+    Bancos e instrumentos são comparados pelo nome, então reordenar a lista
+    não gera mudança. Chave adicionada tem antes=None; removida, depois=None.
+    Ex.: (('banks', 'Live', 'instruments', 'Piano', 'preset'), 3, 4)"""
+    out = []
+    _diff_into((), old, new, out)
+    return out
+
+
 class Config:
     def __init__(self):
         self.data = {}
         self.midi_map = {}
         self.debug = True
+        self.file_active_bank = None
         self.load()
 
     def load(self):
         with open(CFG_FILE, 'r', encoding='utf-8') as f:
             self.data = yaml.safe_load(f) or {}
 
+        self.file_active_bank = self.data.get('active_bank')
         self.debug = bool(self.data.get('debug', False))
         self.data.setdefault('audio', {})
         self.data['audio'].setdefault('fluidsynth', {})
@@ -26,6 +64,20 @@ class Config:
             'actions': midi_config.get('actions', {})
         }
 
+    def reload(self):
+        """Relê o arquivo e devolve o diff contra o config anterior.
+
+        O banco escolhido em tempo de execução é mantido, a menos que o
+        active_bank do arquivo tenha mudado."""
+        old = dict(self.data, active_bank=self.file_active_bank)
+        runtime_bank = self.get_active_bank()
+        self.load()
+        changes = diff_config(old, self.data)
+        if (self.file_active_bank == old['active_bank']
+                and self.get_bank(runtime_bank) is not None):
+            self.data['active_bank'] = runtime_bank
+        return changes
+
     def get_active_bank(self):
         """Retorna o nome do banco ativo"""
         return self.data.get('active_bank', None)
@@ -60,8 +112,9 @@ class Config:
             return True
         return False
 
-    def next_bank(self):
-        """Avança para o próximo banco (cíclico)"""
+    def _step_bank(self, step, ready=None):
+        """Anda `step` posições na lista de bancos (cíclico).
+        Se `ready` for dado, pula bancos para os quais ready(nome) é falso."""
         banks = self.data.get('banks', [])
         if not banks:
             return None
@@ -71,29 +124,27 @@ class Config:
         
         try:
             current_idx = bank_names.index(active)
-            next_idx = (current_idx + 1) % len(bank_names)
         except ValueError:
-            next_idx = 0
-        
-        next_bank_name = bank_names[next_idx]
-        self.switch_bank(next_bank_name)
-        return next_bank_name
+            current_idx = None
+
+        if current_idx is None:
+            candidates = bank_names
+        else:
+            candidates = [
+                bank_names[(current_idx + step * k) % len(bank_names)]
+                for k in range(1, max(len(bank_names), 2))
+            ]
+
+        for bank_name in candidates:
+            if ready is None or ready(bank_name):
+                self.switch_bank(bank_name)
+                return bank_name
+        return None
+
+    def next_bank(self, ready=None):
+        """Avança para o próximo banco (cíclico)"""
+        return self._step_bank(1, ready)
 
-    def prev_bank(self):
+    def prev_bank(self, ready=None):
         """Volta para o banco anterior (cíclico)"""
-        banks = self.data.get('banks', [])
-        if not banks:
-            return None
-        
-        active = self.get_active_bank()
-        bank_names = [b.get('name') for b in banks]
-        
-        try:
-            current_idx = bank_names.index(active)
-            prev_idx = (current_idx - 1) % len(bank_names)
-        except ValueError:
-            prev_idx = 0
-        
-        prev_bank_name = bank_names[prev_idx]
-        self.switch_bank(prev_bank_name)
-        return prev_bank_name
+        return self._step_bank(-1, ready)
@@ -0,0 +1,142 @@
+import threading
+import time
+from .logs import get_logger
+
+log = get_logger('midi')
+
+
+class EventRing:
+    """Ring buffer pré-alocado de um produtor e um consumidor.
+
+    O produtor (thread do rtmidi de uma porta) só escreve no slot e avança
+    `head`; o consumidor só lê e avança `tail`. Cada índice tem um único
+    escritor, então não há lock. Quando cheio, a mensagem é descartada e
+    contada em `overflows`."""
+
+    def __init__(self, capacity=1024):
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.capacity = size
+        self._mask = size - 1
+        self._stamps = [0] * size
+        self._msgs = [None] * size
+        self.head = 0
+        self.tail = 0
+        self.pushed = 0
+        self.overflows = 0
+
+    def push(self, stamp, msg):
+        head = self.head
+        if head - self.tail >= self.capacity:
+            self.overflows += 1
+            return False
+        i = head & self._mask
+        self._stamps[i] = stamp
+        self._msgs[i] = msg
+        self.pushed += 1
+        self.head = head + 1
+        return True
+
+    def __len__(self):
+        return self.head - self.tail
+
+
+class MidiDispatcher:
+    """Thread única que consome as mensagens MIDI de todas as portas.
+
+    Os callbacks do rtmidi só carimbam (perf_counter_ns) e enfileiram a
+    mensagem crua no ring da porta. O consumidor drena em lotes, sempre
+    pegando a mensagem de carimbo mais antigo entre os rings, o que mantém
+    a ordem de chegada entre portas."""
+
+    def __init__(self, handler, ring_size=1024, batch_size=64):
+        self.handler = handler
+        self.ring_size = ring_size
+        self.batch_size = batch_size
+        self.rings = ()
+        self.batches = 0
+        self.max_batch = 0
+        self._idle = False
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def make_callback(self):
+        """Cria um ring para uma porta e devolve o callback do rtmidi."""
+        ring = EventRing(self.ring_size)
+        self.rings = self.rings + (ring,)
+        push = ring.push
+        stamp = time.perf_counter_ns
+        wake = self._wake
+
+        def callback(message, data=None):
+            if push(stamp(), message[0]) and self._idle:
+                wake.set()
+
+        return callback
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name='midi-dispatch', daemon=True
+        )
+        self._thread.start()
+        log.info('dispatch thread active')
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _drain(self):
+        rings = self.rings
+        handler = self.handler
+        n = 0
+        while n < self.batch_size:
+            best = None
+            best_stamp = 0
+            for ring in rings:
+                tail = ring.tail
+                if tail != ring.head:
+                    s = ring._stamps[tail & ring._mask]
+                    if best is None or s < best_stamp:
+                        best = ring
+                        best_stamp = s
+            if best is None:
+                break
+            i = best.tail & best._mask
+            msg = best._msgs[i]
+            best._msgs[i] = None
+            best.tail += 1
+            try:
+                handler(msg, best_stamp)
+            except Exception as e:
+                log.error('erro no dispatch: %s', e)
+            n += 1
+        return n
+
+    def _run(self):
+        while not self._stop.is_set():
+            n = self._drain()
+            if n:
+                self.batches += 1
+                if n > self.max_batch:
+                    self.max_batch = n
+                continue
+
+            # Marca ocioso e confere de novo antes de dormir, para não perder
+            # uma mensagem enfileirada entre o drain e o wait.
+            self._idle = True
+            if not any(len(r) for r in self.rings):
+                self._wake.wait()
+            self._wake.clear()
+            self._idle = False
+
+    def stats(self):
+        return {
+            'rings': len(self.rings),
+            'queued': sum(len(r) for r in self.rings),
+            'received': sum(r.pushed for r in self.rings),
+            'overflows': sum(r.overflows for r in self.rings),
+            'batches': self.batches,
+            'max_batch': self.max_batch,
+        }
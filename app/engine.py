@@ -0,0 +1,642 @@
+"""
+SynthModule num processo filho (engine.mode: process).
+
+O callback MIDI, o Flask, o watchdog e as chamadas ao fluidsynth dividem
+um interpretador e um GIL; uma requisição lenta ou um reload de YAML pode
+atrasar um note on. Neste modo o SynthModule roda num processo próprio:
+
+- eventos (notas, CCs, pedais, volume) vão por um ring de memória
+  compartilhada (ShmEventRing), um slot de 16 bytes por evento, sem
+  serialização; o filho só é acordado quando estava ocioso;
+- chamadas de controle (banco, preset, panic, reload, métricas) vão por um
+  Pipe, e o filho devolve junto um espelho do estado (instrumentos, versão,
+  vozes) que a UI e o MidiBridge leem sem sair do processo;
+- um supervisor reinicia o filho se ele cair, com o banco e os volumes de
+  antes; se o filho parar de dar sinal (heartbeat no ring e estado pelo
+  Pipe) por engine.heartbeat_timeout, ele é morto e reiniciado.
+
+RemoteSynth tem a parte da interface do SynthModule usada por MidiBridge,
+webui, live e Sequencer.
+"""
+
+import itertools
+import multiprocessing
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from . import config as config_mod
+from . import logs
+from .logs import get_logger
+from .metrics import registry
+from .sustain import KEYBOARD, SEQUENCER, SOURCES
+
+log = get_logger('engine')
+
+# Tipos de evento do ring
+EVENT = 0  # status, d1, d2 -> SynthModule.apply_event
+CC = 1  # canal, cc, valor -> send_cc (sem a lógica de pedal)
+SUSTAIN = 2  # valor, origem (índice em SOURCES) -> sustain.pedal
+SOSTENUTO = 3  # valor, origem -> sustain.sostenuto
+VOLUME = 4  # instrumento, valor, layout & 0xFF -> set_instrument_volume
+PROGRAM = 5  # canal, programa -> fs.program_change
+SEQ_EVENT = 6  # status, d1, d2 -> apply_event com a origem SEQUENCER
+
+# Slot de 16 bytes: carimbo (perf_counter_ns), sequência, tipo, a, b, c.
+# O pack do conteúdo zera a sequência; ela é gravada por último
+_SLOT = struct.Struct('<qIBBBB')
+_PAYLOAD = struct.Struct('<q4xBBBB')
+_SEQ = 2  # posição da sequência no slot, em unidades de 4 bytes
+_HEADER = 192  # head, tail, idle e heartbeat em linhas de cache separadas
+
+
+def _seq(index):
+    """Sequência esperada no slot do evento `index`; nunca é 0."""
+    return (index & 0x7FFFFFFF) | 0x80000000
+
+
+# Chaves dos instrumentos espelhadas no processo pai
+MIRROR_KEYS = (
+    'channel', 'volume', 'bank', 'preset', 'preset_name', 'sf', 'volume_cc',
+    'coalesce', 'use_sustain',
+)
+
+# Métodos do SynthModule que o processo pai pode chamar
+CALLS = frozenset((
+    'switch_bank', 'next_bank', 'prev_bank', 'panic', 'set_preset',
+    'list_presets',
+))
+
+
+class ShmEventRing:
+    """Ring de um consumidor em multiprocessing.shared_memory.
+
+    Produtores do mesmo processo serializam com um lock local; o consumidor
+    (outro processo) só avança `tail`. Cheio, o evento é descartado e
+    contado em `overflows`.
+
+    Python não tem barreira de memória explícita, então a ordem entre o
+    conteúdo do slot e `head` não é garantida em CPUs com ordenação fraca
+    (ARM). Cada slot leva a sequência do evento, gravada depois do
+    conteúdo; o consumidor só aceita o slot se a sequência bater antes e
+    depois de lê-lo e, se não bater, pára e tenta de novo na próxima
+    volta."""
+
+    # índices no header (em unidades de 8 bytes)
+    _HEAD, _TAIL, _IDLE, _BEAT = 0, 8, 16, 20
+
+    def __init__(self, capacity=4096, name=None):
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.capacity = size
+        self._mask = size - 1
+        create = name is None
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=create, size=_HEADER + size * _SLOT.size
+        )
+        self.name = self.shm.name
+        self._hdr = self.shm.buf[:_HEADER].cast('Q')
+        self._seqs = self.shm.buf[_HEADER:].cast('I')
+        self._buf = self.shm.buf
+        self.overflows = 0
+        self._lock = threading.Lock()
+        if create:
+            self.reset()
+
+    def reset(self):
+        """Esvazia o ring e apaga as sequências de um consumidor anterior."""
+        with self._lock:
+            self._hdr[self._HEAD] = 0
+            self._hdr[self._TAIL] = 0
+            self._hdr[self._IDLE] = 0
+            self._hdr[self._BEAT] = 0
+            self._buf[_HEADER:] = bytes(len(self._buf) - _HEADER)
+
+    def push(self, kind, a, b=0, c=0):
+        """Grava um evento; devolve True se o consumidor estava ocioso.
+
+        a, b e c são bytes (0-255); fora disso, ValueError."""
+        if not (0 <= a <= 255 and 0 <= b <= 255 and 0 <= c <= 255):
+            raise ValueError(f'evento {kind} fora da faixa: {a}, {b}, {c}')
+        with self._lock:
+            hdr = self._hdr
+            head = hdr[self._HEAD]
+            if head - hdr[self._TAIL] >= self.capacity:
+                self.overflows += 1
+                return False
+            slot = head & self._mask
+            _PAYLOAD.pack_into(self._buf, _HEADER + slot * _SLOT.size,
+                               time.perf_counter_ns(), kind, a, b, c)
+            self._seqs[slot * 4 + _SEQ] = _seq(head)
+            hdr[self._HEAD] = head + 1
+            return hdr[self._IDLE] == 1
+
+    def pop_all(self):
+        """Lê os eventos publicados (lado do consumidor), sem a sequência."""
+        hdr = self._hdr
+        seqs = self._seqs
+        tail = hdr[self._TAIL]
+        head = hdr[self._HEAD]
+        out = []
+        while tail != head:
+            slot = tail & self._mask
+            expected = _seq(tail)
+            if seqs[slot * 4 + _SEQ] != expected:
+                break
+            stamp, _, kind, a, b, c = _SLOT.unpack_from(
+                self._buf, _HEADER + slot * _SLOT.size
+            )
+            if seqs[slot * 4 + _SEQ] != expected:
+                break
+            out.append((stamp, kind, a, b, c))
+            tail += 1
+        hdr[self._TAIL] = tail
+        return out
+
+    def set_idle(self, idle):
+        self._hdr[self._IDLE] = 1 if idle else 0
+
+    def beat(self):
+        """Heartbeat do consumidor (o supervisor vê se ele anda)."""
+        self._hdr[self._BEAT] += 1
+
+    def heartbeat(self):
+        return self._hdr[self._BEAT]
+
+    def empty(self):
+        return self._hdr[self._HEAD] == self._hdr[self._TAIL]
+
+    def queued(self):
+        return self._hdr[self._HEAD] - self._hdr[self._TAIL]
+
+    def close(self, unlink=False):
+        self._hdr.release()
+        self._seqs.release()
+        self._buf = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+# ---------------------------------------------------------------------------
+# Processo filho
+# ---------------------------------------------------------------------------
+
+class _Layout:
+    """Numera as listas de instrumentos do synth; o evento VOLUME leva o
+    índice do instrumento e o número da lista que o pai conhecia."""
+
+    def __init__(self, synth):
+        self.synth = synth
+        self.number = 0
+        self.names = ()
+        self._lock = threading.Lock()
+
+    def current(self):
+        names = tuple(self.synth.instruments)
+        with self._lock:
+            if names != self.names:
+                self.names = names
+                self.number += 1
+            return self.number, self.names
+
+
+def _mirror(synth, layout, full=True):
+    state = {
+        'version': synth.state_version,
+        'bank': synth.cfg.get_active_bank(),
+        'voices': synth.fs.get_active_voice_count(),
+        'channel_notes': synth.channel_notes(),
+    }
+    if full:
+        state['layout'] = layout.current()[0]
+        state.update(
+            instruments={
+                name: {k: inst.get(k) for k in MIRROR_KEYS}
+                for name, inst in synth.instruments.items()
+            },
+            bank_states={
+                b.get('name'): synth.bank_state(b.get('name'))
+                for b in synth.cfg.data.get('banks', [])
+            },
+            voice_budget=synth.voices.status(),
+            soundfonts=synth.soundfonts.status(),
+            shards=synth.shard_status(),
+        )
+    return state
+
+
+def _engine_main(cfg_file, ring_name, capacity, conn, wake, restore):
+    """Ponto de entrada do processo filho."""
+    from .config import Config
+    from .synth import SynthModule
+
+    config_mod.CFG_FILE = cfg_file
+    cfg = Config()
+    logs.configure(cfg.data)
+    if restore.get('bank'):
+        cfg.switch_bank(restore['bank'])
+    synth = SynthModule(cfg)
+    for name, volume in restore.get('volumes', {}).items():
+        synth.set_instrument_volume(name, volume)
+
+    # As métricas do filho são anexadas às do pai (register_text); a família
+    # log_* já vem do pai e não pode aparecer duas vezes
+    registry.collectors.pop('log', None)
+
+    ring = ShmEventRing(capacity, name=ring_name)
+    layout = _Layout(synth)
+    send_lock = threading.Lock()
+
+    def send(msg):
+        with send_lock:
+            conn.send(msg)
+
+    latency = registry.histogram(
+        'engine_ring_latency',
+        'Do push no processo pai até o evento ser aplicado no filho'
+    )
+
+    def consume():
+        apply_event = synth.apply_event
+        send_cc = synth.send_cc
+        sustain = synth.sustain
+        while True:
+            ring.beat()
+            ring.set_idle(True)
+            wake.clear()
+            if ring.empty():
+                wake.wait(0.5)
+            ring.set_idle(False)
+            for stamp, kind, a, b, c in ring.pop_all():
+                try:
+                    if kind == EVENT:
+                        apply_event(a, b, c)
+                    elif kind == SEQ_EVENT:
+                        apply_event(a, b, c, SEQUENCER)
+                    elif kind == CC:
+                        send_cc(a, b, c)
+                    elif kind == SUSTAIN:
+                        sustain.pedal(a, SOURCES[b])
+                    elif kind == SOSTENUTO:
+                        sustain.sostenuto(a, SOURCES[b])
+                    elif kind == VOLUME:
+                        # Índice na lista de instrumentos que o pai tinha;
+                        # se a lista mudou no caminho, o evento não vale
+                        number, names = layout.current()
+                        if c == number & 0xFF and a < len(names):
+                            synth.set_instrument_volume(names[a], b)
+                    elif kind == PROGRAM:
+                        synth.fs.program_change(a, b)
+                except Exception as e:
+                    log.error('erro aplicando evento %d: %s', kind, e)
+                latency.observe((time.perf_counter_ns() - stamp) // 1000)
+
+    def publish():
+        version = None
+        next_full = 0.0
+        while True:
+            time.sleep(0.05)
+            now = time.monotonic()
+            full = synth.state_version != version
+            if full or now >= next_full:
+                version = synth.state_version
+                next_full = now + 1.0
+                try:
+                    send(('state', _mirror(synth, layout, full)))
+                except (OSError, EOFError):
+                    return
+
+    def reload_config():
+        previous_bank = cfg.get_active_bank()
+        changes = cfg.reload()
+        logs.configure(cfg.data)
+        if not changes:
+            return False
+        return synth.apply_config_changes(changes, previous_bank)
+
+    threading.Thread(target=consume, name='engine-ring', daemon=True).start()
+    send(('state', _mirror(synth, layout)))
+    send(('ready',))
+    threading.Thread(target=publish, name='engine-state', daemon=True).start()
+
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            break
+        _, call_id, method, args = msg
+        try:
+            if method == 'reload_config':
+                result = reload_config()
+            elif method == 'metrics':
+                result = registry.render()
+            elif method in CALLS:
+                result = getattr(synth, method)(*args)
+            else:
+                raise ValueError(f'chamada desconhecida: {method}')
+            error = None
+        except Exception as e:
+            result, error = None, f'{type(e).__name__}: {e}'
+        # O estado vai antes do resultado: quem chamou já vê o banco novo
+        send(('state', _mirror(synth, layout)))
+        send(('result', call_id, result, error))
+    ring.close()
+
+
+# ---------------------------------------------------------------------------
+# Processo pai
+# ---------------------------------------------------------------------------
+
+class _StatusView:
+    def __init__(self, remote, key):
+        self._remote = remote
+        self._key = key
+
+    def status(self):
+        return self._remote.mirror.get(self._key) or {}
+
+
+class _RemoteSustain:
+    def __init__(self, remote):
+        self._push = remote._push
+
+    def pedal(self, value, source=KEYBOARD):
+        self._push(SUSTAIN, value, SOURCES.index(source))
+
+    def sostenuto(self, value, source=KEYBOARD):
+        self._push(SOSTENUTO, value, SOURCES.index(source))
+
+
+class _RemoteFluidSynth:
+    def __init__(self, remote):
+        self._remote = remote
+
+    def program_change(self, channel, program):
+        self._remote._push(PROGRAM, channel, program)
+
+    def get_active_voice_count(self):
+        return self._remote.mirror.get('voices', 0)
+
+
+class RemoteSynth:
+    def __init__(self, cfg, ring_size=4096, restart_delay=1.0,
+                 start_timeout=120.0, heartbeat_timeout=5.0):
+        self.cfg = cfg
+        self.restart_delay = restart_delay
+        self.start_timeout = start_timeout
+        self.heartbeat_timeout = heartbeat_timeout
+        self.mirror = {
+            'version': 0, 'layout': 0, 'instruments': {}, 'bank_states': {},
+            'channel_notes': {},
+        }
+        self._index = {}  # nome -> posição na lista de instrumentos do filho
+        self.restarts = 0
+        self.hangs = 0
+        self.dropped = 0
+        self.up = False
+        self.ring = ShmEventRing(ring_size)
+        self.sustain = _RemoteSustain(self)
+        self.fs = _RemoteFluidSynth(self)
+        self.voices = _StatusView(self, 'voice_budget')
+        self.soundfonts = _StatusView(self, 'soundfonts')
+        self._ctx = multiprocessing.get_context('spawn')
+        self._wake = self._ctx.Event()
+        self._conn = None
+        self._proc = None
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._send_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._closing = False
+        registry.register('engine', self._collect_metrics)
+        registry.register_text(
+            'engine',
+            lambda: self.call('metrics', timeout=2.0) if self.up else ''
+        )
+
+    # ---------------- ciclo de vida -----------------
+    def start(self):
+        threading.Thread(
+            target=self._supervise, name='engine-supervisor', daemon=True
+        ).start()
+        if not self._ready.wait(self.start_timeout):
+            raise RuntimeError('engine não ficou pronto')
+
+    def close(self):
+        self._closing = True
+        if self._proc is not None:
+            self._proc.terminate()
+            self._proc.join(2)
+        self.ring.close(unlink=True)
+
+    def _spawn(self):
+        parent, child = self._ctx.Pipe()
+        restore = {
+            'bank': self.cfg.get_active_bank(),
+            'volumes': {
+                n: i['volume']
+                for n, i in self.mirror.get('instruments', {}).items()
+            },
+        }
+        self.ring.reset()
+        proc = self._ctx.Process(
+            target=_engine_main, name='synth-engine', daemon=True,
+            args=(config_mod.CFG_FILE, self.ring.name, self.ring.capacity,
+                  child, self._wake, restore),
+        )
+        proc.start()
+        child.close()
+        self._conn, self._proc = parent, proc
+        log.info('engine iniciado (pid %d)', proc.pid)
+
+    def _supervise(self):
+        delay = self.restart_delay
+        while not self._closing:
+            started = time.monotonic()
+            self._spawn()
+            self._read_loop()
+            self.up = False
+            self._fail_pending('engine caiu')
+            if self._closing:
+                return
+            self._proc.join(1)
+            if time.monotonic() - started > 60:
+                delay = self.restart_delay
+            log.error('engine saiu (código %s), reiniciando em %.1f s',
+                      self._proc.exitcode, delay)
+            self.restarts += 1
+            time.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    def _read_loop(self):
+        conn = self._conn
+        beat = self.ring.heartbeat()
+        last_beat = last_msg = time.monotonic()
+        while True:
+            try:
+                ready = conn.poll(1.0)
+                msg = conn.recv() if ready else None
+            except (EOFError, OSError):
+                return
+            now = time.monotonic()
+            if self.ring.heartbeat() != beat:
+                beat = self.ring.heartbeat()
+                last_beat = now
+            if msg is None:
+                # O filho publica o estado a cada 1 s e o consumidor do ring
+                # acorda a cada 0,5 s; parado além do limite, está travado
+                stalled = now - min(last_beat, last_msg)
+                if self.up and stalled > self.heartbeat_timeout:
+                    log.error('engine travado há %.1f s, matando pid %d',
+                              stalled, self._proc.pid)
+                    self.hangs += 1
+                    self._proc.kill()
+                    return
+                continue
+            last_msg = now
+            kind = msg[0]
+            if kind == 'state':
+                self._apply_state(msg[1])
+            elif kind == 'result':
+                _, call_id, result, error = msg
+                slot = self._pending.pop(call_id, None)
+                if slot is not None:
+                    slot[1], slot[2] = result, error
+                    slot[0].set()
+            elif kind == 'ready':
+                self.up = True
+                self._ready.set()
+                log.info('engine pronto')
+
+    def _apply_state(self, state):
+        mirror = dict(self.mirror)
+        mirror.update(state)
+        if 'instruments' in state:
+            self._index = {
+                name: i for i, name in enumerate(state['instruments'])
+            }
+        self.mirror = mirror
+        bank = state.get('bank')
+        if bank and bank != self.cfg.get_active_bank():
+            self.cfg.switch_bank(bank)
+
+    def _fail_pending(self, error):
+        pending, self._pending = self._pending, {}
+        for slot in pending.values():
+            slot[2] = error
+            slot[0].set()
+
+    # ---------------- controle -----------------
+    def call(self, method, *args, timeout=10.0):
+        if not self.up:
+            raise RuntimeError('engine indisponível')
+        call_id = next(self._ids)
+        slot = self._pending[call_id] = [threading.Event(), None, None]
+        try:
+            with self._send_lock:
+                self._conn.send(('call', call_id, method, args))
+        except (OSError, EOFError) as e:
+            self._pending.pop(call_id, None)
+            raise RuntimeError(f'engine indisponível: {e}')
+        if not slot[0].wait(timeout):
+            self._pending.pop(call_id, None)
+            raise TimeoutError(f'engine não respondeu a {method}')
+        if slot[2]:
+            raise RuntimeError(slot[2])
+        return slot[1]
+
+    def switch_bank(self, bank_name):
+        return self.call('switch_bank', bank_name)
+
+    def next_bank(self):
+        return self.call('next_bank')
+
+    def prev_bank(self):
+        return self.call('prev_bank')
+
+    def panic(self):
+        return self.call('panic')
+
+    def set_preset(self, name, preset_number):
+        return self.call('set_preset', name, preset_number)
+
+    def list_presets(self, name):
+        return self.call('list_presets', name)
+
+    def apply_config_changes(self, changes, previous_bank):
+        """O filho relê o próprio config e aplica o diff dele."""
+        return self.call('reload_config', timeout=60.0)
+
+    # ---------------- eventos -----------------
+    def _push(self, kind, a, b=0, c=0):
+        if not self.up:
+            self.dropped += 1
+            return
+        if self.ring.push(kind, a, b, c):
+            self._wake.set()
+
+    def note_on(self, channel, note, vel):
+        self._push(EVENT, 0x90 | channel, note, vel)
+
+    def note_off(self, channel, note):
+        self._push(EVENT, 0x80 | channel, note, 0)
+
+    def apply_event(self, status, d1, d2, source=KEYBOARD):
+        # Notas e pedais com o rastreamento de outra origem (sequenciador)
+        kind = EVENT if source == KEYBOARD else SEQ_EVENT
+        self._push(kind, status, d1, d2)
+
+    def send_cc(self, channel, ccnum, value):
+        self._push(CC, channel, ccnum, value)
+
+    def set_instrument_volume(self, name, value):
+        index = self._index.get(name)
+        if index is None:
+            return
+        value = max(0, min(127, int(value)))
+        self.mirror['instruments'][name]['volume'] = value
+        self._push(VOLUME, index, value, self.mirror['layout'] & 0xFF)
+
+    # ---------------- espelho -----------------
+    @property
+    def instruments(self):
+        return self.mirror['instruments']
+
+    @property
+    def state_version(self):
+        return self.mirror['version']
+
+    def bank_state(self, bank_name):
+        return self.mirror['bank_states'].get(bank_name, 'pending')
+
+    def bank_ready(self, bank_name):
+        return self.bank_state(bank_name) == 'ready'
+
+    def channel_notes(self):
+        return self.mirror['channel_notes']
+
+    def shard_status(self):
+        return self.mirror.get('shards', [])
+
+    def _collect_metrics(self):
+        return [
+            ('engine_up', 'gauge',
+             'Processo do synth respondendo (1) ou não (0)',
+             [({}, int(self.up))]),
+            ('engine_restarts_total', 'counter',
+             'Reinícios do processo do synth', [({}, self.restarts)]),
+            ('engine_hangs_total', 'counter',
+             'Processos do synth mortos por falta de heartbeat',
+             [({}, self.hangs)]),
+            ('engine_ring_queued', 'gauge',
+             'Eventos aguardando o processo do synth',
+             [({}, self.ring.queued())]),
+            ('engine_ring_overflows_total', 'counter',
+             'Eventos descartados por ring cheio',
+             [({}, self.ring.overflows)]),
+            ('engine_dropped_total', 'counter',
+             'Eventos descartados com o processo do synth fora',
+             [({}, self.dropped)]),
+        ]
@@ -0,0 +1,258 @@
+"""
+Estado do mixer ao vivo para a UI web (Server-Sent Events).
+
+Uma única thread publicadora acorda `fps` vezes por segundo, compara
+synth.state_version com a última versão publicada e, se mudou, monta um
+snapshot (banco ativo, volumes, presets) e o diff contra o anterior. As
+métricas (vozes, bancos prontos) entram a cada `metrics_interval`. O diff é
+serializado uma vez e entregue a todos os clientes; a thread MIDI só
+incrementa o contador de versão.
+
+O transporte do sequenciador (e a gravação) entra do mesmo jeito: cada um
+tem seu `version`, comparado junto com o do synth; a posição da música e o
+tempo de gravação andam com as métricas.
+
+Cada cliente tem uma fila limitada. Se um tablet não acompanha, a fila é
+descartada e ele recebe um snapshot completo no lugar dos diffs perdidos.
+stop() encerra os geradores abertos, devolvendo os workers HTTP que eles
+ocupavam (senão o processo não sai com um cliente conectado).
+"""
+
+import json
+import queue
+import threading
+import time
+from .logs import get_logger
+
+log = get_logger('http')
+
+CLIENT_QUEUE = 32
+_CLOSE = object()  # na fila de um cliente: encerra o gerador
+
+
+def _diff(old, new):
+    """Diff recursivo de dicts: chaves novas/alteradas e removidas (None)."""
+    out = {}
+    for key, value in new.items():
+        prev = old.get(key)
+        if isinstance(value, dict) and isinstance(prev, dict):
+            sub = _diff(prev, value)
+            if sub:
+                out[key] = sub
+        elif value != prev or key not in old:
+            out[key] = value
+    for key in old:
+        if key not in new:
+            out[key] = None
+    return out
+
+
+def _sse(event, payload, event_id=None):
+    data = json.dumps(payload, separators=(',', ':'), ensure_ascii=False)
+    head = f'id: {event_id}\n' if event_id is not None else ''
+    return f'{head}event: {event}\ndata: {data}\n\n'
+
+
+class StateStream:
+    def __init__(self, synth, fps=10, metrics_interval=1.0, keepalive=15.0,
+                 sequencer=None, recorder=None):
+        self.synth = synth
+        self.sequencer = sequencer
+        self.recorder = recorder
+        self.period = 1.0 / max(fps, 1)
+        self.metrics_interval = metrics_interval
+        self.keepalive = keepalive
+        self.frames = 0
+        self.resyncs = 0
+        self._snapshot = {}
+        self._seq = 0
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._has_clients = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---------------- snapshot -----------------
+    def mixer_state(self):
+        instruments = self.synth.instruments
+        return {
+            'bank': self.synth.cfg.get_active_bank(),
+            'instruments': {
+                name: {
+                    'channel': inst['channel'],
+                    'volume': inst['volume'],
+                    'preset': inst['preset'],
+                    'preset_name': inst['preset_name'],
+                    'file': inst['sf'],
+                }
+                for name, inst in instruments.items()
+            },
+        }
+
+    def _transport_state(self):
+        out = {}
+        if self.sequencer is not None:
+            st = self.sequencer.status()
+            out['sequencer'] = {
+                'state': st['state'], 'file': st['file'],
+                'length': st['length'],
+            }
+        if self.recorder is not None:
+            st = self.recorder.status()
+            out['recorder'] = {
+                'recording': st['recording'], 'file': st['file'],
+            }
+        return out
+
+    def _metrics_state(self):
+        synth = self.synth
+        out = {
+            'voices': synth.fs.get_active_voice_count(),
+            'notes': {str(ch): counts
+                      for ch, counts in synth.channel_notes().items()},
+            'budget': synth.voices.status(),
+            'banks': {
+                b.get('name'): synth.bank_state(b.get('name'))
+                for b in synth.cfg.data.get('banks', [])
+            },
+        }
+        if self.sequencer is not None:
+            position = self.sequencer.status()['position']
+            out['sequencer'] = {'position': position}
+        if self.recorder is not None:
+            st = self.recorder.status()
+            out['recorder'] = {
+                'seconds': st['seconds'], 'events': st['events'],
+            }
+        return out
+
+    def _version(self):
+        seq, rec = self.sequencer, self.recorder
+        return (
+            self.synth.state_version,
+            seq.version if seq is not None else 0,
+            rec.version if rec is not None else 0,
+        )
+
+    def snapshot(self):
+        with self._lock:
+            return self._seq, dict(self._snapshot)
+
+    # ---------------- clientes -----------------
+    def subscribe(self):
+        q = queue.Queue(CLIENT_QUEUE)
+        with self._lock:
+            self._clients.add(q)
+            self._has_clients.set()
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._clients.discard(q)
+            if not self._clients:
+                self._has_clients.clear()
+
+    def events(self):
+        """Gerador SSE para um cliente: snapshot inicial e depois diffs."""
+        # Sem clientes a thread não publica: atualiza antes de assinar e
+        # tirar o snapshot (diffs que chegarem no meio são idempotentes)
+        if self._stop.is_set():
+            return
+        self._publish(with_metrics=True)
+        q = self.subscribe()
+        try:
+            seq, snap = self.snapshot()
+            yield _sse('snapshot', snap, seq)
+            while True:
+                try:
+                    msg = q.get(timeout=self.keepalive)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if msg is _CLOSE:
+                    return
+                if msg is None:
+                    # A fila transbordou: recomeça do estado completo
+                    seq, snap = self.snapshot()
+                    msg = _sse('snapshot', snap, seq)
+                yield msg
+        finally:
+            self.unsubscribe(q)
+
+    def _broadcast(self, msg):
+        with self._lock:
+            clients = list(self._clients)
+        for q in clients:
+            try:
+                q.put_nowait(msg)
+            except queue.Full:
+                self.resyncs += 1
+                with q.mutex:
+                    q.queue.clear()
+                q.put_nowait(None)
+
+    # ---------------- publicação -----------------
+    def _publish(self, force=False, with_metrics=False):
+        with self._publish_lock:
+            new = dict(self._snapshot)
+            new.update(self.mixer_state())
+            new.update(self._transport_state())
+            if with_metrics or 'metrics' not in new:
+                new['metrics'] = self._metrics_state()
+            diff = _diff(self._snapshot, new)
+            if not diff and not force:
+                return
+            with self._lock:
+                self._snapshot = new
+                self._seq += 1
+                seq = self._seq
+            if diff:
+                self.frames += 1
+                self._broadcast(_sse('diff', diff, seq))
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name='ui-state', daemon=True
+        )
+        self._thread.start()
+        log.info('estado ao vivo a %.0f fps', 1.0 / self.period)
+
+    def stop(self):
+        """Para a publicação e encerra os clientes conectados."""
+        self._stop.set()
+        self._has_clients.set()
+        with self._lock:
+            clients = list(self._clients)
+        for q in clients:
+            with q.mutex:
+                q.queue.clear()
+            try:
+                q.put_nowait(_CLOSE)
+            except queue.Full:
+                pass
+
+    def _run(self):
+        version = None
+        next_metrics = 0.0
+        while not self._stop.is_set():
+            if not self._has_clients.wait(1.0):
+                continue
+            now = time.monotonic()
+            with_metrics = now >= next_metrics
+            current = self._version()
+            if current != version or with_metrics:
+                version = current
+                if with_metrics:
+                    next_metrics = now + self.metrics_interval
+                try:
+                    self._publish(with_metrics=with_metrics)
+                except Exception as e:
+                    log.error('erro publicando estado: %s', e)
+            self._stop.wait(self.period)
+
+    def stats(self):
+        with self._lock:
+            clients = len(self._clients)
+        return {'clients': clients, 'frames': self.frames,
+                'resyncs': self.resyncs}
@@ -0,0 +1,255 @@
+"""
+Log estruturado com formatação preguiçosa e escrita assíncrona.
+
+Cada subsistema tem um Logger com nível próprio, alterável em tempo de
+execução (set_level). Chamadas abaixo do nível custam uma comparação; as
+demais só empilham (hora, subsistema, nível, formato, args) num ring
+pré-alocado. A formatação (`msg % args`) e a escrita no stdout/journald
+acontecem na thread escritora, então o callback MIDI nunca bloqueia em I/O.
+
+Uso:
+    log = get_logger('synth')
+    log.info('loading soundfont: %s', path)
+"""
+
+import atexit
+import os
+import sys
+import threading
+import time
+from .metrics import registry
+
+DEBUG = 10
+INFO = 20
+WARN = 30
+ERROR = 40
+OFF = 100
+
+LEVEL_NAMES = {
+    'debug': DEBUG, 'info': INFO, 'warn': WARN, 'error': ERROR, 'off': OFF,
+}
+_NAMES_BY_LEVEL = {v: k for k, v in LEVEL_NAMES.items()}
+
+
+def parse_level(level):
+    if isinstance(level, int):
+        return level
+    try:
+        return LEVEL_NAMES[str(level).lower()]
+    except KeyError:
+        raise ValueError(f'nível de log inválido: {level}')
+
+
+class LogSink:
+    """Ring buffer pré-alocado drenado por uma thread escritora.
+
+    Produtores seguram o lock só para gravar o slot; se o ring estiver cheio
+    o registro é descartado e contado em `overflows`."""
+
+    def __init__(self, capacity=4096, stream=None):
+        self.capacity = capacity
+        self.stream = stream
+        self.overflows = 0
+        self._reported = 0
+        self._slots = [None] * capacity
+        self._head = 0
+        self._tail = 0
+        self._lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        # avisos (warn e acima) guardados entre start/stop_capture
+        self.captured = None
+
+    def emit(self, name, level, msg, args):
+        record = (time.time(), name, level, msg, args)
+        with self._lock:
+            head = self._head
+            if head - self._tail >= self.capacity:
+                self.overflows += 1
+                return
+            self._slots[head % self.capacity] = record
+            self._head = head + 1
+        if self._thread is None:
+            self._start()
+        self._wake.set()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name='log-writer', daemon=True
+            )
+            self._thread.start()
+
+    def _format(self, record):
+        stamp, name, level, msg, args = record
+        if args:
+            try:
+                msg = msg % args
+            except (TypeError, ValueError):
+                msg = f'{msg} {args!r}'
+        ts = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stamp))
+        tag = ''
+        if level != INFO:
+            tag = f'[{_NAMES_BY_LEVEL.get(level, level)}] '
+        return f'[{ts}] [{name}] {tag}{msg}\n'
+
+    def after_fork(self):
+        """No filho de um fork: a thread escritora não existe mais e os
+        registros herdados são do pai, que ainda vai escrevê-los."""
+        self._lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._tail = self._head
+        self._reported = self.overflows
+        for i in range(self.capacity):
+            self._slots[i] = None
+
+    def drain(self):
+        with self._drain_lock:
+            self._drain()
+
+    def _drain(self):
+        stream = self.stream or sys.stdout
+        captured = self.captured
+        out = []
+        while self._tail != self._head:
+            i = self._tail % self.capacity
+            record = self._slots[i]
+            self._slots[i] = None
+            self._tail += 1
+            line = self._format(record)
+            out.append(line)
+            if captured is not None and record[2] >= WARN:
+                captured.append(line.strip())
+        dropped = self.overflows - self._reported
+        if dropped:
+            out.append(f'[log] {dropped} registros descartados (ring cheio)\n')
+            self._reported += dropped
+        if out:
+            try:
+                stream.write(''.join(out))
+                stream.flush()
+            except (OSError, ValueError):
+                pass
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            self.drain()
+
+
+class Logger:
+    __slots__ = ('name', 'level')
+
+    def __init__(self, name, level=INFO):
+        self.name = name
+        self.level = level
+
+    def enabled(self, level):
+        return self.level <= level
+
+    def debug(self, msg, *args):
+        if self.level <= DEBUG:
+            _sink.emit(self.name, DEBUG, msg, args)
+
+    def info(self, msg, *args):
+        if self.level <= INFO:
+            _sink.emit(self.name, INFO, msg, args)
+
+    def warn(self, msg, *args):
+        if self.level <= WARN:
+            _sink.emit(self.name, WARN, msg, args)
+
+    def error(self, msg, *args):
+        if self.level <= ERROR:
+            _sink.emit(self.name, ERROR, msg, args)
+
+
+_sink = LogSink()
+_loggers = {}
+_default_level = INFO
+
+
+def get_logger(name):
+    logger = _loggers.get(name)
+    if logger is None:
+        logger = _loggers[name] = Logger(name, _default_level)
+    return logger
+
+
+def set_level(name, level):
+    """Muda o nível de um subsistema; '*' muda o padrão e todos os outros."""
+    global _default_level
+    level = parse_level(level)
+    if name == '*':
+        _default_level = level
+        for logger in _loggers.values():
+            logger.level = level
+    else:
+        get_logger(name).level = level
+
+
+def levels():
+    out = {
+        name: _NAMES_BY_LEVEL.get(lg.level, lg.level)
+        for name, lg in sorted(_loggers.items())
+    }
+    out['*'] = _NAMES_BY_LEVEL.get(_default_level, _default_level)
+    return out
+
+
+def configure(cfg_data):
+    """Aplica a seção `logging` do config (e o `debug` legado)."""
+    log_cfg = cfg_data.get('logging', {})
+    legacy = 'debug' if cfg_data.get('debug', False) else 'info'
+    default = log_cfg.get('level', legacy)
+    set_level('*', default)
+    for name, level in (log_cfg.get('levels') or {}).items():
+        set_level(name, level)
+
+
+def flush():
+    """Escreve agora o que estiver no ring (processos que saem sem atexit,
+    como os workers de um ProcessPoolExecutor)."""
+    _sink.drain()
+
+
+def start_capture():
+    """Passa a guardar os avisos (warn e acima) além de escrevê-los."""
+    _sink.drain()
+    _sink.captured = []
+
+
+def stop_capture():
+    """Escreve o que falta e devolve os avisos desde start_capture()."""
+    _sink.drain()
+    captured, _sink.captured = _sink.captured or [], None
+    return captured
+
+
+def stats():
+    return {'overflows': _sink.overflows, 'queued': _sink._head - _sink._tail}
+
+
+def _collect_metrics():
+    st = stats()
+    return [
+        ('log_queued', 'gauge',
+         'Registros de log aguardando a thread escritora',
+         [({}, st['queued'])]),
+        ('log_dropped_total', 'counter',
+         'Registros descartados por ring cheio',
+         [({}, st['overflows'])]),
+    ]
+
+
+registry.register('log', _collect_metrics)
+
+
+atexit.register(_sink.drain)
+os.register_at_fork(after_in_child=_sink.after_fork)
@@ -1,67 +1,161 @@
+import os
 import threading
+from . import config as config_mod
 from .config import Config
-from .utils import log, GLOBAL_DEBUG
+from . import logs
 from .synth import SynthModule
+from .engine import RemoteSynth
 from .midi import MidiBridge
+from .sequencer import Sequencer
+from .recorder import MidiRecorder
 from .webui import create_app
+from .server import serve, stop as stop_http
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+log = logs.get_logger('reload')
+
+
+# Partes do config que só valem depois de reiniciar o processo
+RESTART_KEYS = (
+    ('audio',), ('http',), ('preset_index',), ('soundfonts',),
+    ('midi', 'dispatch'), ('midi', 'coalesce'), ('midi', 'input_port'),
+    ('sequencer',), ('recorder',), ('engine',),
+)
+# Partes do config que mudam a tabela de CC do MidiBridge
+CC_KEYS = (('midi', 'cc_map'), ('midi', 'actions'))
+
+
+def _format_change(path, old, new):
+    where = '.'.join(str(p) for p in path)
+    if old is None:
+        return f'+ {where} = {new!r}'
+    if new is None:
+        return f'- {where}'
+    return f'~ {where}: {old!r} -> {new!r}'
+
+
+_reload_lock = threading.Lock()
+
 
 def reload_configs(cfg, synth, midi):
+    with _reload_lock:
+        _reload_configs(cfg, synth, midi)
+
+
+def _reload_configs(cfg, synth, midi):
     try:
-        cfg.load()
-        synth.reload(cfg.data)
-        midi.cc_map = cfg.midi_map.get('cc', {})
-        midi.actions = cfg.midi_map.get('actions', {})
-        midi.rebuild_lookups()
-        log('[reload] configs reloaded from config.yaml')
+        previous_bank = cfg.get_active_bank()
+        changes = cfg.reload()
+        if not changes:
+            log.info('config unchanged')
+            return
+        for change in changes:
+            log.info('%s', _format_change(*change))
+
+        logs.configure(cfg.data)
+        cc_changed = synth.apply_config_changes(changes, previous_bank)
+        if cc_changed or any(path[:2] in CC_KEYS for path, _, _ in changes):
+            midi.cc_map = cfg.midi_map.get('cc', {})
+            midi.actions = cfg.midi_map.get('actions', {})
+            midi.rebuild_lookups()
+            log.info('CC bindings recompiled')
+
+        restart = sorted({
+            '.'.join(prefix) for path, _, _ in changes
+            for prefix in RESTART_KEYS if path[:len(prefix)] == prefix
+        })
+        if restart:
+            log.warn('restart required to apply: %s', ', '.join(restart))
+        log.info('%d changes applied from %s',
+                 len(changes), config_mod.CFG_FILE)
     except Exception as e:
-        log(f'[reload] error: {e}')
+        log.error('error: %s', e)
 
 
 class ConfigWatcher(FileSystemEventHandler):
-    def __init__(self, callback):
+    """Chama `callback` quando o arquivo de config muda, agrupando a rajada
+    de eventos de um único save (editores gravam, renomeiam, tocam o
+    arquivo) em uma chamada depois de `delay` segundos de silêncio."""
+
+    def __init__(self, path, callback, delay=0.5):
+        self.path = os.path.abspath(path)
         self.callback = callback
+        self.delay = delay
+        self._timer = None
+        self._lock = threading.Lock()
 
-    def on_modified(self, event):
-        self.callback()
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        if event.event_type not in ('modified', 'created', 'moved'):
+            return
+        paths = (event.src_path, getattr(event, 'dest_path', ''))
+        if self.path not in (os.path.abspath(p) for p in paths if p):
+            return
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, self.callback)
+            self._timer.daemon = True
+            self._timer.start()
 
 
 def run():
     cfg = Config()
-    from . import utils
-    utils.GLOBAL_DEBUG = cfg.debug
+    logs.configure(cfg.data)
 
-    synth = SynthModule(cfg)
-    midi = MidiBridge(cfg, synth)
+    engine_cfg = cfg.data.get('engine', {})
+    if engine_cfg.get('mode', 'inline') == 'process':
+        synth = RemoteSynth(
+            cfg,
+            int(engine_cfg.get('ring_size', 4096)),
+            engine_cfg.get('restart_delay', 1.0),
+            heartbeat_timeout=engine_cfg.get('heartbeat_timeout', 5.0),
+        )
+        synth.start()
+    else:
+        synth = SynthModule(cfg)
+    seq_cfg = cfg.data.get('sequencer', {})
+    sequencer = Sequencer(
+        synth,
+        seq_cfg.get('dir', 'backing'),
+        seq_cfg.get('lookahead_ms', 2) / 1000,
+        seq_cfg.get('resync_ms', 50) / 1000,
+    )
+    rec_cfg = cfg.data.get('recorder', {})
+    recorder = MidiRecorder(
+        rec_cfg.get('dir', 'recordings'),
+        int(rec_cfg.get('buffer', 65536)),
+        rec_cfg.get('flush_interval', 0.5),
+    )
+    midi = MidiBridge(cfg, synth, sequencer, recorder)
 
     if cfg.data.get('auto_reload', True):
-        watcher = ConfigWatcher(lambda: reload_configs(cfg, synth, midi))
+        watcher = ConfigWatcher(
+            config_mod.CFG_FILE,
+            lambda: reload_configs(cfg, synth, midi),
+            cfg.data.get('auto_reload_delay', 0.5),
+        )
         obs = Observer()
-        obs.schedule(watcher, '.', recursive=False)
+        obs.schedule(watcher, os.path.dirname(watcher.path), recursive=False)
         obs.start()
 
     http_cfg = cfg.data.get('http', {})
+    app = None
     if http_cfg.get('enabled', False):
-        app = create_app(synth)
-        t = threading.Thread(
-            target=app.run,
-            kwargs={
-                'host': http_cfg.get('host', '0.0.0.0'),
-                'port': http_cfg.get('port', 5000),
-                'debug': False,
-                'use_reloader': False,
-            },
-            daemon=True
-        )
-        t.start()
-        log('[http] UI running')
+        app = create_app(synth, sequencer, recorder)
+        serve(app, http_cfg)
 
     try:
         midi.process()
     except KeyboardInterrupt:
-        log('Exiting...')
+        logs.get_logger('app').info('Exiting...')
+    finally:
+        if app is not None:
+            stop_http(app)
+        if isinstance(synth, RemoteSynth):
+            synth.close()
 
 
 if __name__ == "__main__":
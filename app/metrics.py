@@ -0,0 +1,132 @@
+"""
+Métricas de baixo custo expostas em formato texto do Prometheus.
+
+Histogramas têm buckets fixos em microssegundos (inteiros), então observar
+um valor custa um bisect e dois incrementos. Estatísticas que já existem em
+outros objetos (pool de soundfonts, dispatcher MIDI, ...) entram por
+collectors chamados só na hora do scrape.
+"""
+
+import bisect
+import threading
+
+# Limites superiores dos buckets de latência, em microssegundos
+LATENCY_BUCKETS_US = (
+    10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000,
+    250000,
+)
+
+
+class Histogram:
+    def __init__(self, bounds=LATENCY_BUCKETS_US):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Estimativa pelo limite superior do bucket (limitada ao máximo)."""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= rank:
+                if i < len(self.bounds):
+                    return min(self.bounds[i], self.max)
+                return self.max
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'p50_us': self.quantile(0.5),
+            'p99_us': self.quantile(0.99),
+            'max_us': self.max,
+        }
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    inner = ','.join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    return '{' + inner + '}'
+
+
+class Registry:
+    """Histogramas de latência (em µs) e collectors; o render sai em s."""
+
+    def __init__(self):
+        self.histograms = {}  # nome -> (help, {labels: Histogram})
+        self.collectors = {}  # chave -> fn
+        self.texts = {}  # chave -> fn que devolve texto pronto
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help_text, **labels):
+        with self._lock:
+            family = self.histograms.setdefault(name, (help_text, {}))[1]
+            key = tuple(sorted(labels.items()))
+            hist = family.get(key)
+            if hist is None:
+                hist = family[key] = Histogram()
+            return hist
+
+    def register(self, key, fn):
+        """fn() devolve [(nome, tipo, help, [(labels, valor), ...]), ...].
+        Registrar de novo com a mesma chave substitui o collector."""
+        self.collectors[key] = fn
+
+    def register_text(self, key, fn):
+        """fn() devolve texto já no formato do Prometheus (ex.: as métricas
+        de outro processo); exceções deixam o texto de fora."""
+        self.texts[key] = fn
+
+    def render(self):
+        lines = []
+        for name, (help_text, family) in sorted(self.histograms.items()):
+            lines.append(f'# HELP {name}_seconds {help_text}')
+            lines.append(f'# TYPE {name}_seconds histogram')
+            for key, hist in family.items():
+                labels = dict(key)
+                acc = 0
+                for bound, c in zip(hist.bounds, hist.counts):
+                    acc += c
+                    le = _labels(dict(labels, le=bound / 1e6))
+                    lines.append(f'{name}_seconds_bucket{le} {acc}')
+                le = _labels(dict(labels, le="+Inf"))
+                lines.append(f'{name}_seconds_bucket{le} {hist.count}')
+                tags = _labels(labels)
+                lines.append(f'{name}_seconds_sum{tags} {hist.sum / 1e6}')
+                lines.append(f'{name}_seconds_count{tags} {hist.count}')
+            for stat, q in (('p50', 0.5), ('p99', 0.99), ('max', None)):
+                lines.append(f'# TYPE {name}_{stat}_seconds gauge')
+                for key, hist in family.items():
+                    value = hist.max if q is None else hist.quantile(q)
+                    tags = _labels(dict(key))
+                    lines.append(f'{name}_{stat}_seconds{tags} {value / 1e6}')
+
+        for fn in list(self.collectors.values()):
+            for name, kind, help_text, samples in fn():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_labels(labels)} {value}')
+        out = '\n'.join(lines) + '\n'
+        for fn in list(self.texts.values()):
+            try:
+                out += fn()
+            except Exception:
+                pass
+        return out
+
+
+registry = Registry()
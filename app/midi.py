@@ -1,71 +1,213 @@
 import rtmidi
 import threading
-from .utils import log
+import time
+from .logs import get_logger, DEBUG
+from .dispatch import MidiDispatcher
+from .coalesce import CCCoalescer
+from .metrics import registry
+
+log = get_logger('midi')
+
+# Nomes dos tipos de status MIDI usados nas métricas
+STATUS_NAMES = {
+    0x80: 'note_off',
+    0x90: 'note_on',
+    0xA0: 'poly_aftertouch',
+    0xB0: 'control_change',
+    0xC0: 'program_change',
+    0xD0: 'channel_aftertouch',
+    0xE0: 'pitch_bend',
+    0xF0: 'system',
+}
+
+# Ações que podem ser ligadas a um CC em midi.actions
+ACTIONS = (
+    'next_bank', 'prev_bank', 'panic', 'reload_config',
+    'sequencer_play', 'sequencer_stop', 'record',
+)
 
 
 class MidiBridge:
-    def __init__(self, cfg, synth):
+    def __init__(self, cfg, synth, sequencer=None, recorder=None):
         self.cfg = cfg
         self.synth = synth
+        self.sequencer = sequencer
+        self.recorder = recorder
         self.midi_ports = []
         self.cc_map = cfg.midi_map.get('cc', {})
         self.actions = cfg.midi_map.get('actions', {})
         self.midi_learn_mode = cfg.data.get('midi_learn_mode', False)
         self.cc_seen = {}
         self._stop_event = threading.Event()
+        self._event_timers = {
+            status: registry.histogram(
+                'midi_event_latency',
+                'Latência do callback MIDI até a última chamada ao fluidsynth',
+                type=name,
+            )
+            for status, name in STATUS_NAMES.items()
+        }
+        self.coalescer = self._make_coalescer(cfg)
         self._build_instrument_lookups()
+
+        dispatch_cfg = cfg.data.get('midi', {}).get('dispatch', {})
+        self.dispatcher = None
+        if dispatch_cfg.get('mode', 'callback') == 'thread':
+            self.dispatcher = MidiDispatcher(
+                self._dispatch_message,
+                ring_size=int(dispatch_cfg.get('ring_size', 1024)),
+                batch_size=int(dispatch_cfg.get('batch_size', 64)),
+            )
+            self.dispatcher.start()
+
+        registry.register('midi', self._collect_metrics)
         self.open_all_ports()
 
+    def _make_coalescer(self, cfg):
+        """CCCoalescer com intervalo de N períodos de áudio, se habilitado."""
+        co_cfg = cfg.data.get('midi', {}).get('coalesce', {})
+        if not co_cfg.get('enabled', False):
+            return None
+        fs_cfg = cfg.data.get('audio', {}).get('fluidsynth', {})
+        period = int(fs_cfg.get('audio.period-size', 256))
+        rate = float(fs_cfg.get('synth.sample-rate', 44100))
+        periods = float(co_cfg.get('periods', 1))
+        coalescer = CCCoalescer(period / rate * periods)
+        coalescer.start()
+        return coalescer
+
     def _build_instrument_lookups(self):
-        """Pre-build lookup dicts para evitar iteração O(N) no hot path."""
-        self._cc_to_instrument = {}
-        self._sustain_channels = []
+        """Compila a tabela de dispatch de CC (128 entradas).
 
+        Cada slot guarda um handler(channel, value) já resolvido: ação com
+        filtro de valor, volume de instrumento, pedal (sustain/sostenuto,
+        via SustainEngine), repasse ou ignorar. A precedência é a mesma de
+        sempre: ação > volume_cc do instrumento > cc_map."""
+        cc_to_instrument = {}
         for name, inst in self.synth.instruments.items():
             vcc = inst.get('volume_cc')
             if vcc is not None:
-                self._cc_to_instrument[vcc] = (name, inst)
-            if inst.get('use_sustain', False):
-                self._sustain_channels.append(inst['channel'])
+                cc_to_instrument[vcc] = name
+
+        cc_map = {int(k): v for k, v in self.cc_map.items()}
+        instruments = self.synth.instruments
+        table = []
+        for ccnum in range(128):
+            name = cc_to_instrument.get(ccnum)
+            mapped = cc_map.get(ccnum)
+            if (name is None and isinstance(mapped, str)
+                    and mapped in instruments):
+                name = mapped
+
+            if name is not None:
+                handler = self._volume_handler(name)
+                coalesce = instruments[name].get('coalesce', True)
+                if self.coalescer and coalesce:
+                    handler = self.coalescer.wrap(ccnum, handler)
+            elif mapped == 'sustain':
+                handler = self._pedal_handler(self.synth.sustain.pedal)
+            elif mapped == 'sostenuto':
+                handler = self._pedal_handler(self.synth.sustain.sostenuto)
+            elif mapped:
+                handler = self._passthrough_handler(ccnum)
+                if self.coalescer:
+                    handler = self.coalescer.wrap(ccnum, handler)
+            else:
+                handler = self._unmapped_handler(ccnum)
+
+            if self.midi_learn_mode:
+                handler = self._learn_handler(ccnum, handler)
+            table.append(handler)
+
+        # Em ordem reversa: a primeira ação do config é testada primeiro
+        for action_name, action_cfg in reversed(list(self.actions.items())):
+            if action_name not in ACTIONS or not isinstance(action_cfg, dict):
+                continue
+            if action_cfg.get('cc') is not None:
+                ccnum = int(action_cfg['cc'])
+                table[ccnum] = self._action_handler(
+                    action_name, action_cfg.get('value'), table[ccnum]
+                )
+
+        # Swap atômico da tabela inteira
+        self._cc_dispatch = table
 
     def rebuild_lookups(self):
         """Rebuilda lookups após bank switch ou reload de config."""
         self._build_instrument_lookups()
 
-    def _check_actions(self, ccnum, value):
-        """Verifica e executa ações MIDI configuradas (botões)"""
-        for action_name, action_cfg in self.actions.items():
-            if isinstance(action_cfg, dict):
-                if action_cfg.get('cc') == ccnum:
-                    required_value = action_cfg.get('value')
-                    if required_value is not None and value != required_value:
-                        continue
-
-                    if action_name == 'next_bank':
-                        bank = self.synth.next_bank()
-                        if bank:
-                            self.rebuild_lookups()
-                            log(f"[midi] Avançar banco -> {bank}")
-                        return True
-                    elif action_name == 'prev_bank':
-                        bank = self.synth.prev_bank()
-                        if bank:
-                            self.rebuild_lookups()
-                            log(f"[midi] Voltar banco -> {bank}")
-                        return True
-                    elif action_name == 'panic':
-                        self.synth.panic()
-                        log(f"[midi] PANIC! Todos os sons parados")
-                        return True
-                    elif action_name == 'reload_config':
-                        log(f"[midi] Recarregando configuração...")
-                        return True
-        return False
+    def _volume_handler(self, name):
+        set_volume = self.synth.set_instrument_volume
+
+        def handler(channel, value):
+            set_volume(name, value)
+            if log.level <= DEBUG:
+                channel = self.synth.instruments[name]['channel']
+                log.debug("Volume '%s' (canal %d) = %d", name, channel, value)
+        return handler
+
+    def _pedal_handler(self, apply):
+        # O pedal vale para todos os instrumentos com use_sustain, não só
+        # para o canal de entrada
+        return lambda channel, value: apply(value)
+
+    def _passthrough_handler(self, ccnum):
+        send_cc = self.synth.send_cc
+        return lambda channel, value: send_cc(channel, ccnum, value)
+
+    def _unmapped_handler(self, ccnum):
+        return lambda channel, value: log.debug('CC#%d não mapeado', ccnum)
+
+    def _learn_handler(self, ccnum, inner):
+        def handler(channel, value):
+            if ccnum not in self.cc_seen:
+                log.info('NOVO CONTROLE DETECTADO! CC#%d', ccnum)
+                self.cc_seen[ccnum] = True
+            log.debug('CC#%d = %d (Canal %d)', ccnum, value, channel)
+            inner(channel, value)
+        return handler
+
+    def _action_handler(self, action_name, required_value, fallback):
+        """Executa a ação quando o valor bate; senão cai no handler anterior
+        do slot (outra ação no mesmo CC ou o mapeamento normal)."""
+        def handler(channel, value):
+            if required_value is not None and value != required_value:
+                fallback(channel, value)
+            else:
+                self._run_action(action_name)
+        return handler
+
+    def _run_action(self, action_name):
+        """Executa uma ação MIDI configurada (botões)"""
+        if action_name == 'next_bank':
+            bank = self.synth.next_bank()
+            if bank:
+                self.rebuild_lookups()
+                log.info('Avançar banco -> %s', bank)
+        elif action_name == 'prev_bank':
+            bank = self.synth.prev_bank()
+            if bank:
+                self.rebuild_lookups()
+                log.info('Voltar banco -> %s', bank)
+        elif action_name == 'panic':
+            self.synth.panic()
+            log.info('PANIC! Todos os sons parados')
+        elif action_name == 'reload_config':
+            log.info('Recarregando configuração...')
+        elif action_name == 'sequencer_play' and self.sequencer:
+            self.sequencer.toggle()
+        elif action_name == 'sequencer_stop' and self.sequencer:
+            self.sequencer.stop()
+        elif action_name == 'record' and self.recorder:
+            try:
+                self.recorder.toggle()
+            except OSError as e:
+                log.error('não foi possível gravar: %s', e)
 
     def open_all_ports(self):
         tmp = rtmidi.MidiIn()
         ports = tmp.get_ports()
-        log(f"[midi] portas disponíveis: {ports}")
+        log.info('portas disponíveis: %s', ports)
 
         control_tags = ['midi2', 'ctrl', 'control', 'port-1', 'port1']
         note_tags = ['midi1', 'key', 'keyboard']
@@ -74,32 +216,57 @@ class MidiBridge:
         for i, name in enumerate(ports):
             lname = name.lower()
             if any(t in lname for t in control_tags + note_tags):
-                log(f"[midi] abrindo porta: {i} -> {name}")
+                log.info('abrindo porta: %d -> %s', i, name)
                 mi = rtmidi.MidiIn()
                 mi.open_port(i)
-                mi.set_callback(self._midi_callback)
+                mi.set_callback(self._port_callback())
                 selected.append(mi)
 
         if not selected:
             for i, name in enumerate(ports):
-                log(f"[midi] fallback abrindo {i}: {name}")
+                log.info('fallback abrindo %d: %s', i, name)
                 mi = rtmidi.MidiIn()
                 mi.open_port(i)
-                mi.set_callback(self._midi_callback)
+                mi.set_callback(self._port_callback())
                 selected.append(mi)
 
         self.midi_ports = selected
 
+    def _port_callback(self):
+        """Callback para uma porta: direto ou via ring do dispatcher."""
+        if self.dispatcher:
+            return self.dispatcher.make_callback()
+        return self._midi_callback
+
+    def _dispatch_message(self, msg_data, stamp):
+        """Chamado pela thread de dispatch para cada mensagem do ring."""
+        self._handle_message(msg_data, 0.0, stamp)
+
     def _midi_callback(self, message, data=None):
         """Callback chamado pela thread interna do rtmidi quando há dados MIDI."""
+        stamp = time.perf_counter_ns()
         try:
             msg_data, delta = message
-            self._handle_message(msg_data, delta)
+            self._handle_message(msg_data, delta, stamp)
         except Exception as e:
-            log(f"[midi] erro no callback: {e}")
+            log.error('erro no callback: %s', e)
 
-    def _handle_message(self, data, delta):
+    def _handle_message(self, data, delta, stamp=None):
+        """Processa uma mensagem e registra a latência desde `stamp`
+        (entrada no callback, em perf_counter_ns) por tipo de status."""
+        if stamp is None:
+            stamp = time.perf_counter_ns()
+        recorder = self.recorder
+        if recorder is not None and recorder.recording:
+            recorder.push(stamp, data)
         status = data[0] & 0xF0
+        try:
+            self._route_message(status, data)
+        finally:
+            elapsed = time.perf_counter_ns() - stamp
+            self._event_timers[status].observe(elapsed // 1000)
+
+    def _route_message(self, status, data):
         channel = data[0] & 0x0F
 
         if status == 0x90 and data[2] > 0:
@@ -107,52 +274,42 @@ class MidiBridge:
         elif status == 0x80 or (status == 0x90 and data[2] == 0):
             self.synth.note_off(channel, data[1])
         elif status == 0xB0:
-            ccnum, value = data[1], data[2]
-
-            action_triggered = self._check_actions(ccnum, value)
-            if action_triggered:
-                return
-
-            if self.midi_learn_mode:
-                if ccnum not in self.cc_seen:
-                    log(f"[midi] NOVO CONTROLE DETECTADO! CC#{ccnum}")
-                    self.cc_seen[ccnum] = True
-                if self.cfg.debug:
-                    log(f"[midi] CC#{ccnum} = {value} (Canal {channel})")
-
-            # Prioridade 1: lookup direto por CC -> instrumento (O(1))
-            entry = self._cc_to_instrument.get(ccnum)
-            if entry:
-                name, inst = entry
-                ch = inst['channel']
-                self.synth.send_cc(ch, 7, value)
-                inst['volume'] = value
-                if self.cfg.debug:
-                    log(f"[midi] Volume '{name}' (canal {ch}) = {value}")
-            else:
-                # Prioridade 2: mapeamento especial no cc_map
-                mapped = self.cc_map.get(str(ccnum)) or self.cc_map.get(ccnum)
-                if mapped:
-                    if isinstance(mapped, str) and mapped in self.synth.instruments:
-                        ch = self.synth.instruments[mapped]['channel']
-                        self.synth.send_cc(ch, 7, value)
-                        self.synth.instruments[mapped]['volume'] = value
-                        if self.cfg.debug:
-                            log(f"[midi] Volume '{mapped}' (canal {ch}) = {value}")
-                    elif mapped == 'sustain':
-                        for ch in self._sustain_channels:
-                            self.synth.send_cc(ch, 64, value)
-                    else:
-                        self.synth.send_cc(channel, ccnum, value)
-                elif self.cfg.debug:
-                    log(f"[midi] CC#{ccnum} não mapeado")
+            self._cc_dispatch[data[1]](channel, data[2])
         elif status == 0xC0:
             self.synth.fs.program_change(channel, data[1])
 
+    def _collect_metrics(self):
+        events = [
+            ({'type': name}, self._event_timers[status].count)
+            for status, name in STATUS_NAMES.items()
+        ]
+        out = [('midi_events_total', 'counter',
+                'Mensagens MIDI recebidas por tipo', events)]
+        if self.coalescer:
+            st = self.coalescer.stats()
+            out.append((
+                'midi_cc_coalesce_total', 'counter',
+                'Updates de CC no agrupamento',
+                [({'kind': k}, st[k])
+                 for k in ('received', 'dropped', 'merged', 'flushed')],
+            ))
+        if self.dispatcher:
+            st = self.dispatcher.stats()
+            out += [
+                ('midi_dispatch_queued', 'gauge',
+                 'Mensagens aguardando no ring', [({}, st['queued'])]),
+                ('midi_dispatch_overflows_total', 'counter',
+                 'Mensagens descartadas por ring cheio',
+                 [({}, st['overflows'])]),
+                ('midi_dispatch_max_batch', 'gauge', 'Maior lote drenado',
+                 [({}, st['max_batch'])]),
+            ]
+        return out
+
     def process(self):
         """Bloqueia a thread principal. O MIDI é processado via callbacks."""
-        log('[midi] MIDI callback mode active')
+        log.info('MIDI callback mode active')
         try:
             self._stop_event.wait()
         except KeyboardInterrupt:
-            log('[midi] stopped')
+            log.info('stopped')
@@ -0,0 +1,101 @@
+import json
+import os
+import tempfile
+import threading
+from .sf2 import read_sf2, SF2Error
+from .logs import get_logger
+
+log = get_logger('index')
+
+INDEX_VERSION = 1
+
+
+class PresetIndex:
+    """Índice persistente de metadados de soundfonts.
+
+    Guarda, por caminho absoluto, a lista de presets, o tamanho dos dados de
+    sample e os offsets dos chunks RIFF. Uma entrada só vale se o tamanho e o
+    mtime do arquivo baterem com os gravados; caso contrário o SF2 é relido.
+    A gravação é atômica (arquivo temporário + os.replace)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            log.warn('ignorando índice inválido %s: %s', self.path, e)
+            return
+
+        if data.get('version') != INDEX_VERSION:
+            log.info('versão do índice diferente, reconstruindo %s', self.path)
+            return
+        self.entries = data.get('entries', {})
+        log.info('%d soundfonts no índice', len(self.entries))
+
+    def lookup(self, sf_path):
+        """Retorna a entrada válida do índice ou None (sem abrir o SF2)."""
+        try:
+            st = os.stat(sf_path)
+        except OSError:
+            return None
+        entry = self.entries.get(os.path.abspath(sf_path))
+        if (entry and entry['size'] == st.st_size
+                and entry['mtime_ns'] == st.st_mtime_ns):
+            return entry
+        return None
+
+    def get(self, sf_path):
+        """Retorna a entrada do índice, relendo o SF2 se necessário."""
+        entry = self.lookup(sf_path)
+        if entry is not None:
+            return entry
+
+        try:
+            st = os.stat(sf_path)
+            info = read_sf2(sf_path)
+        except (OSError, SF2Error) as e:
+            log.warn('Erro ao listar presets de %s: %s', sf_path, e)
+            return None
+
+        entry = {
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'presets': info['presets'],
+            'sample_bytes': info['sample_bytes'],
+            'chunks': {k: list(v) for k, v in info['chunks'].items()},
+        }
+        with self._lock:
+            self.entries[os.path.abspath(sf_path)] = entry
+            self._dirty = True
+        return entry
+
+    def save(self):
+        """Grava o índice em disco se houve mudanças."""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {'version': INDEX_VERSION, 'entries': self.entries}
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp = tempfile.mkstemp(prefix='.preset-index-', dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+                self._dirty = False
+            except OSError as e:
+                log.warn('falha ao gravar índice %s: %s', self.path, e)
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
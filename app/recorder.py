@@ -0,0 +1,160 @@
+"""
+Gravação do que chega nas portas MIDI para Standard MIDI File.
+
+No caminho MIDI a gravação custa um teste de flag e, gravando, guardar
+(carimbo, mensagem) num ring pré-alocado; a mensagem é a própria lista do
+rtmidi, sem cópia. O carimbo é o mesmo perf_counter_ns da entrada do
+callback usado nas métricas de latência. Uma thread escritora drena o ring
+a cada `flush_interval`, converte para ticks e grava no arquivo
+(SMFWriter), então o arquivo cresce durante a música e um crash perde no
+máximo o último intervalo. Se o ring encher (disco travado), as mensagens
+a mais são descartadas e contadas em `dropped`.
+
+Os arquivos vão para `recorder.dir` com o horário de início no nome.
+"""
+
+import os
+import threading
+import time
+from .logs import get_logger
+from .metrics import registry
+from .smf import SMFWriter
+
+log = get_logger('recorder')
+
+
+class MidiRecorder:
+    def __init__(self, directory='recordings', capacity=65536,
+                 flush_interval=0.5):
+        self.directory = directory
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.recording = False
+        self.dropped = 0
+        self.recorded = 0
+        self._stamps = [0] * capacity
+        self._msgs = [None] * capacity
+        self._head = 0
+        self._tail = 0
+        self._origin = 0
+        self._writer = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.version = 0  # muda com o estado mostrado na UI (StateStream)
+        registry.register('recorder', self._collect_metrics)
+
+    def push(self, stamp, msg):
+        """Chamado pelo MidiBridge para cada mensagem enquanto grava."""
+        with self._lock:
+            head = self._head
+            if head - self._tail >= self.capacity:
+                self.dropped += 1
+                return
+            i = head % self.capacity
+            self._stamps[i] = stamp
+            self._msgs[i] = msg
+            self._head = head + 1
+
+    # ---------------- controle -----------------
+    def start(self):
+        if self.recording or self._writer is not None:
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            # Sobras de depois do último stop não entram no arquivo novo
+            self._tail = self._head
+        name = time.strftime('%Y%m%d-%H%M%S') + '.mid'
+        path = os.path.join(self.directory, name)
+        self._writer = SMFWriter(path)
+        self._origin = time.perf_counter_ns()
+        self.recording = True
+        self.version += 1
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name='recorder', daemon=True
+            )
+            self._thread.start()
+        log.info('gravando em %s', path)
+        return True
+
+    def stop(self):
+        """Pára de gravar; a thread escritora fecha o arquivo."""
+        if not self.recording:
+            return False
+        self.recording = False
+        self.version += 1
+        self._wake.set()
+        return True
+
+    def toggle(self):
+        return self.stop() if self.recording else self.start()
+
+    # ---------------- escrita -----------------
+    def _drain(self, writer):
+        origin = self._origin
+        while self._tail != self._head:
+            i = self._tail % self.capacity
+            stamp, msg = self._stamps[i], self._msgs[i]
+            self._msgs[i] = None
+            self._tail += 1
+            # Só mensagens de canal; SysEx/sistema pedem outro encoding
+            if 0x80 <= msg[0] < 0xF0:
+                writer.write((stamp - origin) / 1e9, msg)
+                self.recorded += 1
+        writer.flush()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            writer = self._writer
+            if writer is None:
+                continue
+            try:
+                self._drain(writer)
+                if not self.recording:
+                    writer.close()
+                    self._writer = None
+                    self.version += 1
+                    log.info('gravação encerrada: %s (%d eventos)',
+                             writer.path, writer.events)
+            except (OSError, ValueError) as e:
+                log.error('erro gravando %s: %s', writer.path, e)
+                self.recording = False
+                self._writer = None
+                self.version += 1
+
+    def list_files(self):
+        try:
+            names = os.listdir(self.directory)
+            return sorted(n for n in names if n.endswith('.mid'))
+        except OSError:
+            return []
+
+    def status(self):
+        writer = self._writer
+        seconds = 0.0
+        if self.recording:
+            seconds = (time.perf_counter_ns() - self._origin) / 1e9
+        return {
+            'recording': self.recording,
+            'file': os.path.basename(writer.path) if writer else None,
+            'seconds': round(seconds, 1),
+            'events': writer.events if writer else 0,
+            'pending': self._head - self._tail,
+            'dropped': self.dropped,
+        }
+
+    def _collect_metrics(self):
+        return [
+            ('recorder_recording', 'gauge', 'Gravando (1) ou não (0)',
+             [({}, int(self.recording))]),
+            ('recorder_events_total', 'counter',
+             'Mensagens MIDI gravadas em arquivo', [({}, self.recorded)]),
+            ('recorder_pending', 'gauge',
+             'Mensagens aguardando a thread escritora',
+             [({}, self._head - self._tail)]),
+            ('recorder_dropped_total', 'counter',
+             'Mensagens descartadas por ring cheio', [({}, self.dropped)]),
+        ]
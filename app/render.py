@@ -0,0 +1,243 @@
+"""
+Renderização offline de MIDI para WAV usando um banco do config.yaml.
+
+O SynthModule é criado em modo offline (sem driver de áudio) e o banco é
+ativado pelo mesmo _activate_bank_instruments do modo ao vivo, então
+camadas, faixas de notas e volumes são os mesmos. As amostras são puxadas
+do fluidsynth com get_samples() o mais rápido que a CPU permitir.
+
+Uso:
+  python -m app.render musica.mid --bank Live -o musica.wav
+  python -m app.render setlist/ --bank Live --bank Studio -o renders/ -j 4
+
+Com um diretório, cada par (arquivo, banco) vira um job num pool de
+processos; cada worker mantém um único fluidsynth e carrega cada soundfont
+uma vez só. O manifest.json no diretório de saída traz tempo de render,
+pico e fator de tempo real por job.
+"""
+
+import argparse
+import json
+import os
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from . import config as config_mod
+from . import logs
+from .config import Config
+from .smf import read_smf
+from .synth import SynthModule
+from .logs import get_logger
+
+log = get_logger('render')
+
+# Maior bloco pedido ao fluidsynth de uma vez (em frames)
+MAX_BLOCK = 8192
+
+
+def open_offline_synth(cfg, bank_name):
+    """Cria um SynthModule offline com `bank_name` ativo."""
+    if bank_name and not cfg.switch_bank(bank_name):
+        raise ValueError(f'banco não encontrado: {bank_name}')
+    return SynthModule(cfg, offline=True)
+
+
+def render_events(synth, events, length, tail=2.0):
+    """Renderiza os eventos e devolve um array int16 (frames, 2)."""
+    sr = synth.sample_rate
+    total = int((length + tail) * sr)
+    out = np.zeros((total, 2), dtype=np.int16)
+
+    apply_event = synth.apply_event
+    pos = 0
+    for t, status, d1, d2 in events:
+        target = min(int(t * sr), total)
+        while pos < target:
+            n = min(target - pos, MAX_BLOCK)
+            out[pos:pos + n] = synth.fs.get_samples(n).reshape(-1, 2)
+            pos += n
+        apply_event(status, d1, d2)
+
+    while pos < total:
+        n = min(total - pos, MAX_BLOCK)
+        out[pos:pos + n] = synth.fs.get_samples(n).reshape(-1, 2)
+        pos += n
+    return out
+
+
+def write_wav(path, samples, sample_rate):
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(int(sample_rate))
+        w.writeframes(samples.tobytes())
+
+
+def render_file(synth, midi_path, out_path, tail=2.0):
+    """Renderiza um arquivo MIDI para WAV e devolve estatísticas."""
+    t0 = time.perf_counter()
+    events, length = read_smf(midi_path)
+    samples = render_events(synth, events, length, tail)
+    write_wav(out_path, samples, synth.sample_rate)
+    elapsed = time.perf_counter() - t0
+
+    audio_s = len(samples) / synth.sample_rate
+    peak = int(np.abs(samples.astype(np.int32)).max()) if len(samples) else 0
+    return {
+        'midi': midi_path,
+        'wav': out_path,
+        'audio_s': round(audio_s, 3),
+        'render_s': round(elapsed, 3),
+        'realtime_factor': round(audio_s / elapsed, 2) if elapsed else 0.0,
+        'peak': peak,
+        'peak_dbfs': round(20 * np.log10(peak / 32768), 2) if peak else None,
+    }
+
+
+def reset_synth(synth):
+    """Solta notas, pedais e controladores entre dois renders do synth."""
+    for ch in range(16):
+        synth.fs.cc(ch, 64, 0)
+        synth.fs.cc(ch, 121, 0)
+        synth.fs.cc(ch, 120, 0)
+    # CC121 volta o volume dos canais ao padrão
+    synth.invalidate_channel_state()
+    synth.forget_notes()
+    synth.sustain.reset()
+
+
+# Estado de cada processo do pool: um SynthModule reaproveitado entre jobs
+_worker = {}
+
+
+def _init_worker(cfg_file, tail):
+    config_mod.CFG_FILE = cfg_file
+    logs.set_level('*', 'warn')
+    _worker['tail'] = tail
+    _worker['synth'] = None
+
+
+def _render_job(midi_path, bank_name, out_path):
+    # Os workers saem sem atexit: os avisos do job são escritos antes de
+    # devolver o resultado e vão também para o manifesto
+    logs.start_capture()
+    try:
+        synth = _worker['synth']
+        if synth is None:
+            synth = _worker['synth'] = open_offline_synth(Config(), bank_name)
+        else:
+            reset_synth(synth)
+            if not synth.switch_bank(bank_name):
+                raise ValueError(f'banco não encontrado: {bank_name}')
+
+        stats = render_file(synth, midi_path, out_path, _worker['tail'])
+    finally:
+        warnings = logs.stop_capture()
+    stats['bank'] = bank_name
+    stats['worker'] = os.getpid()
+    stats['warnings'] = warnings
+    return stats
+
+
+def render_batch(midi_dir, banks, out_dir, workers=None, tail=2.0):
+    """Renderiza todos os .mid de `midi_dir` em cada banco, em paralelo.
+
+    Devolve o manifesto (também gravado em out_dir/manifest.json)."""
+    midis = sorted(
+        os.path.join(midi_dir, f) for f in os.listdir(midi_dir)
+        if f.lower().endswith(('.mid', '.midi'))
+    )
+    os.makedirs(out_dir, exist_ok=True)
+    # Ordem banco-major: jobs vizinhos tendem a cair no mesmo banco já ativo
+    jobs = []
+    for bank_name in banks:
+        for midi in midis:
+            stem = os.path.splitext(os.path.basename(midi))[0]
+            wav = os.path.join(out_dir, f'{stem}.{bank_name}.wav')
+            jobs.append((midi, bank_name, wav))
+
+    workers = workers or os.cpu_count() or 1
+    log.info('%d jobs (%d arquivos x %d bancos) em %d processos',
+             len(jobs), len(midis), len(banks), workers)
+    t0 = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(config_mod.CFG_FILE, tail),
+    ) as pool:
+        futures = {pool.submit(_render_job, *job): job for job in jobs}
+        for fut in as_completed(futures):
+            midi, bank_name, out = futures[fut]
+            try:
+                stats = fut.result()
+                log.info('%s: %sx tempo real, pico %s dBFS', out,
+                         stats['realtime_factor'], stats['peak_dbfs'])
+                if stats['warnings']:
+                    log.warn('%s: %d avisos (ver manifest.json)', out,
+                             len(stats['warnings']))
+            except Exception as e:
+                stats = {'midi': midi, 'bank': bank_name, 'wav': out,
+                         'error': str(e)}
+                log.error('erro em %s (%s): %s', midi, bank_name, e)
+            results.append(stats)
+
+    wall = time.perf_counter() - t0
+    audio_total = sum(r.get('audio_s', 0) for r in results)
+    manifest = {
+        'config': config_mod.CFG_FILE,
+        'workers': workers,
+        'wall_s': round(wall, 3),
+        'audio_s': round(audio_total, 3),
+        'realtime_factor': round(audio_total / wall, 2) if wall else 0.0,
+        'jobs': sorted(results, key=lambda r: (r['bank'], r['midi'])),
+    }
+    manifest_path = os.path.join(out_dir, 'manifest.json')
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Renderiza MIDI para WAV usando um banco do config'
+    )
+    parser.add_argument('midi', help='arquivo .mid, ou diretório (lote)')
+    parser.add_argument('--bank', action='append',
+                        help='banco do config (padrão: active_bank); '
+                             'em lote pode repetir')
+    parser.add_argument('-o', '--output',
+                        help='arquivo .wav de saída (ou diretório, em lote)')
+    parser.add_argument('--config',
+                        help='config YAML (padrão: SF2_CFG ou config.yaml)')
+    parser.add_argument('--tail', type=float, default=2.0,
+                        help='segundos de cauda após o último evento')
+    parser.add_argument('-j', '--workers', type=int,
+                        help='processos no lote (padrão: núcleos da CPU)')
+    args = parser.parse_args()
+
+    if args.config:
+        config_mod.CFG_FILE = args.config
+    cfg = Config()
+    banks = [b for arg in (args.bank or []) for b in arg.split(',') if b]
+
+    if os.path.isdir(args.midi):
+        banks = banks or [cfg.get_active_bank()]
+        manifest = render_batch(args.midi, banks, args.output or 'renders',
+                                args.workers, args.tail)
+        log.info('lote: %ss de áudio em %ss (%sx tempo real)',
+                 manifest['audio_s'], manifest['wall_s'],
+                 manifest['realtime_factor'])
+        return
+
+    synth = open_offline_synth(cfg, banks[0] if banks else None)
+    out = args.output or args.midi.rsplit('.', 1)[0] + '.wav'
+    stats = render_file(synth, args.midi, out, args.tail)
+    log.info('%s: %ss de áudio em %ss (%sx tempo real), pico %s dBFS',
+             out, stats['audio_s'], stats['render_s'],
+             stats['realtime_factor'], stats['peak_dbfs'])
+
+
+if __name__ == '__main__':
+    main()
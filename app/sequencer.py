@@ -0,0 +1,277 @@
+"""
+Sequenciador de backing tracks (Standard MIDI Files) dentro do app.
+
+O arquivo é lido uma vez (smf.read_smf) e vira dois arrays compactos:
+horário de cada evento em ns desde o início e o evento empacotado
+(status << 16 | d1 << 8 | d2). Só notas e CCs entram; o resto seria
+ignorado no playback de qualquer forma.
+
+Uma thread toca os eventos pelo SynthModule.apply_event, então a música
+passa pelo mesmo banco, faixas de nota, curvas de velocity e pedais que o
+teclado. Os horários são absolutos (origem + horário do evento), então
+erros de sleep não acumulam. A thread espera no Condition até `lookahead`
+antes do próximo evento (comandos de transporte a acordam) e dorme o resto
+com time.sleep, que solta o GIL para o callback MIDI e as outras threads.
+Se ela atrasar mais que `resync` (GC, troca de banco pesada), a origem
+anda junto em vez de despejar todos os eventos atrasados de uma vez.
+
+As notas e os pedais do arquivo usam o rastreamento e o estado de pedal
+do sequenciador (ver SustainEngine): parar a música não solta as teclas
+nem o pedal de quem está tocando.
+
+O atraso de cada evento vai para o histograma sequencer_timing_error.
+
+Uso:
+    seq = Sequencer(synth, 'backing')
+    seq.load('musica.mid')
+    seq.play()
+"""
+
+import os
+import threading
+import time
+from array import array
+from .logs import get_logger
+from .metrics import registry
+from .smf import read_smf
+from .sustain import SEQUENCER
+
+log = get_logger('sequencer')
+
+EXTENSIONS = ('.mid', '.midi', '.smf')
+
+
+class Track:
+    __slots__ = ('name', 'times', 'events', 'length')
+
+    def __init__(self, name, times, events, length):
+        self.name = name
+        self.times = times
+        self.events = events
+        self.length = length
+
+
+def load_track(path):
+    """Lê um SMF para arrays (horário em ns, evento empacotado)."""
+    events, length = read_smf(path)
+    times = array('q')
+    packed = array('I')
+    for t, status, d1, d2 in events:
+        kind = status & 0xF0
+        if kind in (0x80, 0x90, 0xB0):
+            times.append(int(t * 1e9))
+            packed.append((status << 16) | (d1 << 8) | d2)
+    return Track(os.path.basename(path), times, packed, length)
+
+
+class Sequencer:
+    def __init__(self, synth, directory='backing', lookahead=0.002,
+                 resync=0.05):
+        self.synth = synth
+        self.directory = directory
+        self.state = 'stopped'  # stopped | playing | paused
+        self.track = None
+        self.played = 0
+        self.resyncs = 0
+        self._lookahead_ns = int(lookahead * 1e9)
+        self._resync_ns = int(resync * 1e9)
+        self._pos = 0
+        self._origin = 0  # perf_counter_ns do instante 0 da música
+        self._paused_at = 0  # posição (ns) ao pausar
+        self._gen = 0  # muda a cada comando de transporte
+        self.version = 0  # muda com o estado mostrado na UI (StateStream)
+        self._sounding = set()  # (canal << 7) | nota tocadas pelo arquivo
+        self._pedal = False
+        self._sostenuto = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self._timing = registry.histogram(
+            'sequencer_timing_error',
+            'Atraso de cada evento do sequenciador em relação ao horário '
+            'previsto'
+        )
+        registry.register('sequencer', self._collect_metrics)
+
+    # ---------------- arquivos -----------------
+    def list_files(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return sorted(n for n in names if n.lower().endswith(EXTENSIONS))
+
+    def load(self, name):
+        """Carrega um arquivo do diretório de backing tracks (pára o atual)."""
+        if name not in self.list_files():
+            raise FileNotFoundError(
+                f'arquivo não encontrado em {self.directory}: {name}'
+            )
+        t0 = time.perf_counter()
+        track = load_track(os.path.join(self.directory, name))
+        with self._cond:
+            self._stop_locked()
+            self.track = track
+        log.info('%s carregado: %d eventos, %.1f s (%.1f ms)',
+                 name, len(track.times), track.length,
+                 (time.perf_counter() - t0) * 1000)
+        return track
+
+    # ---------------- transporte -----------------
+    def play(self):
+        with self._cond:
+            if self.track is None or self.state == 'playing':
+                return False
+            offset = self._paused_at if self.state == 'paused' else 0
+            self._origin = time.perf_counter_ns() - offset
+            self.state = 'playing'
+            self._gen += 1
+            self.version += 1
+            self._cond.notify()
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name='sequencer', daemon=True
+            )
+            self._thread.start()
+        log.info('play: %s', self.track.name)
+        return True
+
+    def pause(self):
+        with self._cond:
+            if self.state != 'playing':
+                return False
+            self._paused_at = time.perf_counter_ns() - self._origin
+            self.state = 'paused'
+            self._gen += 1
+            self.version += 1
+            self._release_notes()
+        log.info('pause em %.1f s', self._paused_at / 1e9)
+        return True
+
+    def toggle(self):
+        return self.pause() if self.state == 'playing' else self.play()
+
+    def stop(self):
+        with self._cond:
+            self._stop_locked()
+        return True
+
+    def _stop_locked(self):
+        if self.state != 'stopped':
+            log.info('stop')
+        self.state = 'stopped'
+        self._pos = 0
+        self._paused_at = 0
+        self._gen += 1
+        self.version += 1
+        self._release_notes()
+
+    def _release_notes(self):
+        # Notas e pedal deixados pelo arquivo não ficam presos; só as do
+        # arquivo: o teclado continua com as suas
+        apply_event = self.synth.apply_event
+        for key in self._sounding:
+            apply_event(0x80 | (key >> 7), key & 0x7F, 0, SEQUENCER)
+        self._sounding.clear()
+        if self._pedal:
+            self.synth.sustain.pedal(0, SEQUENCER)
+            self._pedal = False
+        if self._sostenuto:
+            self.synth.sustain.sostenuto(0, SEQUENCER)
+            self._sostenuto = False
+
+    # ---------------- playback -----------------
+    def _run(self):
+        cond = self._cond
+        while True:
+            with cond:
+                if self.state != 'playing':
+                    cond.wait()
+                    continue
+                track = self.track
+                i = self._pos
+                gen = self._gen
+                if i >= len(track.times):
+                    self._stop_locked()
+                    continue
+                deadline = self._origin + track.times[i]
+                early = deadline - time.perf_counter_ns()
+                if early > self._lookahead_ns:
+                    # Acorda cedo; comandos de transporte interrompem a espera
+                    cond.wait((early - self._lookahead_ns) / 1e9)
+                    continue
+
+            # O resto em sleeps (soltam o GIL); repete se acordar cedo
+            remaining = deadline - time.perf_counter_ns()
+            while remaining > 0:
+                time.sleep(remaining / 1e9)
+                remaining = deadline - time.perf_counter_ns()
+
+            with cond:
+                if self._gen == gen:
+                    self._pos = self._dispatch(track, i)
+
+    def _dispatch(self, track, i):
+        """Toca os eventos vencidos a partir de `i`; devolve o próximo."""
+        times = track.times
+        events = track.events
+        apply_event = self.synth.apply_event
+        sounding = self._sounding
+        now = time.perf_counter_ns()
+        late = now - (self._origin + times[i])
+        if late > self._resync_ns:
+            self._origin += late
+            self.resyncs += 1
+            log.warn('sequenciador atrasou %.1f ms, realinhando', late / 1e6)
+        song = now - self._origin
+        start = i
+        n = len(times)
+        while i < n and times[i] <= song:
+            ev = events[i]
+            status = ev >> 16
+            d1 = (ev >> 8) & 0x7F
+            d2 = ev & 0x7F
+            kind = status & 0xF0
+            if kind == 0x90 and d2:
+                sounding.add(((status & 0x0F) << 7) | d1)
+            elif kind == 0x80 or kind == 0x90:
+                sounding.discard(((status & 0x0F) << 7) | d1)
+            elif d1 == 64:
+                self._pedal = d2 >= 64
+            elif d1 == 66:
+                self._sostenuto = d2 >= 64
+            late = time.perf_counter_ns() - self._origin - times[i]
+            self._timing.observe(late // 1000)
+            apply_event(status, d1, d2, SEQUENCER)
+            i += 1
+        self.played += i - start
+        return i
+
+    def status(self):
+        with self._cond:
+            track = self.track
+            if self.state == 'playing':
+                position = (time.perf_counter_ns() - self._origin) / 1e9
+            else:
+                position = self._paused_at / 1e9
+            return {
+                'state': self.state,
+                'file': track.name if track else None,
+                'position': round(position, 3),
+                'length': round(track.length, 3) if track else 0.0,
+                'events': len(track.times) if track else 0,
+                'played': self.played,
+                'resyncs': self.resyncs,
+                'timing': self._timing.summary(),
+            }
+
+    def _collect_metrics(self):
+        return [
+            ('sequencer_playing', 'gauge',
+             'Sequenciador tocando (1) ou não (0)',
+             [({}, int(self.state == 'playing'))]),
+            ('sequencer_events_total', 'counter',
+             'Eventos tocados pelo sequenciador', [({}, self.played)]),
+            ('sequencer_resyncs_total', 'counter',
+             'Realinhamentos por atraso acima de resync',
+             [({}, self.resyncs)]),
+        ]
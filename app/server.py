@@ -0,0 +1,118 @@
+"""
+Servidor HTTP de produção para a UI, sem dependências além do Werkzeug.
+
+Cada conexão é atendida por um pool fixo de threads. Conexões além de
+`workers + backlog` recebem 503 na hora, e cada socket tem timeout, então
+um cliente lento ou insistente ocupa no máximo um worker por `timeout`
+segundos e nunca cria threads novas disputando o GIL com o callback MIDI.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from .logs import get_logger
+
+log = get_logger('http')
+
+_BUSY = (
+    b'HTTP/1.0 503 Service Unavailable\r\n'
+    b'Retry-After: 1\r\n'
+    b'Content-Length: 0\r\n'
+    b'Connection: close\r\n\r\n'
+)
+
+
+class _RequestHandler(WSGIRequestHandler):
+    # Uma requisição por conexão: keep-alive prenderia um worker ocioso
+    protocol_version = 'HTTP/1.0'
+    timeout = 10.0
+
+    def log_request(self, code='-', size='-'):
+        log.debug('%s "%s" %s', self.address_string(), self.requestline, code)
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    multithread = True
+
+    def __init__(self, host, port, app, workers=4, backlog=8, timeout=10.0):
+        handler = type('RequestHandler', (_RequestHandler,),
+                       {'timeout': timeout})
+        super().__init__(host, port, app, handler=handler)
+        self.workers = workers
+        self.rejected = 0
+        self.served = 0
+        self._slots = threading.BoundedSemaphore(workers + backlog)
+        self._pool = ThreadPoolExecutor(max_workers=workers,
+                                        thread_name_prefix='http')
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            try:
+                request.sendall(_BUSY)
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        self._pool.submit(self._serve, request, client_address)
+
+    def _serve(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.served += 1
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {'workers': self.workers, 'served': self.served,
+                'rejected': self.rejected}
+
+
+def serve(app, http_cfg):
+    """Sobe o servidor configurado em `http` numa thread daemon."""
+    host = http_cfg.get('host', '0.0.0.0')
+    port = http_cfg.get('port', 5000)
+    if http_cfg.get('server', 'pooled') == 'development':
+        target = app.run
+        kwargs = {'host': host, 'port': port, 'debug': False,
+                  'use_reloader': False}
+        log.info('UI running (development server) on %s:%s', host, port)
+    else:
+        server = PooledWSGIServer(
+            host, port, app,
+            workers=http_cfg.get('workers', 4),
+            backlog=http_cfg.get('backlog', 8),
+            timeout=http_cfg.get('timeout', 10.0),
+        )
+        app.extensions['http_server'] = server
+        target = server.serve_forever
+        kwargs = {}
+        log.info('UI running on %s:%s (%d workers)',
+                 host, port, server.workers)
+
+    t = threading.Thread(target=target, kwargs=kwargs, name='http',
+                         daemon=True)
+    t.start()
+    return t
+
+
+def stop(app):
+    """Encerra o servidor de `serve`.
+
+    Os workers do pool não são daemon e o interpretador espera por eles ao
+    sair; um gerador de /events nunca termina sozinho, então os clientes
+    ao vivo são encerrados antes de fechar o pool."""
+    stream = app.extensions.get('state_stream')
+    if stream is not None:
+        stream.stop()
+    server = app.extensions.get('http_server')
+    if server is not None:
+        server.shutdown()
+        server.server_close()
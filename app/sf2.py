@@ -0,0 +1,105 @@
+"""
+Leitor mínimo de SoundFont 2 (RIFF).
+
+Não carrega samples: mapeia o arquivo em memória, percorre a árvore de
+chunks RIFF e decodifica apenas o chunk pdta/phdr (cabeçalhos de preset).
+Não depende do fluidsynth, então pode ser usado também pelas ferramentas
+em tools/.
+"""
+
+import mmap
+import struct
+
+# Cabeçalho de chunk RIFF: id (4 bytes) + tamanho little-endian
+_CHUNK = struct.Struct('<4sI')
+# sfPresetHeader: achPresetName[20], wPreset, wBank, wPresetBagNdx,
+# dwLibrary, dwGenre, dwMorphology
+_PHDR = struct.Struct('<20sHHHIII')
+
+
+class SF2Error(ValueError):
+    """Arquivo não é um SoundFont 2 válido."""
+
+
+def _check_chunk(buf, cid, data, size):
+    if data + size > len(buf):
+        name = cid.decode('ascii', 'replace')
+        raise SF2Error(f'chunk {name} truncado ({size} bytes)')
+
+
+def _scan_chunks(buf):
+    """Retorna {nome: (offset, tamanho)} dos chunks relevantes.
+
+    Os LISTs são registrados pelo tipo ('INFO', 'sdta', 'pdta') e os
+    sub-chunks pelo id ('smpl', 'sm24', 'phdr', ...). Offsets apontam para
+    o início dos dados (depois do cabeçalho de 8 bytes). Chunk que passa
+    do fim do arquivo (truncado) vira SF2Error."""
+    if len(buf) < 12:
+        raise SF2Error('arquivo muito pequeno')
+    riff, riff_size = _CHUNK.unpack_from(buf, 0)
+    if riff != b'RIFF' or buf[8:12] != b'sfbk':
+        raise SF2Error('cabeçalho RIFF/sfbk ausente')
+
+    end = min(len(buf), 8 + riff_size)
+    chunks = {}
+    pos = 12
+    while pos + 8 <= end:
+        cid, size = _CHUNK.unpack_from(buf, pos)
+        data = pos + 8
+        _check_chunk(buf, cid, data, size)
+        if cid == b'LIST':
+            if size < 4:
+                raise SF2Error('LIST sem tipo')
+            kind = bytes(buf[data:data + 4]).decode('ascii', 'replace')
+            chunks[kind] = (data + 4, size - 4)
+            sub = data + 4
+            sub_end = min(end, data + size)
+            while sub + 8 <= sub_end:
+                sid, ssize = _CHUNK.unpack_from(buf, sub)
+                _check_chunk(buf, sid, sub + 8, ssize)
+                chunks[sid.decode('ascii', 'replace')] = (sub + 8, ssize)
+                sub += 8 + ssize + (ssize & 1)
+        pos = data + size + (size & 1)
+    return chunks
+
+
+def _decode_phdr(buf, offset, size):
+    presets = []
+    # O último registro é o terminador 'EOP'
+    count = size // _PHDR.size - 1
+    for i in range(max(count, 0)):
+        raw_name, preset, bank, _, _, _, _ = _PHDR.unpack_from(
+            buf, offset + i * _PHDR.size
+        )
+        name = raw_name.split(b'\0', 1)[0].decode('latin-1').strip()
+        presets.append({'bank': bank, 'preset': preset, 'name': name})
+    presets.sort(key=lambda p: (p['bank'], p['preset']))
+    return presets
+
+
+def read_sf2(path):
+    """Lê layout e presets de um SF2.
+
+    Returns:
+        dict com 'presets' (lista de {bank, preset, name}), 'sample_bytes'
+        (tamanho dos dados de sample, smpl + sm24) e 'chunks'
+        ({nome: (offset, tamanho)}).
+    """
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise SF2Error(f'arquivo vazio: {path}')
+        with mm:
+            chunks = _scan_chunks(mm)
+            if 'phdr' not in chunks:
+                raise SF2Error(f'chunk pdta/phdr ausente: {path}')
+            presets = _decode_phdr(mm, *chunks['phdr'])
+
+    sample_bytes = sum(chunks[c][1] for c in ('smpl', 'sm24') if c in chunks)
+    return {'presets': presets, 'sample_bytes': sample_bytes, 'chunks': chunks}
+
+
+def read_presets(path):
+    """Retorna a lista de presets de um SF2 como dicts {bank, preset, name}."""
+    return read_sf2(path)['presets']
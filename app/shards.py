@@ -0,0 +1,211 @@
+"""
+Vários fluidsynth.Synth (shards) atrás da interface de um só.
+
+`synth.cpu-cores` paraleliza só dentro do mixer de um fluidsynth; com
+audio.shards.count > 1 cada shard é um fluidsynth inteiro, com seu próprio
+driver de áudio, e o servidor de áudio (JACK, PipeWire, dmix) mistura as
+saídas. No modo offline, get_samples soma os shards.
+
+ShardedSynth expõe os métodos que o SynthModule usa (noteon, cc,
+program_select, sfload, ...). Mensagens de canal vão para o shard dono do
+canal (route); cada shard usa os mesmos números de canal. Os sfids que o
+SynthModule vê são virtuais: um soundfont é carregado só nos shards que
+algum banco coloca nele (place) e, se um canal precisar dele em outro
+shard, é carregado sob demanda no program_select.
+
+Instrumentos vão para um shard pelo `shard` do config ou, sem ele, por
+assign_shards: o maior estimado primeiro, sempre no shard menos carregado.
+"""
+
+import ctypes
+import itertools
+import fluidsynth
+from .logs import get_logger
+
+log = get_logger('synth')
+
+MIDI_CHANNELS = 16
+
+_cfunc = getattr(fluidsynth, 'cfunc', None)
+try:
+    _get_cpu_load = _cfunc and _cfunc(
+        'fluid_synth_get_cpu_load', ctypes.c_double,
+        ('synth', ctypes.c_void_p, 1)
+    )
+except Exception:
+    _get_cpu_load = None
+
+
+def estimate_voice_load(inst):
+    """Vozes que um instrumento costuma ocupar: `voice_load` do config ou
+    max_voices / faixa de notas (até 32), dobrado com sustain."""
+    if inst.get('voice_load'):
+        return float(inst['voice_load'])
+    span = inst['max_note'] - inst['min_note'] + 1
+    load = inst.get('max_voices') or min(span, 32)
+    return float(load * (2 if inst.get('use_sustain') else 1))
+
+
+def assign_shards(templates, count):
+    """Preenche template['shard'] dos modelos sem shard fixo no config.
+
+    Canais com mais de um instrumento ficam no mesmo shard (o do primeiro)."""
+    loads = [0.0] * count
+    by_channel = {}
+    for template in templates:
+        by_channel.setdefault(template['channel'], []).append(template)
+
+    pending = []
+    for channel, group in by_channel.items():
+        load = sum(estimate_voice_load(t) for t in group)
+        fixed = next(
+            (t['shard'] for t in group if t.get('shard') is not None), None
+        )
+        if fixed is not None:
+            fixed = int(fixed) % count
+            loads[fixed] += load
+            for t in group:
+                t['shard'] = fixed
+        else:
+            pending.append((load, channel, group))
+
+    for load, _, group in sorted(pending, key=lambda p: (-p[0], p[1])):
+        shard = loads.index(min(loads))
+        loads[shard] += load
+        for t in group:
+            t['shard'] = shard
+    return loads
+
+
+class ShardedSynth:
+    def __init__(self, count, samplerate=44100.0):
+        self.shards = [
+            fluidsynth.Synth(samplerate=samplerate) for _ in range(count)
+        ]
+        for i, shard in enumerate(self.shards):
+            # Nomes distintos para os clientes JACK
+            try:
+                shard.setting('audio.jack.id', f'fluidsynth-{i}')
+            except Exception:
+                pass
+        self.channel_shard = [0] * MIDI_CHANNELS
+        self.assigned = set()  # canais que já receberam um instrumento
+        self._by_channel = [self.shards[0]] * MIDI_CHANNELS
+        self.placement = {}  # path -> {shard}
+        self._paths = {}  # sfid virtual -> path
+        # por shard: sfid virtual -> sfid real
+        self._loaded = [{} for _ in self.shards]
+        self._ids = itertools.count(1)
+        self.lazy_loads = 0
+
+    # ---------------- roteamento -----------------
+    def route(self, channel, shard):
+        """Põe o canal no shard; se mudou, silencia o canal e solta os
+        pedais no shard antigo. Devolve True se mudou (quem chama reenvia
+        o estado dos pedais ao shard novo; ver SustainEngine.reroute)."""
+        self.assigned.add(channel)
+        old = self.channel_shard[channel]
+        if old == shard:
+            return False
+        previous = self.shards[old]
+        previous.cc(channel, 64, 0)
+        previous.cc(channel, 66, 0)
+        previous.cc(channel, 123, 0)
+        self.channel_shard[channel] = shard
+        self._by_channel[channel] = self.shards[shard]
+        return True
+
+    def place(self, path, shard):
+        self.placement.setdefault(path, set()).add(shard)
+
+    def noteon(self, channel, note, velocity):
+        return self._by_channel[channel].noteon(channel, note, velocity)
+
+    def noteoff(self, channel, note):
+        return self._by_channel[channel].noteoff(channel, note)
+
+    def cc(self, channel, ctrl, value):
+        return self._by_channel[channel].cc(channel, ctrl, value)
+
+    def program_change(self, channel, program):
+        return self._by_channel[channel].program_change(channel, program)
+
+    # ---------------- soundfonts -----------------
+    def _load_into(self, index, sfid, path):
+        real = self.shards[index].sfload(path)
+        if real is None or real < 0:
+            return None
+        self._loaded[index][sfid] = real
+        return real
+
+    def sfload(self, path, update_midi_preset=0):
+        sfid = next(self._ids)
+        targets = self.placement.get(path) or range(len(self.shards))
+        for index in targets:
+            if self._load_into(index, sfid, path) is None:
+                self.sfunload(sfid)
+                return -1
+        self._paths[sfid] = path
+        return sfid
+
+    def sfunload(self, sfid, update_midi_preset=0):
+        for index, loaded in enumerate(self._loaded):
+            real = loaded.pop(sfid, None)
+            if real is not None:
+                self.shards[index].sfunload(real, update_midi_preset)
+        self._paths.pop(sfid, None)
+
+    def program_select(self, channel, sfid, bank, preset):
+        index = self.channel_shard[channel]
+        real = self._loaded[index].get(sfid)
+        if real is None:
+            path = self._paths.get(sfid)
+            if path is None:
+                return -1
+            log.warn('shard %d: carregando %s sob demanda', index, path)
+            self.lazy_loads += 1
+            real = self._load_into(index, sfid, path)
+            if real is None:
+                return -1
+        return self.shards[index].program_select(channel, real, bank, preset)
+
+    # ---------------- synth inteiro -----------------
+    def setting(self, key, value):
+        for shard in self.shards:
+            shard.setting(key, value)
+
+    def start(self, *args, **kwargs):
+        for shard in self.shards:
+            shard.start(*args, **kwargs)
+
+    def delete(self):
+        for shard in self.shards:
+            shard.delete()
+
+    def get_active_voice_count(self):
+        return sum(shard.get_active_voice_count() for shard in self.shards)
+
+    def get_samples(self, length=1024):
+        import numpy as np
+        mixed = sum(shard.get_samples(length).astype(np.int32)
+                    for shard in self.shards)
+        return np.clip(mixed, -32768, 32767).astype(np.int16)
+
+    def stats(self):
+        out = []
+        for index, shard in enumerate(self.shards):
+            cpu = None
+            if _get_cpu_load and getattr(shard, 'synth', None):
+                try:
+                    cpu = round(_get_cpu_load(shard.synth), 1)
+                except Exception:
+                    cpu = None
+            out.append({
+                'shard': index,
+                'voices': shard.get_active_voice_count(),
+                'cpu_load': cpu,
+                'channels': sorted(ch for ch in self.assigned
+                                   if self.channel_shard[ch] == index),
+                'soundfonts': len(self._loaded[index]),
+            })
+        return out
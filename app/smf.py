@@ -0,0 +1,211 @@
+"""
+Leitura e escrita de Standard MIDI Files.
+
+read_smf converte as trilhas (formatos 0 e 1) em uma lista única de
+eventos de canal ordenada por tempo absoluto em segundos, aplicando o mapa
+de tempo (meta 0x51). Meta eventos e SysEx são descartados. Toda leitura
+é conferida contra o fim da trilha: arquivo truncado ou lixo vira SMFError.
+
+SMFWriter grava um arquivo formato 0 aos poucos, com tempo fixo; o
+tamanho da trilha é corrigido a cada flush(), então um arquivo que não
+chegou ao close() (crash durante a gravação) é lido até o último flush.
+"""
+
+import struct
+
+DEFAULT_TEMPO = 500000  # µs por semínima (120 BPM)
+
+# Bytes de dados por tipo de status de canal
+_DATA_LEN = {0x80: 2, 0x90: 2, 0xA0: 2, 0xB0: 2, 0xC0: 1, 0xD0: 1, 0xE0: 2}
+
+
+class SMFError(ValueError):
+    """Arquivo não é um Standard MIDI File válido."""
+
+
+def _read_vlq(buf, pos, end):
+    value = 0
+    while True:
+        if pos >= end:
+            raise SMFError('VLQ truncado')
+        b = buf[pos]
+        pos += 1
+        value = (value << 7) | (b & 0x7F)
+        if not b & 0x80:
+            return value, pos
+
+
+def _parse_track(buf, start, end, track_no):
+    """Eventos da trilha como (tick, ordem, status, d1, d2) e mudanças de
+    andamento como (tick, ordem, tempo)."""
+    events = []
+    tempos = []
+    pos = start
+    tick = 0
+    running = None
+    order = 0
+    while pos < end:
+        delta, pos = _read_vlq(buf, pos, end)
+        tick += delta
+        if pos >= end:
+            raise SMFError(f'trilha {track_no} truncada')
+        status = buf[pos]
+        if status & 0x80:
+            pos += 1
+        elif running is None:
+            raise SMFError('running status sem status anterior')
+        else:
+            status = running
+
+        if status == 0xFF:
+            if pos >= end:
+                raise SMFError(f'trilha {track_no} truncada')
+            meta = buf[pos]
+            length, pos = _read_vlq(buf, pos + 1, end)
+            if pos + length > end:
+                raise SMFError(f'trilha {track_no} truncada')
+            if meta == 0x51 and length == 3:
+                tempo = (buf[pos] << 16) | (buf[pos + 1] << 8) | buf[pos + 2]
+                tempos.append((tick, (track_no, order), tempo))
+            pos += length
+            if meta == 0x2F:
+                break
+        elif status in (0xF0, 0xF7):
+            length, pos = _read_vlq(buf, pos, end)
+            if pos + length > end:
+                raise SMFError(f'trilha {track_no} truncada')
+            pos += length
+            running = None
+        else:
+            n = _DATA_LEN.get(status & 0xF0)
+            if n is None:
+                raise SMFError(f'status inválido 0x{status:02X}')
+            if pos + n > end:
+                raise SMFError(f'trilha {track_no} truncada')
+            d1 = buf[pos]
+            d2 = buf[pos + 1] if n == 2 else 0
+            pos += n
+            running = status
+            events.append((tick, (track_no, order), status, d1, d2))
+        order += 1
+    return events, tempos
+
+
+def read_smf(path):
+    """Lê um SMF e devolve (eventos, duração em segundos).
+
+    Cada evento é uma tupla (segundos, status, d1, d2), em ordem de tempo."""
+    with open(path, 'rb') as f:
+        buf = f.read()
+
+    if buf[:4] != b'MThd':
+        raise SMFError(f'cabeçalho MThd ausente: {path}')
+    if len(buf) < 14:
+        raise SMFError(f'cabeçalho MThd truncado: {path}')
+    hlen, fmt, ntrks, division = struct.unpack_from('>IHHH', buf, 4)
+    if fmt > 1:
+        raise SMFError(f'formato SMF {fmt} não suportado')
+    if not (division & 0xFF if division & 0x8000 else division):
+        raise SMFError(f'divisão de tempo inválida: {division:#06x}')
+
+    pos = 8 + hlen
+    events = []
+    tempos = []
+    for track_no in range(ntrks):
+        if buf[pos:pos + 4] != b'MTrk' or pos + 8 > len(buf):
+            raise SMFError(f'trilha {track_no} sem cabeçalho MTrk')
+        (tlen,) = struct.unpack_from('>I', buf, pos + 4)
+        end = min(len(buf), pos + 8 + tlen)
+        ev, tm = _parse_track(buf, pos + 8, end, track_no)
+        events += ev
+        tempos += tm
+        pos += 8 + tlen
+
+    events.sort(key=lambda e: (e[0], e[1]))
+
+    if division & 0x8000:
+        # SMPTE: -fps no byte alto, ticks por frame no baixo
+        fps = 256 - (division >> 8)
+        sec_per_tick = 1.0 / (fps * (division & 0xFF))
+        out = [(tick * sec_per_tick, st, d1, d2)
+               for tick, _, st, d1, d2 in events]
+    else:
+        tempos.sort(key=lambda t: (t[0], t[1]))
+        out = []
+        ti = 0
+        last_tick = 0
+        seconds = 0.0
+        tempo = DEFAULT_TEMPO
+        for tick, _, st, d1, d2 in events:
+            while ti < len(tempos) and tempos[ti][0] <= tick:
+                seconds += ((tempos[ti][0] - last_tick) * tempo
+                            / (division * 1e6))
+                last_tick = tempos[ti][0]
+                tempo = tempos[ti][2]
+                ti += 1
+            seconds += (tick - last_tick) * tempo / (division * 1e6)
+            last_tick = tick
+            out.append((seconds, st, d1, d2))
+
+    length = out[-1][0] if out else 0.0
+    return out, length
+
+
+def _vlq(value):
+    out = bytearray((value & 0x7F,))
+    value >>= 7
+    while value:
+        out.insert(0, (value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(out)
+
+
+class SMFWriter:
+    """SMF formato 0 escrito incrementalmente.
+
+    Eventos entram com o tempo absoluto em segundos e viram ticks com
+    `division` ticks por semínima a `tempo` µs por semínima (padrão 120 BPM
+    a 3840 ticks: ~130 µs por tick)."""
+
+    def __init__(self, path, division=3840, tempo=DEFAULT_TEMPO):
+        self.path = path
+        self.division = division
+        self.ticks_per_second = division * 1e6 / tempo
+        self.events = 0
+        self._last_tick = 0
+        self._track_bytes = 0
+        self._buf = bytearray()
+        self._f = open(path, 'wb')
+        self._f.write(b'MThd' + struct.pack('>IHHH', 6, 0, 1, division))
+        self._len_pos = self._f.tell() + 4
+        self._f.write(b'MTrk' + struct.pack('>I', 0))
+        self._append(0, b'\xff\x51\x03' + tempo.to_bytes(3, 'big'))
+
+    def _append(self, delta, data):
+        chunk = _vlq(delta) + data
+        self._buf += chunk
+        self._track_bytes += len(chunk)
+
+    def write(self, seconds, data):
+        """Acrescenta uma mensagem (bytes) no instante `seconds`."""
+        tick = int(round(seconds * self.ticks_per_second))
+        tick = max(self._last_tick, tick)
+        self._append(tick - self._last_tick, bytes(data))
+        self._last_tick = tick
+        self.events += 1
+
+    def flush(self):
+        if self._buf:
+            self._f.write(self._buf)
+            self._buf = bytearray()
+            # Tamanho depois dos dados: um crash no meio deixa o anterior
+            end = self._f.tell()
+            self._f.seek(self._len_pos)
+            self._f.write(struct.pack('>I', self._track_bytes))
+            self._f.seek(end)
+        self._f.flush()
+
+    def close(self):
+        self._append(0, b'\xff\x2f\x00')
+        self.flush()
+        self._f.close()
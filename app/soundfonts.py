@@ -0,0 +1,207 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from .logs import get_logger
+
+log = get_logger('synth')
+loader_log = get_logger('loader')
+
+
+class SoundfontPool:
+    """Residência de soundfonts no fluidsynth.
+
+    Carrega sob demanda (acquire), mantém a ordem de uso em LRU e, quando o
+    orçamento de RAM é excedido, descarrega com sfunload os soundfonts menos
+    usados que não estão fixados (pin). O custo de cada soundfont é estimado
+    pelo tamanho dos dados de sample registrado no índice de presets."""
+
+    def __init__(self, fs, index, budget_mb=0):
+        self.fs = fs
+        self.index = index
+        self.budget = int(float(budget_mb) * 1024 * 1024)  # 0 = sem limite
+        # path -> sfid, do menos para o mais recente
+        self.sfids = OrderedDict()
+        self.sizes = {}
+        self.last_used = {}
+        self.pinned = frozenset()
+        self.resident_bytes = 0
+        self.stats = {'loads': 0, 'hits': 0, 'evictions': 0, 'failures': 0}
+        self._inflight = {}
+        self._lock = threading.RLock()
+
+    def estimate_size(self, path):
+        entry = self.index.lookup(path)
+        if entry is not None:
+            return entry['sample_bytes']
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def get(self, path):
+        """sfid de um soundfont residente, sem carregar."""
+        return self.sfids.get(path)
+
+    def acquire(self, path):
+        """Retorna o sfid, carregando o soundfont se necessário.
+
+        O sfload roda fora do lock, então leitores (get/acquire de um
+        soundfont já residente) não esperam por carregamentos em andamento."""
+        with self._lock:
+            sfid = self.sfids.get(path)
+            if sfid is not None:
+                self.sfids.move_to_end(path)
+                self.last_used[path] = time.monotonic()
+                self.stats['hits'] += 1
+                return sfid
+
+            pending = self._inflight.get(path)
+            owner = pending is None
+            if owner:
+                pending = self._inflight[path] = threading.Event()
+                size = self.estimate_size(path)
+                self._make_room(size)
+
+        if not owner:
+            pending.wait()
+            return self.sfids.get(path)
+
+        log.info('loading soundfont: %s', path)
+        try:
+            sfid = self.fs.sfload(path)
+        except Exception as e:
+            log.warn('erro carregando %s: %s', path, e)
+            sfid = None
+
+        with self._lock:
+            del self._inflight[path]
+            if sfid is None or sfid < 0:
+                self.stats['failures'] += 1
+                log.warn('falha ao carregar soundfont %s', path)
+                sfid = None
+            else:
+                self.sfids[path] = sfid
+                self.sizes[path] = size
+                self.last_used[path] = time.monotonic()
+                self.resident_bytes += size
+                self.stats['loads'] += 1
+        pending.set()
+        return sfid
+
+    def missing_bytes(self, paths):
+        """Bytes que faltam carregar para tornar todos os paths residentes."""
+        return sum(self.estimate_size(p) for p in paths if p not in self.sfids)
+
+    def fits(self, size):
+        return not self.budget or self.resident_bytes + size <= self.budget
+
+    def pin(self, paths):
+        """Define o conjunto de soundfonts que não podem ser despejados."""
+        with self._lock:
+            self.pinned = frozenset(paths)
+
+    def unload(self, path):
+        with self._lock:
+            sfid = self.sfids.pop(path, None)
+            if sfid is None:
+                return False
+            self.fs.sfunload(sfid, 1)
+            self.resident_bytes -= self.sizes.pop(path, 0)
+            self.last_used.pop(path, None)
+            return True
+
+    def _make_room(self, size):
+        if not self.budget:
+            return
+        for path in list(self.sfids):
+            if self.resident_bytes + size <= self.budget:
+                break
+            if path in self.pinned:
+                continue
+            log.info('evicting soundfont: %s', path)
+            self.unload(path)
+            self.stats['evictions'] += 1
+        if self.resident_bytes + size > self.budget:
+            log.warn('orçamento de memória excedido por soundfonts fixados')
+
+    def status(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                'budget_bytes': self.budget,
+                'resident_bytes': self.resident_bytes,
+                'resident': [
+                    {
+                        'file': path,
+                        'sfid': sfid,
+                        'bytes': self.sizes.get(path, 0),
+                        'pinned': path in self.pinned,
+                        'idle_s': round(
+                            now - self.last_used.get(path, now), 1
+                        ),
+                    }
+                    for path, sfid in reversed(self.sfids.items())
+                ],
+                **self.stats,
+            }
+
+
+class BankLoader:
+    """Carrega soundfonts de bancos em segundo plano.
+
+    plan_fn() devolve [(banco, paths, fixado), ...] já ordenado por
+    prioridade. Bancos fixados podem despejar outros soundfonts; os demais
+    só são carregados se couberem no orçamento. A cada wake() a ordem é
+    recalculada (ex.: depois de uma troca de banco)."""
+
+    def __init__(self, pool, plan_fn, on_loaded=None):
+        self.pool = pool
+        self.plan_fn = plan_fn
+        self.on_loaded = on_loaded
+        self.loading = None
+        self.failed = set()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name='bank-loader', daemon=True
+        )
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            interrupted = False
+            for bank_name, paths, pinned in self.plan_fn():
+                if self._wake.is_set() or self._stop.is_set():
+                    interrupted = True
+                    break
+                missing = [p for p in paths if self.pool.get(p) is None]
+                if not missing or bank_name in self.failed:
+                    continue
+                needed = self.pool.missing_bytes(missing)
+                if not pinned and not self.pool.fits(needed):
+                    continue
+
+                self.loading = bank_name
+                loader_log.info('loading bank %s (%d soundfonts)',
+                                bank_name, len(missing))
+                for path in missing:
+                    if self.pool.acquire(path) is None:
+                        self.failed.add(bank_name)
+                    elif self.on_loaded:
+                        self.on_loaded(path)
+                self.loading = None
+
+            if not interrupted:
+                self._wake.wait()
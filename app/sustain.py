@@ -0,0 +1,233 @@
+"""
+Pedais de sustain (CC64) e sostenuto (CC66) com estado por instrumento.
+
+O valor do pedal vira um estado abaixado/solto por canal antes de chegar
+ao fluidsynth: só a mudança de estado gera mensagem, então um pedal
+contínuo mandando dezenas de valores por pisada custa duas mensagens por
+canal em vez de uma por valor. Cada instrumento pode ter seu próprio
+`sustain_threshold` (meio pedal: uma camada segura a partir de meia
+pisada, outra só no fundo); o pedal só solta abaixo do limiar menos a
+histerese (`midi.sustain.hysteresis`), o que absorve o ruído do sensor.
+
+Sostenuto: ao abaixar, as notas seguradas no canal ficam presas
+(`latched`) até o pedal subir, mesmo com o sustain solto.
+
+O estado dos pedais fica aqui; as notas (seguradas e sustentadas) ficam
+no SynthModule, que só é consultado e avisado por held_notes() e
+release_sustained().
+
+Cada origem (SOURCES: o teclado e o sequenciador de backing tracks) tem o
+seu estado de pedal; o canal fica com o pedal abaixado enquanto alguma
+origem o segura, então o fim de um backing track não solta o pedal de
+quem está tocando, e vice-versa.
+"""
+
+from .logs import get_logger
+
+log = get_logger('synth')
+
+MIDI_CHANNELS = 16
+
+SUSTAIN = 64
+SOSTENUTO = 66
+
+KEYBOARD = 'keyboard'
+SEQUENCER = 'sequencer'
+SOURCES = (KEYBOARD, SEQUENCER)
+
+
+class SustainEngine:
+    def __init__(self, synth, threshold=64, hysteresis=0):
+        self.synth = synth
+        self.threshold = int(threshold)
+        self.hysteresis = int(hysteresis)
+        self.targets = ()  # ((canal, abaixa, solta), ...)
+        self.names = {}
+        self.messages = {
+            (pedal, result): 0
+            for pedal in ('sustain', 'sostenuto')
+            for result in ('sent', 'suppressed')
+        }
+        self.reset()
+
+    def reset(self):
+        """Esquece os pedais (o synth já recebeu CC64/66 0 ou CC121)."""
+        self.sustain_down = [False] * MIDI_CHANNELS
+        self.sostenuto_down = [False] * MIDI_CHANNELS
+        # Bitset das notas presas pelo sostenuto, por canal
+        self.latched = [0] * MIDI_CHANNELS
+        # Por origem: canal -> abaixado
+        self.held = {
+            (pedal, source): [False] * MIDI_CHANNELS
+            for pedal in (SUSTAIN, SOSTENUTO) for source in SOURCES
+        }
+
+    def forget_latched(self, ch=None):
+        """Esquece as notas presas (o synth parou de rastreá-las); o pedal
+        continua abaixado."""
+        if ch is None:
+            self.latched = [0] * MIDI_CHANNELS
+        else:
+            self.latched[ch] = 0
+
+    def relatch(self, ch):
+        """O sostenuto foi reenviado (CC66 0/127): prende de novo só as
+        notas seguradas agora."""
+        self.latched[ch] = self.synth.held_notes(ch)
+
+    def _others(self, pedal, source, ch):
+        """Alguma outra origem segura o pedal neste canal?"""
+        return any(
+            held[ch] for (p, s), held in self.held.items()
+            if p == pedal and s != source
+        )
+
+    def _forget_channel(self, ch):
+        for held in self.held.values():
+            held[ch] = False
+
+    def configure(self, instruments):
+        """Canais com use_sustain e seus limiares, um por canal."""
+        targets = []
+        names = {}
+        for name, inst in instruments.items():
+            ch = inst['channel']
+            if not inst.get('use_sustain') or ch in names:
+                continue
+            down = inst.get('sustain_threshold') or self.threshold
+            targets.append((ch, down, max(1, down - self.hysteresis)))
+            names[ch] = name
+        self.targets = tuple(targets)
+        self.names = names
+        # Canais que saíram com o pedal abaixado não receberiam mais o
+        # pedal-up: solta agora para as notas não ficarem presas
+        for ch in range(MIDI_CHANNELS):
+            if ch in names:
+                continue
+            if self.sustain_down[ch]:
+                self.synth.fs.cc(ch, SUSTAIN, 0)
+                self._sustain_up(ch)
+            if self.sostenuto_down[ch]:
+                self.synth.fs.cc(ch, SOSTENUTO, 0)
+                self._sostenuto_up(ch)
+            self._forget_channel(ch)
+
+    def pedal(self, value, source=KEYBOARD):
+        """CC64 de uma origem, aplicado a todos os canais com sustain."""
+        held = self.held[SUSTAIN, source]
+        state = self.sustain_down
+        suppressed = 0
+        for ch, down, up in self.targets:
+            if held[ch]:
+                if value >= up:
+                    suppressed += 1
+                    continue
+                held[ch] = False
+                if self._others(SUSTAIN, source, ch):
+                    suppressed += 1
+                    continue
+                self.synth.fs.cc(ch, SUSTAIN, 0)
+                self._sustain_up(ch)
+            else:
+                if value < down:
+                    suppressed += 1
+                    continue
+                held[ch] = True
+                if state[ch]:
+                    suppressed += 1
+                    continue
+                self.synth.fs.cc(ch, SUSTAIN, 127)
+                state[ch] = True
+            self.messages['sustain', 'sent'] += 1
+        self.messages['sustain', 'suppressed'] += suppressed
+
+    def sostenuto(self, value, source=KEYBOARD):
+        """CC66 de uma origem: prende as notas seguradas agora."""
+        held = self.held[SOSTENUTO, source]
+        state = self.sostenuto_down
+        suppressed = 0
+        for ch, down, up in self.targets:
+            if held[ch]:
+                if value >= up:
+                    suppressed += 1
+                    continue
+                held[ch] = False
+                if self._others(SOSTENUTO, source, ch):
+                    suppressed += 1
+                    continue
+                self.synth.fs.cc(ch, SOSTENUTO, 0)
+                self._sostenuto_up(ch)
+            else:
+                if value < down:
+                    suppressed += 1
+                    continue
+                held[ch] = True
+                if state[ch]:
+                    suppressed += 1
+                    continue
+                self.synth.fs.cc(ch, SOSTENUTO, 127)
+                self._sostenuto_down(ch)
+            self.messages['sostenuto', 'sent'] += 1
+        self.messages['sostenuto', 'suppressed'] += suppressed
+
+    def track(self, channel, ccnum, value):
+        """Atualiza o estado de um CC64/66 já enviado direto ao canal
+        (conta como do teclado; solto, vale para todas as origens)."""
+        down = value >= 64
+        if ccnum == SUSTAIN:
+            if down:
+                self.held[SUSTAIN, KEYBOARD][channel] = True
+                self.sustain_down[channel] = True
+            else:
+                for source in SOURCES:
+                    self.held[SUSTAIN, source][channel] = False
+                if self.sustain_down[channel]:
+                    self._sustain_up(channel)
+        else:
+            if down:
+                self.held[SOSTENUTO, KEYBOARD][channel] = True
+            else:
+                for source in SOURCES:
+                    self.held[SOSTENUTO, source][channel] = False
+            if down != self.sostenuto_down[channel]:
+                if down:
+                    self._sostenuto_down(channel)
+                else:
+                    self._sostenuto_up(channel)
+
+    def reroute(self, ch):
+        """O canal passou para outro fluidsynth (shards), que não recebeu os
+        pedais: reenvia os que estão abaixados. O sostenuto não tem notas
+        seguradas para prender no shard novo."""
+        if self.sustain_down[ch]:
+            self.synth.fs.cc(ch, SUSTAIN, 127)
+        if self.sostenuto_down[ch]:
+            self.synth.fs.cc(ch, SOSTENUTO, 127)
+            self.latched[ch] = 0
+
+    def _sustain_up(self, ch):
+        self.sustain_down[ch] = False
+        # Notas presas pelo sostenuto continuam soando
+        self.synth.release_sustained(ch, keep=self.latched[ch])
+
+    def _sostenuto_down(self, ch):
+        self.sostenuto_down[ch] = True
+        self.latched[ch] = self.synth.held_notes(ch)
+
+    def _sostenuto_up(self, ch):
+        self.sostenuto_down[ch] = False
+        self.latched[ch] = 0
+        if not self.sustain_down[ch]:
+            self.synth.release_sustained(ch)
+
+    def status(self):
+        synth = self.synth
+        return {
+            name: {
+                'channel': ch,
+                'sustain': self.sustain_down[ch],
+                'sostenuto': self.sostenuto_down[ch],
+                'sustained': bin(synth.sustained_notes(ch)).count('1'),
+            }
+            for ch, name in self.names.items()
+        }
@@ -1,23 +1,163 @@
+import itertools
 import os
+import time
 import traceback
 import fluidsynth
-from .utils import log
-from .utils import note_to_midi
+from .logs import get_logger
+from .utils import note_to_midi, file_version
+from .preset_index import PresetIndex
+from .soundfonts import SoundfontPool, BankLoader
+from .voices import VoiceBudget
+from .sustain import SustainEngine, KEYBOARD, SOURCES
+from .shards import ShardedSynth, assign_shards
+from .metrics import registry
+
+MIDI_CHANNELS = 16
+
+# Chaves de instrumento que um reload aplica sem reprogramar o canal
+LIVE_INSTRUMENT_KEYS = frozenset((
+    'initial_volume', 'min_note', 'max_note', 'input_channel', 'volume_cc',
+    'use_sustain', 'coalesce', 'transpose', 'velocity_curve',
+    'velocity_exponent', 'velocity_range', 'fixed_velocity',
+    'priority', 'max_voices', 'sustain_threshold',
+))
+# Chaves que entram na tabela de CC do MidiBridge
+CC_INSTRUMENT_KEYS = frozenset(('volume_cc', 'coalesce'))
+# CCs de arquivo que o sequenciador não manda ao canal: bank select,
+# volume e expression (o volume em cache ficaria errado) e as mensagens de
+# modo (120-127: all sound off, reset, all notes off...), que cortariam o
+# instrumento de quem está tocando
+FILE_CC_DROPPED = frozenset((0, 7, 11, 32, *range(120, 128)))
+
+log = get_logger('synth')
+
+
+LINEAR_VELOCITY = tuple(range(128))
+_velocity_maps = {}
+
+
+def compile_velocity_map(curve='linear', exponent=2.0, vel_range=None,
+                         fixed=None):
+    """Tabela de 128 entradas: velocity de entrada -> velocity enviada.
+
+    curve: 'linear', 'exponential' (v^exponent, normalizado) ou uma lista de
+    pontos [[entrada, saída], ...] interpolada linearmente. vel_range
+    [min, max] filtra a velocity de entrada (fora da faixa vira 0 e a nota
+    não toca); fixed substitui a curva. Tabelas iguais são compartilhadas."""
+    if isinstance(curve, list):
+        curve = tuple(sorted((int(a), int(b)) for a, b in curve))
+    key = (curve, float(exponent),
+           tuple(vel_range) if vel_range else None, fixed)
+    table = _velocity_maps.get(key)
+    if table is not None:
+        return table
+
+    lo, hi = (int(vel_range[0]), int(vel_range[1])) if vel_range else (1, 127)
+    out = [0]
+    for v in range(1, 128):
+        if not lo <= v <= hi:
+            out.append(0)
+            continue
+        if fixed is not None:
+            value = int(fixed)
+        elif curve == 'linear':
+            value = v
+        elif curve == 'exponential':
+            value = round(127 * (v / 127) ** float(exponent))
+        elif isinstance(curve, tuple) and curve:
+            value = _interpolate(curve, v)
+        else:
+            raise ValueError(f'velocity_curve inválida: {curve!r}')
+        out.append(max(1, min(127, value)))
+
+    table = LINEAR_VELOCITY if out == list(LINEAR_VELOCITY) else tuple(out)
+    _velocity_maps[key] = table
+    return table
+
+
+def _interpolate(points, v):
+    if v <= points[0][0]:
+        return points[0][1]
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        if v <= x1:
+            if x1 == x0:
+                return y1
+            return round(y0 + (y1 - y0) * (v - x0) / (x1 - x0))
+    return points[-1][1]
+
+
+def compile_note_routes(instruments):
+    """Compila a tabela de roteamento nota -> (canal, nota, velocities).
+
+    Uma lista de 128 tuplas por canal MIDI de entrada; cada alvo traz o
+    canal do fluidsynth, a nota já transposta e a tabela de velocity do
+    instrumento, então note_on/note_off só indexam. Só instrumentos audíveis
+    (volume > 0) entram; notas transpostas para fora de 0-127 são
+    descartadas. A faixa min_note/max_note vale para a nota tocada."""
+    audible = [inst for inst in instruments if inst['volume'] > 0]
+    shared = {}
+    routes = []
+    for in_ch in range(MIDI_CHANNELS):
+        members = [
+            inst for inst in audible
+            if inst['input_channel'] is None or inst['input_channel'] == in_ch
+        ]
+        key = tuple(id(inst) for inst in members)
+        table = shared.get(key)
+        if table is None:
+            interned = {}
+            table = []
+            for note in range(128):
+                targets = tuple(
+                    (inst['channel'], note + inst.get('transpose', 0),
+                     inst.get('velocity_map', LINEAR_VELOCITY))
+                    for inst in members
+                    if inst['min_note'] <= note <= inst['max_note']
+                    and 0 <= note + inst.get('transpose', 0) <= 127
+                )
+                table.append(interned.setdefault(targets, targets))
+            shared[key] = table
+        routes.append(table)
+    return routes
+
+
+class BankPlan:
+    """Banco compilado a partir do config: modelos dos instrumentos (com
+    caminho resolvido, nome do preset e faixa de notas já calculados), os
+    soundfonts que ele usa e as rotas de nota para os volumes iniciais.
+    Não é alterado depois de criado; ativar um banco só copia os modelos."""
+
+    __slots__ = ('name', 'instruments', 'files', 'routes')
+
+    def __init__(self, name, instruments, files, routes):
+        self.name = name
+        self.instruments = instruments  # ((nome, modelo), ...)
+        self.files = files
+        self.routes = routes
 
 
 class SynthModule:
-    def __init__(self, cfg):
+    def __init__(self, cfg, offline=False):
+        """offline=True cria o synth sem driver de áudio nem loader em
+        segundo plano: as amostras são puxadas com fs.get_samples()."""
         self.cfg = cfg
+        self.offline = offline
         audio = cfg.data.get('audio', {})
         driver = audio.get('driver', 'alsa')
         device = audio.get('device', None)
+        fs_cfg = audio.get('fluidsynth', {})
+        self.sample_rate = float(fs_cfg.get('synth.sample-rate', 44100))
 
-        log(f"[synth] starting fluidsynth driver={driver} device={device}")
-        self.fs = fluidsynth.Synth()
+        self.shard_count = max(1, int(audio.get('shards', {}).get('count', 1)))
+        log.info('starting fluidsynth driver=%s device=%s shards=%d',
+                 driver, device, self.shard_count)
+        if self.shard_count > 1:
+            self.fs = ShardedSynth(self.shard_count, self.sample_rate)
+        else:
+            self.fs = fluidsynth.Synth(samplerate=self.sample_rate)
 
-        fs_cfg = audio.get('fluidsynth', {})
         for key, value in fs_cfg.items():
-            log(f"[fs.setting] {key} = {value}")
+            log.debug('fs.setting %s = %s', key, value)
             try:
                 if isinstance(value, int):
                     self.fs.setting(key, int(value))
@@ -26,12 +166,68 @@ class SynthModule:
                 else:
                     self.fs.setting(key, str(value))
             except Exception as e:
-                log(f"[warn] erro aplicando setting {key}: {e}")
+                log.warn('erro aplicando setting %s: %s', key, e)
 
+        if offline:
+            log.info('offline mode (no audio driver)')
+        else:
+            self._start_audio(driver, device)
+
+        self.preset_cache = {}
+        self.preset_index = PresetIndex(
+            cfg.data.get('preset_index', '.preset-index.json')
+        )
+        sf_cfg = cfg.data.get('soundfonts', {})
+        self.soundfonts = SoundfontPool(
+            self.fs, self.preset_index, sf_cfg.get('memory_budget_mb', 0)
+        )
+        self.sfid_cache = self.soundfonts.sfids
+        self.sfid_map = {}
+        self.instruments = {}
+        # Versão do estado do mixer (volumes, presets, banco); a UI ao vivo
+        # compara com a última que publicou
+        self._versions = itertools.count(1)
+        self.state_version = 0
+        self._note_routes = [[()] * 128 for _ in range(MIDI_CHANNELS)]
+        # Último programa (sfid, bank, preset) e CC7 enviados por canal
+        self.invalidate_channel_state()
+        self.channel_messages = {
+            'program_sent': 0, 'program_skipped': 0,
+            'volume_sent': 0, 'volume_skipped': 0,
+        }
+        voices_cfg = cfg.data.get('voices', {})
+        self.voices = VoiceBudget(
+            self, fs_cfg.get('synth.polyphony', 256),
+            voices_cfg.get('headroom', 0.85)
+        )
+        sustain_cfg = cfg.data.get('midi', {}).get('sustain', {})
+        self.sustain = SustainEngine(
+            self, sustain_cfg.get('threshold', 64),
+            sustain_cfg.get('hysteresis', 0)
+        )
+        self.forget_notes()
+        self._activation_timer = registry.histogram(
+            'synth_bank_activation', 'Tempo de ativação de um banco'
+        )
+        registry.register('synth', self._collect_metrics)
+
+        self._bank_plans = {}
+        self._bank_files_map = {}
+        self._scan_banks()
+        self.loader = BankLoader(
+            self.soundfonts, self._load_plan, self._presets_for
+        )
+
+        # O banco ativo é carregado primeiro; o resto vai para o loader
+        self._activate_bank(cfg.get_active_bank())
+        if not offline:
+            self.loader.start()
+
+    def _start_audio(self, driver, device):
         started = False
         try:
             if driver == 'jack':
-                log('[synth] starting with JACK')
+                log.info('starting with JACK')
                 self.fs.start('jack')
             else:
                 if device:
@@ -39,19 +235,19 @@ class SynthModule:
                 else:
                     self.fs.start(driver=driver)
             started = True
-            log('[synth] started')
+            log.info('started')
         except Exception as e:
-            log(f"[error] start failed for driver={driver}: {e}")
+            log.error('start failed for driver=%s: %s', driver, e)
             traceback.print_exc()
 
         if not started:
             for fallback in ('pulseaudio', None):
                 try:
                     if fallback:
-                        log(f"[synth] fallback to {fallback}")
+                        log.info('fallback to %s', fallback)
                         self.fs.start(fallback)
                     else:
-                        log('[synth] final fallback start()')
+                        log.info('final fallback start()')
                         self.fs.start()
                     started = True
                     break
@@ -61,165 +257,721 @@ class SynthModule:
         if not started:
             raise RuntimeError('Could not start FluidSynth')
 
-        self.sfid_cache = {}
-        self.preset_cache = {}
-        self.sfid_map = {}
-        self.instruments = {}
-        
-        log('[synth] pre-loading all soundfonts from all banks...')
-        self._preload_all_soundfonts()
-        self._activate_bank_instruments(cfg.get_active_instruments())
-
-    def _preload_all_soundfonts(self):
-        """Carrega todos os soundfonts de todos os bancos (cache)"""
-        banks = self.cfg.data.get('banks', [])
-        
-        for bank in banks:
-            instruments = bank.get('instruments', [])
-            for inst in instruments:
-                sf = inst['file']
-
-                if not os.path.isabs(sf):
-                    sf = os.path.join(inst.get('presets_dir', '.'), sf) if inst.get('presets_dir') else sf
-                if not os.path.exists(sf):
-                    if os.path.exists(os.path.join(os.getcwd(), sf)):
-                        sf = os.path.join(os.getcwd(), sf)
-                    else:
-                        log(f"[warn] soundfont {sf} not found, skipping")
-                        continue
-
-                if sf not in self.sfid_cache:
-                    log(f"[synth] loading soundfont: {sf}")
-                    sfid = self.fs.sfload(sf)
-                    self.sfid_cache[sf] = sfid
-                    self.preset_cache[sf] = self.read_presets_from_sf(sf)
-        
-        log(f'[synth] pre-loaded {len(self.sfid_cache)} soundfonts')
-
-    def _activate_bank_instruments(self, instruments):
-        """Ativa instrumentos do banco sem recarregar soundfonts.
-        Usa swap atômico do dict para thread safety com callbacks MIDI."""
-        new_instruments = {}
-        new_sfid_map = {}
-
+    def _resolve_sf_path(self, inst):
+        sf = inst['file']
+        if not os.path.isabs(sf):
+            if inst.get('presets_dir'):
+                sf = os.path.join(inst['presets_dir'], sf)
+        if not os.path.exists(sf):
+            if os.path.exists(os.path.join(os.getcwd(), sf)):
+                sf = os.path.join(os.getcwd(), sf)
+        return sf
+
+    def _scan_banks(self):
+        """Compila cada banco do config num BankPlan, sem carregar os SF2."""
+        plans = {}
+        for bank in self.cfg.data.get('banks', []):
+            name = bank.get('name')
+            plans[name] = self._compile_plan(
+                name, bank.get('instruments', [])
+            )
+        self._bank_plans = plans
+        self._bank_files_map = {
+            name: plan.files for name, plan in plans.items()
+        }
+
+    def _compile_instrument(self, inst):
+        """Modelo de tempo de execução de um instrumento do config (sem sfid).
+        None se o soundfont não existir."""
+        name = inst['name']
+        bank = inst.get('bank', 0)
+        preset = inst.get('preset', 0)
+
+        sf = self._resolve_sf_path(inst)
+        if not os.path.exists(sf):
+            log.warn('soundfont %s not found, skipping %s', sf, name)
+            return None
+
+        presets = self._presets_for(sf)
+        preset_name = next(
+            (p['name'] for p in presets
+             if p['preset'] == preset and p['bank'] == bank),
+            "Desconhecido"
+        )
+        try:
+            velocity_map = compile_velocity_map(
+                inst.get('velocity_curve', 'linear'),
+                inst.get('velocity_exponent', 2.0),
+                inst.get('velocity_range'),
+                inst.get('fixed_velocity'),
+            )
+        except (TypeError, ValueError) as e:
+            log.warn('%s: %s, usando velocity linear', name, e)
+            velocity_map = LINEAR_VELOCITY
+        return {
+            'sf': sf,
+            'channel': inst.get('channel', 0),
+            'bank': bank,
+            'preset': preset,
+            'preset_name': preset_name,
+            'volume': int(inst.get('initial_volume', 100)),
+            'volume_cc': inst.get('volume_cc', 127),
+            'use_sustain': inst.get('use_sustain', True),
+            'min_note': note_to_midi(inst.get('min_note', 0)),
+            'max_note': note_to_midi(inst.get('max_note', 127)),
+            'input_channel': inst.get('input_channel'),
+            'coalesce': inst.get('coalesce', True),
+            'transpose': int(inst.get('transpose', 0)),
+            'velocity_map': velocity_map,
+            'priority': int(inst.get('priority', 0)),
+            'max_voices': int(inst.get('max_voices', 0)),
+            'sustain_threshold': inst.get('sustain_threshold'),
+            'shard': inst.get('shard'),
+            'voice_load': inst.get('voice_load'),
+        }
+
+    def _compile_plan(self, bank_name, instruments):
+        compiled = []
+        files = []
         for inst in instruments:
-            name = inst['name']
-            sf = inst['file']
-            bank = inst.get('bank', 0)
-            preset = inst.get('preset', 0)
-            channel = inst.get('channel', 0)
-            init_vol = int(inst.get('initial_volume', 100))
-
-            if not os.path.isabs(sf):
-                sf = os.path.join(inst.get('presets_dir', '.'), sf) if inst.get('presets_dir') else sf
-            if not os.path.exists(sf):
-                if os.path.exists(os.path.join(os.getcwd(), sf)):
-                    sf = os.path.join(os.getcwd(), sf)
-
-            sfid = self.sfid_cache.get(sf)
-            if sfid is None:
-                log(f"[warn] soundfont {sf} not in cache, skipping {name}")
+            template = self._compile_instrument(inst)
+            if template is None:
                 continue
-
-            presets = self.preset_cache.get(sf, [])
-            preset_name = next(
-                (p['name'] for p in presets if p['preset'] == preset and p['bank'] == bank),
-                "Desconhecido"
+            compiled.append((inst['name'], template))
+            if template['sf'] not in files:
+                files.append(template['sf'])
+        if self.shard_count > 1:
+            assign_shards([template for _, template in compiled],
+                          self.shard_count)
+            for _, template in compiled:
+                self.fs.place(template['sf'], template['shard'])
+        routes = compile_note_routes([template for _, template in compiled])
+        return BankPlan(bank_name, tuple(compiled), tuple(files), routes)
+
+    def _presets_for(self, sf):
+        """Presets de um SF2; relidos se o arquivo mudou no disco."""
+        version = file_version(sf)
+        cached = self.preset_cache.get(sf)
+        if cached is None or cached[0] != version:
+            presets = self.read_presets_from_sf(sf)
+            cached = self.preset_cache[sf] = (version, presets)
+            self.preset_index.save()
+        return cached[1]
+
+    def _bank_files(self, bank_name):
+        return self._bank_files_map.get(bank_name, ())
+
+    def _adjacent_banks(self):
+        """Bancos vizinhos do ativo (próximo e anterior)."""
+        names = [b.get('name') for b in self.cfg.data.get('banks', [])]
+        active = self.cfg.get_active_bank()
+        if active not in names or len(names) < 2:
+            return []
+        i = names.index(active)
+        n = len(names)
+        return list(dict.fromkeys((names[(i + 1) % n], names[(i - 1) % n])))
+
+    def _pin_soundfonts(self, files):
+        """Fixa os soundfonts do banco ativo e, se pedido, dos vizinhos."""
+        pinned = set(files)
+        if self.cfg.data.get('soundfonts', {}).get('pin_adjacent', True):
+            for bank_name in self._adjacent_banks():
+                pinned.update(self._bank_files(bank_name))
+        self.soundfonts.pin(pinned)
+
+    def _load_plan(self):
+        """Bancos para o loader, ordenados pela distância ao banco ativo
+        (próximo antes do anterior). O ativo e os fixados vêm marcados."""
+        names = [b.get('name') for b in self.cfg.data.get('banks', [])]
+        active = self.cfg.get_active_bank()
+        n = len(names)
+        if active in names:
+            i = names.index(active)
+            order = sorted(
+                range(n),
+                key=lambda j: (
+                    min((j - i) % n, (i - j) % n), (j - i) % n > n // 2
+                ),
             )
-
-            log(f"[synth] activating {name} on channel {channel}")
-
-            self.fs.program_select(channel, sfid, bank, preset)
-            self.fs.cc(channel, 7, init_vol)
-
-            new_instruments[name] = {
-                'sf': sf,
-                'channel': channel,
-                'bank': bank,
-                'preset': preset,
-                'preset_name': preset_name,
-                'volume': init_vol,
-                'volume_cc': inst.get('volume_cc', 127),
-                'use_sustain': inst.get('use_sustain', True),
-                'sfid': sfid,
-                'min_note': note_to_midi(inst.get('min_note', 0)),
-                'max_note': note_to_midi(inst.get('max_note', 127)),
-            }
-            new_sfid_map[name] = sfid
-
+        else:
+            order = range(n)
+
+        pinned_banks = {active}
+        if self.cfg.data.get('soundfonts', {}).get('pin_adjacent', True):
+            pinned_banks.update(self._adjacent_banks())
+        return [
+            (names[j], self._bank_files(names[j]), names[j] in pinned_banks)
+            for j in order
+        ]
+
+    def bank_state(self, bank_name):
+        """Estado de carga de um banco: ready, loading, pending ou failed."""
+        if bank_name == self.loader.loading:
+            return 'loading'
+        if bank_name in self.loader.failed:
+            return 'failed'
+        files = self._bank_files(bank_name)
+        if all(self.soundfonts.get(sf) is not None for sf in files):
+            return 'ready'
+        return 'pending'
+
+    def bank_ready(self, bank_name):
+        return self.bank_state(bank_name) == 'ready'
+
+    def _instantiate(self, name, template):
+        """Instrumento ativo a partir do modelo do plano (carrega o soundfont
+        só se ele ainda não estiver residente)."""
+        sfid = self.soundfonts.acquire(template['sf'])
+        if sfid is None:
+            log.warn('soundfont %s could not be loaded, skipping %s',
+                     template['sf'], name)
+            return None
+        return dict(template, sfid=sfid)
+
+    def _program_instrument(self, name, instrument):
+        """Programa o canal do instrumento, mandando só o que difere do
+        estado atual do canal. Devolve quantas mensagens foram enviadas."""
+        channel = instrument['channel']
+        if (self.shard_count > 1
+                and self.fs.route(channel, instrument['shard'])):
+            # Canal mudou de shard: o shard novo não tem programa, volume
+            # nem pedais, e as notas do antigo foram cortadas por route()
+            self._channel_programs[channel] = None
+            self._channel_volumes[channel] = None
+            self._release_channel_tracking(channel)
+            self.sustain.reroute(channel)
+        program = (
+            instrument['sfid'], instrument['bank'], instrument['preset']
+        )
+        sent = 0
+        if self._channel_programs[channel] != program:
+            log.debug('activating %s on channel %d', name, channel)
+            self.fs.program_select(channel, *program)
+            self._channel_programs[channel] = program
+            self.channel_messages['program_sent'] += 1
+            sent += 1
+        else:
+            self.channel_messages['program_skipped'] += 1
+        if self._send_volume(channel, instrument['volume']):
+            sent += 1
+        return sent
+
+    def _send_volume(self, channel, value):
+        if self._channel_volumes[channel] == value:
+            self.channel_messages['volume_skipped'] += 1
+            return False
+        self.fs.cc(channel, 7, value)
+        self._channel_volumes[channel] = value
+        self.channel_messages['volume_sent'] += 1
+        return True
+
+    def invalidate_channel_state(self):
+        """Esquece o programa/volume conhecido de cada canal (ex.: depois de
+        um reset de controladores); a próxima ativação manda tudo de novo."""
+        self._channel_programs = [None] * MIDI_CHANNELS
+        self._channel_volumes = [None] * MIDI_CHANNELS
+
+    def forget_notes(self):
+        """Zera o rastreamento de notas (sem mandar mensagens).
+
+        _held[origem][(canal de entrada << 7) | nota] guarda os alvos
+        (canal, nota transposta, velocities) que realmente receberam o note
+        on; note_off usa isso em vez da rota atual, que pode ter mudado com
+        a nota presa. Cada origem (teclado, sequenciador) tem a sua tabela,
+        então o note off de uma não solta a tecla da outra.
+        _active/_sustained são bitsets de 128 bits por canal do fluidsynth:
+        notas seguradas e notas soltas que ainda soam pelo pedal (ou presas
+        pelo sostenuto, SustainEngine.latched). _seq_active marca as
+        seguradas pelo sequenciador e _doubled as que as duas origens
+        seguram; ver _claim. O estado dos pedais fica (o fluidsynth continua
+        com eles abaixados); ver SustainEngine.reset."""
+        self._held = {
+            source: [None] * (MIDI_CHANNELS * 128) for source in SOURCES
+        }
+        self._active = [0] * MIDI_CHANNELS
+        self._seq_active = [0] * MIDI_CHANNELS
+        self._doubled = [0] * MIDI_CHANNELS
+        self._seq_holding = False
+        self._sustained = [0] * MIDI_CHANNELS
+        self.sustain.forget_latched()
+        self.voices.forget()
+
+    def held_notes(self, channel):
+        """Bitset das notas seguradas no canal do fluidsynth."""
+        return self._active[channel]
+
+    def sustained_notes(self, channel):
+        """Bitset das notas soltas que ainda soam no canal."""
+        return self._sustained[channel]
+
+    def steal_note(self, channel, note):
+        """Note off direto no canal do fluidsynth (roubo de voz): a nota
+        deixa de ser segurada por qualquer origem."""
+        self.fs.noteoff(channel, note)
+        mask = ~(1 << note)
+        self._active[channel] &= mask
+        self._seq_active[channel] &= mask
+        self._doubled[channel] &= mask
+
+    def release_sustained(self, channel, keep=0):
+        """O pedal soltou as notas sustentadas do canal, menos `keep`."""
+        self._sustained[channel] &= keep
+
+    def _swap_instruments(self, new_instruments, routes=None):
         # Swap atômico — seguro para leitores concorrentes (callback MIDI)
         self.instruments = new_instruments
-        self.sfid_map = new_sfid_map
+        self.sfid_map = {
+            name: inst['sfid'] for name, inst in new_instruments.items()
+        }
+        if routes is None:
+            self._rebuild_note_routes()
+        else:
+            self._note_routes = routes
+        self.voices.configure(new_instruments)
+        self.sustain.configure(new_instruments)
+        self._touch()
+
+    def _activate_plan(self, plan):
+        """Ativa um banco compilado. Só manda program_select/CC7 para canais
+        cujo estado difere do plano; as rotas de nota já vêm prontas."""
+        t0 = time.perf_counter_ns()
+        self._pin_soundfonts(plan.files)
+        new_instruments = {}
+        sent = 0
+        for name, template in plan.instruments:
+            instrument = self._instantiate(name, template)
+            if instrument is None:
+                continue
+            sent += self._program_instrument(name, instrument)
+            new_instruments[name] = instrument
+
+        complete = len(new_instruments) == len(plan.instruments)
+        routes = plan.routes if complete else None
+        self._swap_instruments(new_instruments, routes)
+        elapsed_us = (time.perf_counter_ns() - t0) // 1000
+        self._activation_timer.observe(elapsed_us)
+        self.loader.wake()
+        return elapsed_us, sent
+
+    def _activate_bank(self, bank_name):
+        plan = self._bank_plans.get(bank_name)
+        if plan is None:
+            # Config sem bancos: a lista 'instruments' legada
+            plan = self._compile_plan(
+                bank_name, self.cfg.get_active_instruments()
+            )
+        elapsed_us, sent = self._activate_plan(plan)
+        log.info('bank %s active in %.2f ms (%d channel messages)',
+                 bank_name, elapsed_us / 1000, sent)
+
+    def _activate_bank_instruments(self, instruments):
+        """Compila e ativa instrumentos que não estão nos bancos do config."""
+        self._activate_plan(self._compile_plan(None, instruments))
+
+    def apply_config_changes(self, changes, previous_bank):
+        """Aplica um diff de config (Config.reload) sem reativar o banco.
+
+        Instrumentos intocados mantêm o dict (e o volume atual); só canais
+        com soundfont/preset/canal alterado são reprogramados. Soundfonts que
+        nenhum banco usa mais são descarregados. Devolve True se a tabela de
+        CC do MidiBridge precisa ser recompilada."""
+        self._scan_banks()
+        self.loader.failed.difference_update(
+            path[1] for path, _, _ in changes
+            if path[0] == 'banks' and len(path) > 1
+        )
+        bank = self.cfg.get_active_bank()
+        prefix = ('banks', bank, 'instruments') if bank else ('instruments',)
+        depth = len(prefix)
+
+        inst_changes = {}
+        rebuild = bank != previous_bank
+        for path, _, _ in changes:
+            if path[:depth] != prefix:
+                continue
+            if len(path) == depth:
+                rebuild = True
+            else:
+                key = path[depth + 1] if len(path) > depth + 1 else None
+                inst_changes.setdefault(path[depth], set()).add(key)
+
+        if rebuild:
+            self._activate_bank(bank)
+            self._unload_unreferenced()
+            return True
+        if not inst_changes:
+            self._unload_unreferenced()
+            self.loader.wake()
+            return False
+
+        t0 = time.perf_counter_ns()
+        plan = self._bank_plans.get(bank)
+        if plan is None:
+            plan = self._compile_plan(bank, self.cfg.get_active_instruments())
+        self._pin_soundfonts(plan.files)
+        new_instruments = {}
+        cc_changed = False
+        for name, template in plan.instruments:
+            current = self.instruments.get(name)
+            keys = inst_changes.get(name, set())
+            if current is not None and not keys:
+                new_instruments[name] = current
+                continue
+            instrument = self._instantiate(name, template)
+            if instrument is None:
+                continue
+            new_instruments[name] = instrument
+            if current is None or not keys <= LIVE_INSTRUMENT_KEYS:
+                self._program_instrument(name, instrument)
+                cc_changed = True
+            elif 'initial_volume' in keys:
+                self._send_volume(instrument['channel'], instrument['volume'])
+            else:
+                instrument['volume'] = current['volume']
+            cc_changed = cc_changed or bool(keys & CC_INSTRUMENT_KEYS)
+
+        # Canais que ficaram sem instrumento param de soar
+        used = {inst['channel'] for inst in new_instruments.values()}
+        for name, inst in self.instruments.items():
+            if name not in new_instruments:
+                cc_changed = True
+                if inst['channel'] not in used:
+                    self.fs.cc(inst['channel'], 123, 0)
+
+        self._swap_instruments(new_instruments)
+        self._activation_timer.observe((time.perf_counter_ns() - t0) // 1000)
+        self._unload_unreferenced()
+        self.loader.wake()
+        return cc_changed
+
+    def _unload_unreferenced(self):
+        referenced = {
+            sf for files in self._bank_files_map.values() for sf in files
+        }
+        referenced.update(inst['sf'] for inst in self.instruments.values())
+        for path in list(self.soundfonts.sfids):
+            if path not in referenced:
+                log.info('unloading soundfont no longer in config: %s', path)
+                self.soundfonts.unload(path)
+
+    def _rebuild_note_routes(self):
+        """Recompila as rotas de nota a partir dos instrumentos atuais. Deve
+        ser chamado sempre que o conjunto de instrumentos audíveis mudar
+        (volume cruzando zero, reload)."""
+        # Swap atômico da tabela inteira
+        self._note_routes = compile_note_routes(self.instruments.values())
+
+    def _touch(self):
+        # next() no count é atômico: seguro a partir da thread MIDI e do HTTP
+        self.state_version = next(self._versions)
 
     def reload(self, config_data):
         """Recarrega instrumentos quando a configuração muda"""
-        log('[synth] reloading instruments...')
-        self._preload_all_soundfonts()
-        self._activate_bank_instruments(self.cfg.get_active_instruments())
-        log('[synth] instruments reloaded')
+        log.info('reloading instruments...')
+        self.loader.failed.clear()
+        self._scan_banks()
+        self._activate_bank(self.cfg.get_active_bank())
+        log.info('instruments reloaded')
 
     def switch_bank(self, bank_name):
         """Troca para outro banco de instrumentos (instantâneo!)"""
         if self.cfg.switch_bank(bank_name):
-            log(f'[synth] switching to bank: {bank_name}')
-            self._activate_bank_instruments(self.cfg.get_active_instruments())
-            log(f'[synth] bank switched: {bank_name}')
+            log.info('switching to bank: %s', bank_name)
+            self._activate_bank(bank_name)
             return True
         else:
-            log(f'[synth] bank not found: {bank_name}')
+            log.warn('bank not found: %s', bank_name)
             return False
 
     def next_bank(self):
         """Avança para o próximo banco"""
-        bank_name = self.cfg.next_bank()
+        bank_name = self.cfg.next_bank(self.bank_ready)
         if bank_name:
-            log(f'[synth] 🎹 Próximo banco: {bank_name}')
-            self._activate_bank_instruments(self.cfg.get_active_instruments())
+            log.info('🎹 Próximo banco: %s', bank_name)
+            self._activate_bank(bank_name)
             return bank_name
+        log.info('nenhum outro banco pronto ainda')
         return None
 
     def prev_bank(self):
         """Volta para o banco anterior"""
-        bank_name = self.cfg.prev_bank()
+        bank_name = self.cfg.prev_bank(self.bank_ready)
         if bank_name:
-            log(f'[synth] 🎹 Banco anterior: {bank_name}')
-            self._activate_bank_instruments(self.cfg.get_active_instruments())
+            log.info('🎹 Banco anterior: %s', bank_name)
+            self._activate_bank(bank_name)
             return bank_name
+        log.info('nenhum outro banco pronto ainda')
         return None
 
     def load_instruments(self, instruments):
         """Legacy method - redireciona para _activate_bank_instruments"""
         self._activate_bank_instruments(instruments)
 
-    def note_on(self, channel, note, vel):
-        for inst in self.instruments.values():
-            if inst['volume'] > 0:
-                if inst['min_note'] <= note <= inst['max_note']:
-                    self.fs.noteon(inst['channel'], note, vel)
-
-    def note_off(self, channel, note):
-        for inst in self.instruments.values():
-            if inst['volume'] > 0:
-                if inst['min_note'] <= note <= inst['max_note']:
-                    self.fs.noteoff(inst['channel'], note)
+    def note_on(self, channel, note, vel, source=KEYBOARD):
+        noteon = self.fs.noteon
+        active = self._active
+        targets = self._note_routes[channel][note]
+        if self.voices.active:
+            self.voices.admit(targets, vel)
+        if self._seq_holding or source != KEYBOARD:
+            self._claim(targets, vel, source)
+        complete = True
+        for ch, out_note, vel_map in targets:
+            out_vel = vel_map[vel]
+            if out_vel:
+                noteon(ch, out_note, out_vel)
+                active[ch] |= 1 << out_note
+            else:
+                complete = False
+        if not complete:
+            targets = tuple(t for t in targets if t[2][vel])
+        key = (channel << 7) | note
+        table = self._held[source]
+        held = table[key]
+        # Mesma tecla de novo sem note off: as duas rodadas ficam presas a ela
+        if held:
+            targets = held + tuple(t for t in targets if t not in held)
+        table[key] = targets
+
+    def note_off(self, channel, note, source=KEYBOARD):
+        key = (channel << 7) | note
+        table = self._held[source]
+        held = table[key]
+        if not held:
+            return
+        table[key] = None
+        if self._seq_holding or source != KEYBOARD:
+            held = self._unclaim(held, source)
+        noteoff = self.fs.noteoff
+        active = self._active
+        pedal = self.sustain.sustain_down
+        latched = self.sustain.latched
+        for ch, out_note, _ in held:
+            noteoff(ch, out_note)
+            bit = 1 << out_note
+            if active[ch] & bit:
+                active[ch] ^= bit
+                if pedal[ch] or latched[ch] & bit:
+                    self._sustained[ch] |= bit
+
+    def _claim(self, targets, vel, source):
+        """Antes do note on, com o sequenciador na jogada: marca as notas
+        dele e, em _doubled, as que passam a ser seguradas pelas duas
+        origens. Só o teclado sozinho fica fora (o caminho ao vivo)."""
+        active = self._active
+        seq = self._seq_active
+        doubled = self._doubled
+        keyboard = source == KEYBOARD
+        for ch, out_note, vel_map in targets:
+            if not vel_map[vel]:
+                continue
+            bit = 1 << out_note
+            if keyboard:
+                if seq[ch] & bit:
+                    doubled[ch] |= bit
+            else:
+                if active[ch] & ~seq[ch] & bit:
+                    doubled[ch] |= bit
+                seq[ch] |= bit
+        if not keyboard:
+            self._seq_holding = True
+
+    def _unclaim(self, held, source):
+        """Tira de `held` os alvos que a outra origem ainda segura: o note
+        off cortaria a tecla dela, e a nota sai no note off da outra."""
+        seq = self._seq_active
+        doubled = self._doubled
+        keyboard = source == KEYBOARD
+        remaining = []
+        for target in held:
+            ch = target[0]
+            bit = 1 << target[1]
+            if not keyboard:
+                seq[ch] &= ~bit
+            if doubled[ch] & bit:
+                doubled[ch] ^= bit
+            else:
+                remaining.append(target)
+        if not keyboard:
+            self._seq_holding = any(seq)
+        return remaining
 
     def send_cc(self, channel, ccnum, value):
         self.fs.cc(channel, ccnum, value)
+        if ccnum == 64 or ccnum == 66:
+            self.sustain.track(channel, ccnum, value)
+        elif ccnum == 7:
+            self._channel_volumes[channel] = value
+        elif ccnum == 120 or ccnum == 123:
+            self._release_channel_tracking(channel)
+
+    def apply_event(self, status, d1, d2, source=KEYBOARD):
+        """Aplica um evento de arquivo MIDI (render, sequenciador) com o mesmo
+        roteamento de notas do modo ao vivo; as notas e os CC64/66 usam o
+        rastreamento e o estado de pedal de `source` (ver SustainEngine).
+        Do sequenciador não passam os CCs de FILE_CC_DROPPED: o canal é o
+        mesmo do instrumento de quem está tocando."""
+        kind = status & 0xF0
+        if kind == 0x90 and d2 > 0:
+            self.note_on(status & 0x0F, d1, d2, source)
+        elif kind == 0x80 or kind == 0x90:
+            self.note_off(status & 0x0F, d1, source)
+        elif kind == 0xB0:
+            if d1 == 64:
+                self.sustain.pedal(d2, source)
+            elif d1 == 66:
+                self.sustain.sostenuto(d2, source)
+            elif source == KEYBOARD or d1 not in FILE_CC_DROPPED:
+                self.send_cc(status & 0x0F, d1, d2)
+        # Program change e pitch bend são ignorados, como no modo ao vivo:
+        # os presets vêm do banco
+
+    def _release_channel_tracking(self, channel):
+        self._active[channel] = 0
+        self._sustained[channel] = 0
+        self.sustain.forget_latched(channel)
+        self._seq_active[channel] = 0
+        self._doubled[channel] = 0
+        self._seq_holding = any(self._seq_active)
+        for held in self._held.values():
+            for key, targets in enumerate(held):
+                if targets and any(t[0] == channel for t in targets):
+                    remaining = tuple(t for t in targets if t[0] != channel)
+                    held[key] = remaining or None
+
+    def channel_notes(self):
+        """Notas seguradas e sustentadas por canal (só canais com notas)."""
+        return {
+            ch: {'held': bin(self._active[ch]).count('1'),
+                 'sustained': bin(self._sustained[ch]).count('1')}
+            for ch in range(MIDI_CHANNELS)
+            if self._active[ch] or self._sustained[ch]
+        }
 
     def set_instrument_volume(self, name, value):
         if name not in self.instruments:
             return
-        ch = self.instruments[name]['channel']
-        self.fs.cc(ch, 7, int(value))
-        self.instruments[name]['volume'] = int(value)
+        inst = self.instruments[name]
+        value = int(value)
+        self._send_volume(inst['channel'], value)
+        was_audible = inst['volume'] > 0
+        inst['volume'] = value
+        if was_audible != (value > 0):
+            self._rebuild_note_routes()
+        self._touch()
 
     def panic(self):
-        """Para TODOS os sons imediatamente (All Notes Off + All Sound Off)"""
-        log('[synth] PANIC! Stopping all sounds...')
-        for channel in range(16):
+        """Para todos os sons imediatamente (All Notes Off + All Sound Off).
+
+        Só vão mensagens para canais com notas rastreadas ou com instrumento
+        ativo (caudas de release não aparecem no rastreamento); canais sem
+        uso ficam de fora."""
+        log.info('PANIC! Stopping all sounds...')
+        channels = {ch for ch in range(MIDI_CHANNELS)
+                    if self._active[ch] or self._sustained[ch]}
+        channels.update(inst['channel'] for inst in self.instruments.values())
+        for channel in sorted(channels):
             self.fs.cc(channel, 123, 0)
             self.fs.cc(channel, 120, 0)
-        log('[synth] All sounds stopped')
+        self.forget_notes()
+        log.info('All sounds stopped (%d channels)', len(channels))
+
+    def _collect_metrics(self):
+        pool = self.soundfonts.status()
+        banks = [b.get('name') for b in self.cfg.data.get('banks', [])]
+        pedals = self.sustain.status()
+        out = [
+            ('synth_active_voices', 'gauge', 'Vozes ativas no fluidsynth',
+             [({}, self.fs.get_active_voice_count())]),
+            ('synth_instrument_volume', 'gauge',
+             'Volume (CC7) por instrumento',
+             [({'instrument': n}, i['volume'])
+              for n, i in self.instruments.items()]),
+            ('soundfont_resident_bytes', 'gauge', 'Bytes de sample residentes',
+             [({}, pool['resident_bytes'])]),
+            ('soundfont_budget_bytes', 'gauge',
+             'Orçamento de memória (0 = sem limite)',
+             [({}, pool['budget_bytes'])]),
+            ('soundfont_resident', 'gauge', 'Soundfonts residentes',
+             [({}, len(pool['resident']))]),
+            ('soundfont_events_total', 'counter',
+             'Eventos do pool de soundfonts',
+             [({'event': k}, pool[k])
+              for k in ('loads', 'hits', 'evictions', 'failures')]),
+            ('synth_channel_notes', 'gauge',
+             'Notas seguradas ou sustentadas pelo pedal por canal',
+             [({'channel': str(ch), 'state': state}, n)
+              for ch, counts in self.channel_notes().items()
+              for state, n in counts.items()]),
+            ('synth_channel_messages_total', 'counter',
+             'program_select/CC7 enviados ou evitados (estado igual) '
+             'ao ativar bancos',
+             [({'kind': k}, v) for k, v in self.channel_messages.items()]),
+            ('synth_voice_budget', 'gauge',
+             'Vozes do fluidsynth a partir das quais camadas de baixa '
+             'prioridade são soltas',
+             [({}, self.voices.threshold)]),
+            ('synth_voices_stolen_total', 'counter',
+             'Notas soltas pelo orçamento de vozes',
+             [({'instrument': n, 'reason': r},
+               self.voices.stolen[r][i['channel']])
+              for n, i in self.instruments.items()
+              for r in ('limit', 'budget')]),
+            ('process_cpu_percent', 'gauge',
+             'CPU do processo (todas as threads)',
+             [({}, self.voices.cpu_percent())]),
+            ('synth_sustained_notes', 'gauge',
+             'Notas soltas que ainda soam pelo sustain/sostenuto',
+             [({'instrument': n}, st['sustained'])
+              for n, st in pedals.items()]),
+            ('synth_pedal_down', 'gauge',
+             'Pedal abaixado (1) ou não (0) por instrumento',
+             [({'instrument': n, 'pedal': p}, int(st[p]))
+              for n, st in pedals.items()
+              for p in ('sustain', 'sostenuto')]),
+            ('synth_pedal_messages_total', 'counter',
+             'Mensagens de pedal enviadas ou suprimidas (estado igual) '
+             'por canal',
+             [({'pedal': p, 'result': r}, v)
+              for (p, r), v in self.sustain.messages.items()]),
+            ('bank_ready', 'gauge', 'Banco pronto para tocar (1) ou não (0)',
+             [({'bank': b}, int(self.bank_ready(b))) for b in banks]),
+        ]
+        if self.shard_count > 1:
+            shards = self.fs.stats()
+            out += [
+                ('synth_shard_voices', 'gauge',
+                 'Vozes ativas por shard do fluidsynth',
+                 [({'shard': str(st['shard'])}, st['voices'])
+                  for st in shards]),
+                ('synth_shard_cpu_load', 'gauge',
+                 'Carga de CPU do fluidsynth por shard (%)',
+                 [({'shard': str(st['shard'])}, st['cpu_load'])
+                  for st in shards if st['cpu_load'] is not None]),
+                ('synth_shard_channels', 'gauge',
+                 'Canais atribuídos a cada shard',
+                 [({'shard': str(st['shard'])}, len(st['channels']))
+                  for st in shards]),
+                ('synth_shard_lazy_loads_total', 'counter',
+                 'Soundfonts carregados sob demanda num shard fora do '
+                 'planejado',
+                 [({}, self.fs.lazy_loads)]),
+            ]
+        return out
+
+    def shard_status(self):
+        """Shards do fluidsynth com canais, instrumentos, vozes e carga."""
+        if self.shard_count == 1:
+            return []
+        names = {
+            inst['channel']: name for name, inst in self.instruments.items()
+        }
+        return [
+            dict(st, instruments=[
+                names[ch] for ch in st['channels'] if ch in names
+            ])
+            for st in self.fs.stats()
+        ]
 
     def get_instruments_status(self):
         out = {}
@@ -233,57 +985,33 @@ class SynthModule:
             return []
 
         file_path = self.instruments[name]['sf']
-        if file_path in self.preset_cache:
-            return self.preset_cache[file_path]
-
         if not os.path.exists(file_path):
             return []
-
-        presets = self.read_presets_from_sf(file_path)
-        self.preset_cache[file_path] = presets
-        return presets
+        return self._presets_for(file_path)
 
     def set_preset(self, name, preset_number):
+        """Seleciona outro preset do mesmo soundfont; devolve o nome dele."""
         inst = self.instruments.get(name)
         if not inst:
-            return
+            return None
 
         ch = inst["channel"]
         bank = inst.get("bank", 0)
 
         self.fs.program_select(ch, inst["sfid"], bank, preset_number)
+        self._channel_programs[ch] = (inst["sfid"], bank, preset_number)
+        preset_name = next(
+            (p['name'] for p in self._presets_for(inst['sf'])
+             if p['preset'] == preset_number),
+            "Desconhecido"
+        )
+        inst['preset'] = preset_number
+        inst['preset_name'] = preset_name
+        self._touch()
+        return preset_name
 
     def read_presets_from_sf(self, sf_path):
-        """Lê presets de um arquivo SF2 usando API do FluidSynth."""
-        presets = []
-        
-        # Usa o sfid já carregado ou carrega temporariamente
-        if sf_path in self.sfid_cache:
-            sfid = self.sfid_cache[sf_path]
-        else:
-            if not os.path.exists(sf_path):
-                return presets
-            try:
-                sfid = self.fs.sfload(sf_path)
-            except Exception as e:
-                log(f"[warn] Erro ao carregar {sf_path}: {e}")
-                return presets
-
-        try:
-            for bank in range(128):
-                for prog in range(128):
-                    try:
-                        preset_name = self.fs.sfpreset_name(sfid, bank, prog)
-                        if preset_name:
-                            presets.append({
-                                'bank': bank,
-                                'preset': prog,
-                                'name': preset_name
-                            })
-                    except:
-                        # Preset não existe ou método não disponível
-                        pass
-        except Exception as e:
-            log(f"[warn] Erro ao listar presets de {sf_path}: {e}")
-        
-        return presets
+        """Lê presets de um SF2 via índice persistente.
+        O arquivo só é aberto se a entrada do índice estiver desatualizada."""
+        entry = self.preset_index.get(sf_path)
+        return entry['presets'] if entry else []
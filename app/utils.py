@@ -1,13 +1,23 @@
-import time
+import os
 import re
+from .logs import get_logger
 
-GLOBAL_DEBUG = True
+_app_log = get_logger('app')
 
 
-def log(msg):
-    if GLOBAL_DEBUG:
-        ts = time.strftime('%Y-%m-%d %H:%M:%S')
-        print(f"[{ts}] {msg}")
+def log(msg, *args):
+    """Compatibilidade: prefira get_logger(subsistema) de app.logs."""
+    _app_log.info(msg, *args)
+
+
+def file_version(path):
+    """(tamanho, mtime_ns) do arquivo, ou None se não existir; muda quando
+    o arquivo é substituído no disco."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
 
 
 def note_to_midi(note_str):
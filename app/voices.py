@@ -0,0 +1,215 @@
+"""
+Orçamento de vozes com prioridade por instrumento.
+
+O fluidsynth rouba vozes quando synth.polyphony estoura, sem saber qual
+camada importa. Aqui cada instrumento pode ter `priority` (maior = mais
+importante) e `max_voices` (notas simultâneas, seguradas ou no pedal):
+
+- ao passar de max_voices, a nota mais antiga do próprio instrumento sai;
+- quando as vozes ativas do fluidsynth chegam a `headroom` x polyphony,
+  a camada de menor prioridade (abaixo da nota que está entrando) é solta
+  primeiro: primeiro as notas que só soam pelo pedal, depois a mais antiga.
+
+Notas no pedal não podem ser soltas uma a uma; o canal recebe CC64 0/127,
+o que solta as sustentadas e mantém o pedal para as próximas notas. O
+mesmo vale para a nota segurada roubada com o pedal abaixado (o note off
+sozinho a deixaria soando no pedal); notas presas pelo sostenuto saem com
+CC66 0/127. Os
+canais com prioridade > 0 também vão para synth.overflow.important-channels,
+como reforço para o roubo de vozes do próprio fluidsynth.
+"""
+
+import time
+from collections import deque
+from .logs import get_logger
+
+log = get_logger('voices')
+
+MIDI_CHANNELS = 16
+
+
+def _popcount(bits):
+    return bin(bits).count('1')
+
+
+class VoiceBudget:
+    def __init__(self, synth, polyphony, headroom=0.85):
+        self.synth = synth
+        self.polyphony = int(polyphony)
+        self.headroom = float(headroom)
+        self.threshold = 0
+        if self.polyphony:
+            self.threshold = int(self.polyphony * self.headroom)
+        self.active = False
+        self.names = [None] * MIDI_CHANNELS
+        self.priority = [0] * MIDI_CHANNELS
+        self.limit = [0] * MIDI_CHANNELS
+        self.stolen = {
+            'limit': [0] * MIDI_CHANNELS, 'budget': [0] * MIDI_CHANNELS,
+        }
+        self._order = [deque() for _ in range(MIDI_CHANNELS)]
+        self._cpu = (time.monotonic(), time.process_time(), 0.0)
+
+    def configure(self, instruments):
+        """Lê priority/max_voices dos instrumentos ativos (por canal)."""
+        names = [None] * MIDI_CHANNELS
+        priority = [0] * MIDI_CHANNELS
+        limit = [0] * MIDI_CHANNELS
+        for name, inst in instruments.items():
+            ch = inst['channel']
+            names[ch] = name
+            priority[ch] = inst.get('priority', 0)
+            limit[ch] = inst.get('max_voices') or 0
+        self.names, self.priority, self.limit = names, priority, limit
+        ranked = self.threshold and len(set(priority)) > 1
+        self.active = bool(any(limit) or ranked)
+
+        important = ','.join(
+            str(ch) for ch in range(MIDI_CHANNELS) if priority[ch] > 0
+        )
+        try:
+            self.synth.fs.setting(
+                'synth.overflow.important-channels', important
+            )
+        except Exception as e:
+            log.debug('synth.overflow.important-channels indisponível: %s', e)
+
+    def forget(self):
+        for order in self._order:
+            order.clear()
+
+    def _notes(self, ch):
+        return _popcount(self.synth._active[ch] | self.synth._sustained[ch])
+
+    def admit(self, targets, vel):
+        """Chamado por note_on antes de tocar `targets`; abre espaço."""
+        top = -1
+        for ch, out_note, vel_map in targets:
+            if not vel_map[vel]:
+                continue
+            if self.limit[ch] and self._notes(ch) >= self.limit[ch]:
+                self._steal(ch, 'limit')
+            order = self._order[ch]
+            order.append(out_note)
+            if len(order) > 256:
+                # Notas soltas continuam na fila; limpa de vez em quando
+                live = self.synth._active[ch]
+                self._order[ch] = deque(n for n in order if live >> n & 1)
+            if self.priority[ch] > top:
+                top = self.priority[ch]
+
+        if (self.threshold and top >= 0
+                and self.synth.fs.get_active_voice_count() >= self.threshold):
+            victim = self._lowest_below(top)
+            if victim is not None:
+                self._steal(victim, 'budget')
+
+    def _lowest_below(self, priority):
+        best = None
+        for ch in range(MIDI_CHANNELS):
+            if self.priority[ch] >= priority:
+                continue
+            if not (self.synth._active[ch] or self.synth._sustained[ch]):
+                continue
+            if best is None or self.priority[ch] < self.priority[best]:
+                best = ch
+        return best
+
+    def _steal(self, ch, reason):
+        synth = self.synth
+        fs = synth.fs
+        pedal = synth.sustain.sustain_down[ch]
+        latched = synth.sustain.latched[ch]
+        pedaled = synth._sustained[ch] & ~latched
+        if pedaled and pedal:
+            # Solta tudo o que só soa pelo pedal e mantém o pedal abaixado;
+            # notas presas pelo sostenuto ficam
+            fs.cc(ch, 64, 0)
+            fs.cc(ch, 64, 127)
+            synth._sustained[ch] ^= pedaled
+            self.stolen[reason][ch] += _popcount(pedaled)
+            return
+
+        note = self._oldest(ch)
+        if note is not None:
+            bit = 1 << note
+            synth.steal_note(ch, note)
+            self.stolen[reason][ch] += 1
+            if latched & bit:
+                self._release_latched(ch, reason)
+            elif pedal:
+                # Com o pedal abaixado o note off só passaria a nota para o
+                # pedal; é a única nota nele, então CC64 0/127 solta só ela
+                fs.cc(ch, 64, 0)
+                fs.cc(ch, 64, 127)
+        elif synth._sustained[ch]:
+            # Só restam notas soltas presas pelo sostenuto
+            self._release_latched(ch, reason)
+
+    def _oldest(self, ch):
+        """Nota segurada mais antiga do canal; as presas pelo sostenuto só
+        se não houver outra. Sai da fila de ordem."""
+        order = self._order[ch]
+        active = self.synth._active[ch]
+        latched = self.synth.sustain.latched[ch]
+        while order and not active >> order[0] & 1:
+            order.popleft()
+        fallback = None
+        for note in order:
+            if not active >> note & 1:
+                continue
+            if not latched >> note & 1:
+                order.remove(note)
+                return note
+            if fallback is None:
+                fallback = note
+        if fallback is not None:
+            order.remove(fallback)
+        return fallback
+
+    def _release_latched(self, ch, reason):
+        """Solta as notas presas pelo sostenuto que não estão seguradas:
+        CC66 0/127 (com o sustain abaixado, CC64 0/127 no meio para elas
+        não passarem para o pedal). As seguradas voltam a ficar presas."""
+        synth = self.synth
+        fs = synth.fs
+        freed = synth._sustained[ch]
+        fs.cc(ch, 66, 0)
+        if synth.sustain.sustain_down[ch]:
+            fs.cc(ch, 64, 0)
+            fs.cc(ch, 64, 127)
+        fs.cc(ch, 66, 127)
+        synth.release_sustained(ch)
+        synth.sustain.relatch(ch)
+        self.stolen[reason][ch] += _popcount(freed)
+
+    def cpu_percent(self):
+        """CPU do processo (todas as threads, inclui o render do fluidsynth)
+        desde a última medição, recalculada no máximo a cada 0,5 s."""
+        wall, cpu, pct = self._cpu
+        now, now_cpu = time.monotonic(), time.process_time()
+        if now - wall >= 0.5:
+            pct = round(100.0 * (now_cpu - cpu) / (now - wall), 1)
+            self._cpu = (now, now_cpu, pct)
+        return pct
+
+    def status(self):
+        synth = self.synth
+        return {
+            'polyphony': self.polyphony,
+            'headroom': self.headroom,
+            'threshold': self.threshold,
+            'active_voices': synth.fs.get_active_voice_count(),
+            'cpu_percent': self.cpu_percent(),
+            'instruments': {
+                self.names[ch]: {
+                    'channel': ch,
+                    'priority': self.priority[ch],
+                    'max_voices': self.limit[ch],
+                    'notes': self._notes(ch),
+                    'stolen_limit': self.stolen['limit'][ch],
+                    'stolen_budget': self.stolen['budget'][ch],
+                }
+                for ch in range(MIDI_CHANNELS) if self.names[ch] is not None
+            },
+        }
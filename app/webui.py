@@ -1,8 +1,96 @@
-from flask import Flask, jsonify, request, render_template
+import hashlib
+import json
+from flask import (
+    Flask, Response, jsonify, request, render_template, stream_with_context,
+)
+from . import logs
+from .live import StateStream
+from .metrics import registry
+from .utils import file_version
 
+log = logs.get_logger('http')
 
-def create_app(synth):
+
+class _JSONCache:
+    """JSON pré-serializado por chave, refeito só quando a versão muda."""
+
+    def __init__(self):
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version, build):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            body = json.dumps(build(), separators=(',', ':'),
+                              ensure_ascii=False).encode('utf-8')
+            etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+            entry = self._entries[key] = (version, body, etag)
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+
+def create_app(synth, sequencer=None, recorder=None):
     app = Flask(__name__, template_folder="templates")
+    cache = _JSONCache()
+
+    def cached_json(key, version, build):
+        """Resposta com ETag; 304 se o cliente já tem essa versão."""
+        _, body, etag = cache.get(key, version, build)
+        resp = Response(body, mimetype='application/json')
+        resp.set_etag(etag)
+        resp.headers['Cache-Control'] = 'no-cache'
+        return resp.make_conditional(request)
+
+    http_cfg = synth.cfg.data.get('http', {})
+    events_cfg = http_cfg.get('events', {})
+    stream = StateStream(
+        synth,
+        fps=events_cfg.get('fps', 10),
+        metrics_interval=events_cfg.get('metrics_interval', 1.0),
+        keepalive=events_cfg.get('keepalive', 15.0),
+        sequencer=sequencer,
+        recorder=recorder,
+    )
+    stream.start()
+    app.extensions['state_stream'] = stream
+    # Cada cliente /events prende um worker do pool enquanto está conectado;
+    # sobra pelo menos um para o resto da UI
+    workers = http_cfg.get('workers', 4)
+    max_stream_clients = events_cfg.get('max_clients', workers - 1)
+    if http_cfg.get('server', 'pooled') != 'development':
+        if max_stream_clients > workers - 1:
+            log.warn('http.events.max_clients = %d com %d workers; '
+                     'limitado a %d', max_stream_clients, workers,
+                     max(workers - 1, 0))
+            max_stream_clients = max(workers - 1, 0)
+
+    def collect_metrics():
+        out = [
+            ('ui_event_clients', 'gauge', 'Clientes conectados em /events',
+             [({}, stream.stats()['clients'])]),
+            ('ui_event_frames_total', 'counter', 'Diffs de estado publicados',
+             [({}, stream.frames)]),
+            ('ui_event_resyncs_total', 'counter',
+             'Snapshots completos por fila cheia',
+             [({}, stream.resyncs)]),
+            ('http_json_cache_total', 'counter',
+             'Respostas JSON servidas do cache ou refeitas',
+             [({'result': 'hit'}, cache.hits),
+              ({'result': 'miss'}, cache.misses)]),
+        ]
+        server = app.extensions.get('http_server')
+        if server:
+            st = server.stats()
+            out.append(('http_requests_total', 'counter',
+                        'Conexões HTTP atendidas ou recusadas (503)',
+                        [({'result': 'served'}, st['served']),
+                         ({'result': 'rejected'}, st['rejected'])]))
+        return out
+
+    registry.register('ui', collect_metrics)
 
     @app.route('/')
     def index():
@@ -28,8 +116,19 @@ def create_app(synth):
 
     @app.route('/banks')
     def list_banks():
-        """Lista todos os banks disponíveis"""
-        return jsonify(synth.cfg.list_banks())
+        """Lista todos os banks disponíveis, com o estado de carga"""
+        banks = synth.cfg.list_banks()
+        states = tuple(synth.bank_state(bank['name']) for bank in banks)
+        return cached_json(
+            'banks', (synth.state_version, states),
+            lambda: [dict(bank, state=state)
+                     for bank, state in zip(banks, states)],
+        )
+
+    @app.route('/state')
+    def state():
+        """Banco ativo e mixer (o mesmo formato do snapshot de /events)"""
+        return cached_json('state', synth.state_version, stream.mixer_state)
 
     @app.route('/switch_bank', methods=['POST'])
     def switch_bank():
@@ -57,9 +156,108 @@ def create_app(synth):
         synth.panic()
         return jsonify({"ok": True})
 
+    @app.route('/events')
+    def events():
+        """Server-Sent Events: snapshot inicial e diffs do mixer"""
+        # Cada cliente ocupa um worker HTTP enquanto está conectado
+        if stream.stats()['clients'] >= max_stream_clients:
+            error = "too many live clients"
+            return jsonify({"ok": False, "error": error}), 503
+        return Response(
+            stream_with_context(stream.events()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        )
+
+    @app.route('/soundfonts')
+    def soundfonts():
+        """Residência de soundfonts: orçamento, residentes e contadores"""
+        return jsonify(synth.soundfonts.status())
+
+    @app.route('/sequencer')
+    def sequencer_status():
+        """Estado do sequenciador: arquivo, posição, erro de timing"""
+        if sequencer is None:
+            return jsonify({"ok": False, "error": "sequencer disabled"}), 404
+        return jsonify(dict(sequencer.status(), files=sequencer.list_files()))
+
+    @app.route('/sequencer/<command>', methods=['POST'])
+    def sequencer_command(command):
+        """Transporte: load {"file": ...}, play, pause, stop"""
+        if sequencer is None:
+            return jsonify({"ok": False, "error": "sequencer disabled"}), 404
+        if command == 'load':
+            try:
+                sequencer.load((request.json or {}).get('file'))
+            except FileNotFoundError as e:
+                return jsonify({"ok": False, "error": str(e)}), 404
+            except ValueError as e:
+                return jsonify({"ok": False, "error": str(e)}), 400
+            return jsonify({"ok": True, "state": sequencer.status()})
+        if command not in ('play', 'pause', 'stop'):
+            return jsonify({"ok": False, "error": "unknown command"}), 404
+        changed = getattr(sequencer, command)()
+        return jsonify({"ok": changed, "state": sequencer.status()})
+
+    @app.route('/recorder')
+    def recorder_status():
+        """Gravação em andamento e arquivos já gravados"""
+        if recorder is None:
+            return jsonify({"ok": False, "error": "recorder disabled"}), 404
+        return jsonify(dict(recorder.status(), files=recorder.list_files()))
+
+    @app.route('/recorder/<command>', methods=['POST'])
+    def recorder_command(command):
+        """start, stop ou toggle"""
+        if recorder is None:
+            return jsonify({"ok": False, "error": "recorder disabled"}), 404
+        if command not in ('start', 'stop', 'toggle'):
+            return jsonify({"ok": False, "error": "unknown command"}), 404
+        try:
+            changed = getattr(recorder, command)()
+        except OSError as e:
+            return jsonify({"ok": False, "error": str(e)}), 500
+        return jsonify({"ok": changed, "state": recorder.status()})
+
+    @app.route('/voices')
+    def voices():
+        """Orçamento de vozes: limites, prioridades e notas soltas"""
+        return jsonify(dict(synth.voices.status(),
+                            shards=synth.shard_status()))
+
+    @app.route('/metrics')
+    def metrics():
+        """Métricas no formato texto do Prometheus"""
+        return Response(registry.render(),
+                        mimetype='text/plain; version=0.0.4')
+
+    @app.route('/log_levels', methods=['GET', 'POST'])
+    def log_levels():
+        """Níveis de log por subsistema; POST {"midi": "debug", "*": "info"}"""
+        if request.method == 'POST':
+            payload = request.json or {}
+            if not isinstance(payload, dict):
+                return jsonify({"ok": False,
+                                "error": "expected {subsystem: level}"}), 400
+            try:
+                # '*' primeiro, para não sobrescrever os subsistemas do POST
+                changes = sorted(payload.items(),
+                                 key=lambda kv: kv[0] != '*')
+                for name, level in changes:
+                    logs.set_level(name, level)
+            except ValueError as e:
+                return jsonify({"ok": False, "error": str(e)}), 400
+        return jsonify(logs.levels())
+
     @app.route('/presets/<inst>')
     def list_presets(inst):
-        return jsonify(synth.list_presets(inst))
+        instrument = synth.instruments.get(inst)
+        if not instrument:
+            return jsonify([])
+        # Refeito se o SF2 for substituído no disco
+        sf = instrument['sf']
+        return cached_json(('presets', sf), file_version(sf),
+                           lambda: synth.list_presets(inst))
 
 
     @app.route('/set_preset', methods=['POST'])
@@ -67,18 +265,7 @@ def create_app(synth):
         payload = request.json or {}
         name = payload.get("instrument")
         preset_number = int(payload.get("preset", 0))
-        synth.set_preset(name, preset_number)
-        inst = synth.instruments.get(name)
-        if inst:
-            file_path = inst['sf']
-            preset_list = synth.preset_cache.get(file_path, [])
-            preset_entry = next((p for p in preset_list if p["preset"] == preset_number), None)
-            preset_name = preset_entry["name"] if preset_entry else "Desconhecido"
-            
-            inst["preset"] = preset_number
-            inst["preset_name"] = preset_name
-        else:
-            preset_name = "Desconhecido"
+        preset_name = synth.set_preset(name, preset_number) or "Desconhecido"
         return jsonify({
             "ok": True,
             "preset_name": preset_name
@@ -0,0 +1,104 @@
+"""diff_config: bancos e instrumentos casados pelo nome, e Config.reload."""
+
+import copy
+
+import yaml
+
+from app import config as config_mod
+from app.config import Config, diff_config
+
+BASE = {
+    'active_bank': 'Live',
+    'banks': [
+        {'name': 'Live', 'instruments': [
+            {'name': 'Piano', 'channel': 0, 'preset': 3},
+            {'name': 'Pad', 'channel': 1, 'preset': 0},
+        ]},
+        {'name': 'Studio', 'instruments': [
+            {'name': 'Organ', 'channel': 0, 'preset': 16},
+        ]},
+    ],
+    'midi': {'cc_map': {64: 'sustain'}},
+}
+
+
+def edited():
+    return copy.deepcopy(BASE)
+
+
+def test_reordering_is_not_a_change():
+    new = edited()
+    new['banks'].reverse()
+    new['banks'][1]['instruments'].reverse()
+    assert diff_config(BASE, new) == []
+
+
+def test_instrument_matched_by_name():
+    new = edited()
+    live = new['banks'][0]['instruments']
+    live.reverse()
+    live[0]['preset'] = 5  # Pad, agora o primeiro da lista
+    assert diff_config(BASE, new) == [
+        (('banks', 'Live', 'instruments', 'Pad', 'preset'), 0, 5),
+    ]
+
+
+def test_instrument_added_and_removed():
+    new = edited()
+    live = new['banks'][0]['instruments']
+    piano = live.pop(0)
+    live.append({'name': 'Bass', 'channel': 2})
+    assert diff_config(BASE, new) == [
+        (('banks', 'Live', 'instruments', 'Piano'), piano, None),
+        (('banks', 'Live', 'instruments', 'Bass'), None, live[-1]),
+    ]
+
+
+def test_renamed_bank_is_removed_and_added():
+    new = edited()
+    new['banks'][1]['name'] = 'Home'
+    paths = [(path, old is None, value is None)
+             for path, old, value in diff_config(BASE, new)]
+    assert paths == [
+        (('banks', 'Studio'), False, True),
+        (('banks', 'Home'), True, False),
+    ]
+
+
+def test_emptied_list_is_a_single_change():
+    new = edited()
+    new['banks'][1]['instruments'] = []
+    assert diff_config(BASE, new) == [
+        (('banks', 'Studio', 'instruments'),
+         BASE['banks'][1]['instruments'], []),
+    ]
+
+
+def test_reload_keeps_runtime_bank(tmp_path, monkeypatch):
+    path = tmp_path / 'config.yaml'
+    path.write_text(yaml.safe_dump(BASE))
+    monkeypatch.setattr(config_mod, 'CFG_FILE', str(path))
+    cfg = Config()
+    cfg.switch_bank('Studio')
+
+    new = edited()
+    new['banks'][1]['instruments'][0]['preset'] = 17
+    path.write_text(yaml.safe_dump(new))
+    changes = cfg.reload()
+
+    assert changes == [
+        (('banks', 'Studio', 'instruments', 'Organ', 'preset'), 16, 17),
+    ]
+    assert cfg.get_active_bank() == 'Studio'
+
+    new['active_bank'] = 'Live'  # sem mudança no arquivo: o banco fica
+    new['banks'][0]['instruments'][0]['preset'] = 4
+    path.write_text(yaml.safe_dump(new))
+    cfg.reload()
+    assert cfg.get_active_bank() == 'Studio'
+
+    cfg.switch_bank('Live')
+    new['active_bank'] = 'Studio'  # mudou no arquivo: o arquivo vale
+    path.write_text(yaml.safe_dump(new))
+    cfg.reload()
+    assert cfg.get_active_bank() == 'Studio'
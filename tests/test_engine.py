@@ -0,0 +1,49 @@
+"""ShmEventRing: ordem, ring cheio, faixa dos valores e slots pendentes."""
+
+import pytest
+
+from app.engine import _SEQ, EVENT, ShmEventRing
+
+
+@pytest.fixture
+def ring():
+    ring = ShmEventRing(4)
+    yield ring
+    ring.close(unlink=True)
+
+
+def test_push_pop_in_order(ring):
+    for note in range(60, 63):
+        ring.push(EVENT, 0x90, note, 100)
+    events = ring.pop_all()
+    expected = [(EVENT, 0x90, n, 100) for n in (60, 61, 62)]
+    assert [e[1:] for e in events] == expected
+    assert ring.empty()
+
+
+def test_full_ring_drops_and_counts(ring):
+    for note in range(6):
+        ring.push(EVENT, 0x90, note, 100)
+    assert ring.overflows == 2
+    assert [e[3] for e in ring.pop_all()] == [0, 1, 2, 3]
+    # Depois de dar a volta, as sequências antigas não valem para os slots
+    for note in range(6):
+        ring.push(EVENT, 0x80, note, 0)
+    assert [e[3] for e in ring.pop_all()] == [0, 1, 2, 3]
+
+
+def test_value_out_of_range(ring):
+    with pytest.raises(ValueError):
+        ring.push(EVENT, 0xB0, 7, 300)
+    assert ring.empty()
+
+
+def test_unpublished_slot_waits(ring):
+    ring.push(EVENT, 0x90, 60, 100)
+    ring.push(EVENT, 0x90, 61, 100)
+    # head já avançou, mas a sequência do segundo slot ainda não chegou
+    ring._seqs[1 * 4 + _SEQ] = 0
+    assert [e[3] for e in ring.pop_all()] == [60]
+    assert ring.queued() == 1
+    ring._seqs[1 * 4 + _SEQ] = 0x80000001
+    assert [e[3] for e in ring.pop_all()] == [61]
@@ -0,0 +1,155 @@
+"""read_smf sobre arquivos montados à mão e ida e volta com o SMFWriter."""
+
+import struct
+
+import pytest
+
+from app.smf import SMFError, SMFWriter, read_smf
+
+
+def _track(data):
+    return b'MTrk' + struct.pack('>I', len(data)) + data
+
+
+def _smf(path, fmt, division, *tracks):
+    header = b'MThd' + struct.pack('>IHHH', 6, fmt, len(tracks), division)
+    path.write_bytes(header + b''.join(_track(t) for t in tracks))
+    return str(path)
+
+
+def test_tempo_map_and_running_status(tmp_path):
+    # Trilha de andamento: 120 BPM, e 240 BPM a partir do tick 480
+    tempo = (
+        b'\x00\xff\x51\x03' + (500000).to_bytes(3, 'big')
+        + b'\x83\x60\xff\x51\x03' + (250000).to_bytes(3, 'big')
+        + b'\x00\xff\x2f\x00'
+    )
+    notes = (
+        b'\x00\x90\x3c\x64'  # note on 60
+        + b'\x83\x60\x3c\x00'  # running status: note on 60 vel 0 no tick 480
+        + b'\x00\xf0\x03\x7e\x7f\xf7'  # SysEx cancela o running status
+        + b'\x00\xc1\x05'  # program change: um byte de dados
+        + b'\x83\x60\xb0\x40\x7f'  # CC64 no tick 960
+        + b'\x00\xff\x2f\x00'
+    )
+    events, length = read_smf(_smf(tmp_path / 'a.mid', 1, 480, tempo, notes))
+
+    assert events == [
+        (0.0, 0x90, 60, 100),
+        (0.5, 0x90, 60, 0),
+        (0.5, 0xC1, 5, 0),
+        (0.75, 0xB0, 64, 127),
+    ]
+    assert length == 0.75
+
+
+def test_events_from_tracks_are_merged_in_order(tmp_path):
+    first = b'\x00\x90\x3c\x64\x81\x70\x80\x3c\x00\x00\xff\x2f\x00'
+    second = b'\x78\x91\x40\x64\x00\xff\x2f\x00'
+    events, _ = read_smf(_smf(tmp_path / 'b.mid', 1, 480, first, second))
+    assert [(st, d1) for _, st, d1, _ in events] == [
+        (0x90, 60), (0x91, 64), (0x80, 60),
+    ]
+
+
+def test_running_status_without_status(tmp_path):
+    path = _smf(tmp_path / 'c.mid', 0, 480, b'\x00\x3c\x64\x00\xff\x2f\x00')
+    with pytest.raises(SMFError):
+        read_smf(path)
+
+
+def test_not_a_midi_file(tmp_path):
+    path = tmp_path / 'd.mid'
+    path.write_bytes(b'RIFF\x00\x00\x00\x00')
+    with pytest.raises(SMFError):
+        read_smf(str(path))
+
+
+def test_truncated_file_raises_smf_error(tmp_path):
+    # Cortado no meio de cada evento: nada de IndexError/struct.error
+    notes = (
+        b'\x00\xff\x51\x03' + (500000).to_bytes(3, 'big')
+        + b'\x00\xf0\x03\x7e\x7f\xf7'
+        + b'\x00\x90\x3c\x64\x83\x60\x80\x3c\x00\x00\xff\x2f\x00'
+    )
+    data = open(_smf(tmp_path / 'full.mid', 0, 480, notes), 'rb').read()
+    path = tmp_path / 'cut.mid'
+    for size in range(4, len(data)):
+        path.write_bytes(data[:size])
+        try:
+            read_smf(str(path))
+        except SMFError:
+            pass
+
+
+@pytest.mark.parametrize('data', [
+    b'MThd\x00\x00',  # cabeçalho curto
+    b'MThd' + struct.pack('>IHHH', 6, 0, 1, 480) + b'MTrk\x00',
+    b'MThd' + struct.pack('>IHHH', 6, 0, 1, 0)
+    + _track(b'\x00\x90\x3c\x64'),  # divisão zero
+    b'MThd' + struct.pack('>IHHH', 6, 0, 1, 480)
+    + _track(b'\x00\x90\x3c'),  # nota sem velocity
+    b'MThd' + struct.pack('>IHHH', 6, 0, 1, 480)
+    + _track(b'\x00\xff\x51\x03\x07'),  # andamento truncado
+    b'MThd' + struct.pack('>IHHH', 6, 0, 1, 480)
+    + _track(b'\x81\x80'),  # VLQ sem fim
+])
+def test_garbage_raises_smf_error(tmp_path, data):
+    path = tmp_path / 'bad.mid'
+    path.write_bytes(data)
+    with pytest.raises(SMFError):
+        read_smf(str(path))
+
+
+def test_writer_round_trip(tmp_path):
+    path = str(tmp_path / 'rec.mid')
+    messages = [
+        (0.0, (0x90, 60, 100)),
+        (0.25, (0xB0, 64, 127)),
+        (0.5, (0x80, 60, 0)),
+        (0.5, (0xC2, 7)),
+        (65.0, (0xB0, 64, 0)),  # delta grande: VLQ de vários bytes
+    ]
+    writer = SMFWriter(path)
+    for seconds, data in messages:
+        writer.write(seconds, data)
+    writer.flush()
+    writer.close()
+
+    events, length = read_smf(path)
+    assert writer.events == len(messages)
+    assert [e[1:] for e in events] == [
+        (0x90, 60, 100), (0xB0, 64, 127), (0x80, 60, 0), (0xC2, 7, 0),
+        (0xB0, 64, 0),
+    ]
+    tick = 1 / writer.ticks_per_second
+    for (seconds, _), event in zip(messages, events):
+        assert event[0] == pytest.approx(seconds, abs=tick)
+    assert length == pytest.approx(65.0, abs=tick)
+
+
+def test_unclosed_writer_is_readable(tmp_path):
+    # Gravação interrompida: só flush(), sem close() nem fim de trilha
+    path = str(tmp_path / 'crash.mid')
+    writer = SMFWriter(path)
+    writer.write(0.0, (0x90, 60, 100))
+    writer.flush()
+    writer.write(0.5, (0x80, 60, 0))
+    writer.flush()
+    writer.write(1.0, (0x90, 62, 100))  # ainda no buffer, se perde
+
+    events, length = read_smf(path)
+    assert [e[1:] for e in events] == [(0x90, 60, 100), (0x80, 60, 0)]
+    assert length == pytest.approx(0.5, abs=1 / writer.ticks_per_second)
+    writer.close()
+
+
+def test_writer_never_goes_back_in_time(tmp_path):
+    path = str(tmp_path / 'late.mid')
+    writer = SMFWriter(path)
+    writer.write(1.0, (0x90, 60, 100))
+    writer.write(0.5, (0x80, 60, 0))  # chegou atrasado do ring
+    writer.close()
+
+    events, _ = read_smf(path)
+    assert [e[0] for e in events] == pytest.approx([1.0, 1.0])
@@ -0,0 +1,78 @@
+"""SustainEngine: troca de instrumentos com os pedais abaixados."""
+
+from app.sustain import SustainEngine
+
+
+class RecordingFluid:
+    def __init__(self):
+        self.calls = []
+
+    def cc(self, ch, ctrl, value):
+        self.calls.append((ch, ctrl, value))
+
+
+class FakeSynth:
+    def __init__(self):
+        self.fs = RecordingFluid()
+        self.sustain = SustainEngine(self)
+        self._active = [0] * 16
+        self._sustained = [0] * 16
+
+    def held_notes(self, ch):
+        return self._active[ch]
+
+    def sustained_notes(self, ch):
+        return self._sustained[ch]
+
+    def release_sustained(self, ch, keep=0):
+        self._sustained[ch] &= keep
+
+
+def instruments(*channels):
+    return {
+        f'inst{ch}': {'channel': ch, 'use_sustain': True} for ch in channels
+    }
+
+
+def test_dropped_channel_releases_pedals():
+    synth = FakeSynth()
+    synth.sustain.configure(instruments(0, 1))
+    synth.sustain.pedal(127)
+    synth.sustain.sostenuto(127)
+    synth._sustained[1] = 1 << 60
+    synth.fs.calls.clear()
+
+    synth.sustain.configure(instruments(0))
+
+    assert synth.fs.calls == [(1, 64, 0), (1, 66, 0)]
+    assert synth.sustain.sustain_down == [True] + [False] * 15
+    assert not synth.sustain.sostenuto_down[1]
+    assert synth._sustained[1] == 0
+
+    # O canal que ficou continua com o pedal e solta normalmente
+    synth.sustain.pedal(0)
+    assert synth.fs.calls[-1] == (0, 64, 0)
+
+
+def test_configure_without_pedal_sends_nothing():
+    synth = FakeSynth()
+    synth.sustain.configure(instruments(0, 1))
+    synth.sustain.configure(instruments(2))
+    assert synth.fs.calls == []
+
+
+def test_sources_hold_the_pedal_separately():
+    synth = FakeSynth()
+    synth.sustain.configure(instruments(0))
+    synth.sustain.pedal(127)
+    synth.sustain.pedal(127, 'sequencer')
+    synth.sustain.pedal(0, 'sequencer')  # fim do backing track
+    assert synth.fs.calls == [(0, 64, 127)]
+    assert synth.sustain.sustain_down[0]
+
+    synth.sustain.pedal(127, 'sequencer')
+    synth.sustain.pedal(0)  # o teclado solta; o arquivo ainda segura
+    assert synth.fs.calls == [(0, 64, 127)]
+    synth.sustain.pedal(0, 'sequencer')
+    assert synth.fs.calls == [(0, 64, 127), (0, 64, 0)]
+    assert not synth.sustain.sustain_down[0]
@@ -0,0 +1,184 @@
+"""Roubo de vozes do VoiceBudget num SynthModule de verdade, sobre o
+fluidsynth falso do bench_hotpath.
+
+O driver guarda, por canal, as notas seguradas, as que soam pelo sustain
+e as presas pelo sostenuto, a partir das chamadas que recebeu; depois de
+cada roubo os bitsets do synth precisam bater com o que ainda soa nele."""
+
+from collections import deque
+
+from tools.bench_hotpath import RecordingSynth, install_fakes
+
+install_fakes()
+
+from app.sustain import SustainEngine  # noqa: E402
+from app.synth import SynthModule  # noqa: E402
+from app.voices import VoiceBudget  # noqa: E402
+
+CH = 0
+
+
+class FluidModel(RecordingSynth):
+    """Registra as chamadas e mantém o estado das vozes de um canal como o
+    fluidsynth o vê."""
+
+    def __init__(self):
+        super().__init__()
+        self.held = set()
+        self.sustained = set()  # soltas, soando pelo CC64
+        self.latched = set()  # presas pelo CC66 (seguradas ou soltas)
+        self.pedal = False
+        self.sostenuto = False
+
+    def noteon(self, ch, note, vel):
+        super().noteon(ch, note, vel)
+        self.held.add(note)
+
+    def noteoff(self, ch, note):
+        super().noteoff(ch, note)
+        if note not in self.held:
+            return
+        self.held.discard(note)
+        if note in self.latched:
+            return
+        if self.pedal:
+            self.sustained.add(note)
+
+    def cc(self, ch, ctrl, value):
+        super().cc(ch, ctrl, value)
+        down = value >= 64
+        if ctrl == 64:
+            self.pedal = down
+            if not down:
+                self.sustained.clear()
+        elif ctrl == 66:
+            if down and not self.sostenuto:
+                self.latched = set(self.held)
+            elif not down and self.sostenuto:
+                for note in self.latched - self.held:
+                    if self.pedal:
+                        self.sustained.add(note)
+                self.latched = set()
+            self.sostenuto = down
+
+    def get_active_voice_count(self):
+        return len(self.sounding())
+
+    def sounding(self):
+        return self.held | self.sustained | self.latched
+
+
+def make_synth(max_voices):
+    """SynthModule sem config nem soundfonts: só o rastreamento de notas,
+    pedais e orçamento de vozes que o __init__ monta, com um Piano."""
+    synth = SynthModule.__new__(SynthModule)
+    synth.fs = FluidModel()
+    synth.instruments = {
+        'Piano': {
+            'channel': CH, 'volume': 100, 'input_channel': None,
+            'min_note': 0, 'max_note': 127,
+            'max_voices': max_voices, 'use_sustain': True,
+        },
+    }
+    synth.voices = VoiceBudget(synth, 0)
+    synth.sustain = SustainEngine(synth)
+    synth.forget_notes()
+    synth._rebuild_note_routes()
+    synth.voices.configure(synth.instruments)
+    synth.sustain.configure(synth.instruments)
+    return synth
+
+
+def tracked(synth):
+    bits = synth.held_notes(CH) | synth.sustained_notes(CH)
+    return {n for n in range(128) if bits >> n & 1}
+
+
+def check(synth):
+    assert tracked(synth) == synth.fs.sounding()
+
+
+def test_steal_held_note_with_pedal_down():
+    synth = make_synth(max_voices=2)
+    synth.sustain.pedal(127)
+    synth.note_on(CH, 60, 100)
+    synth.note_on(CH, 64, 100)
+    synth.note_on(CH, 67, 100)  # passa do limite com o pedal abaixado
+
+    # O note off deixaria 60 no pedal: CC64 0/127 solta só ela
+    assert synth.fs.calls[-4:] == [
+        ('noteoff', CH, 60), ('cc', CH, 64, 0), ('cc', CH, 64, 127),
+        ('noteon', CH, 67, 100),
+    ]
+    assert synth.fs.sounding() == {64, 67}
+    assert synth.fs.pedal
+    check(synth)
+    assert synth.voices.stolen['limit'][CH] == 1
+
+
+def test_steal_pedaled_notes_first():
+    synth = make_synth(max_voices=2)
+    synth.sustain.pedal(127)
+    synth.note_on(CH, 60, 100)
+    synth.note_off(CH, 60)
+    synth.note_on(CH, 64, 100)
+    synth.note_on(CH, 67, 100)
+
+    assert synth.fs.calls[-3:] == [
+        ('cc', CH, 64, 0), ('cc', CH, 64, 127), ('noteon', CH, 67, 100),
+    ]
+    assert synth.fs.sounding() == {64, 67}
+    check(synth)
+
+
+def test_steal_skips_latched_note():
+    synth = make_synth(max_voices=2)
+    synth.note_on(CH, 60, 100)
+    synth.sustain.sostenuto(127)
+    synth.note_on(CH, 64, 100)
+    synth.note_on(CH, 67, 100)  # 60 está preso pelo sostenuto; 64 sai no lugar
+
+    assert synth.fs.sounding() == {60, 67}
+    check(synth)
+
+
+def test_steal_latched_held_note():
+    synth = make_synth(max_voices=1)
+    synth.note_on(CH, 60, 100)
+    synth.sustain.sostenuto(127)
+    synth.note_on(CH, 64, 100)  # só resta a nota presa para roubar
+
+    assert synth.fs.calls[-4:] == [
+        ('noteoff', CH, 60), ('cc', CH, 66, 0), ('cc', CH, 66, 127),
+        ('noteon', CH, 64, 100),
+    ]
+    assert synth.fs.sounding() == {64}
+    assert synth.fs.sostenuto
+    check(synth)
+
+
+def test_steal_released_latched_notes():
+    synth = make_synth(max_voices=2)
+    synth.sustain.pedal(127)
+    synth.note_on(CH, 60, 100)
+    synth.note_on(CH, 62, 100)
+    synth.sustain.sostenuto(127)
+    synth.sustain.pedal(0)
+    synth.note_off(CH, 60)
+    synth.note_off(CH, 62)
+    assert synth.fs.sounding() == {60, 62}
+    check(synth)
+
+    synth.note_on(CH, 64, 100)
+    assert synth.fs.sounding() == {64}
+    assert synth.fs.sostenuto
+    check(synth)
+
+
+def test_order_queue_is_compacted():
+    synth = make_synth(max_voices=0)
+    for _ in range(300):
+        synth.note_on(CH, 60, 100)
+        synth.note_off(CH, 60)
+    assert isinstance(synth.voices._order[CH], deque)
+    assert len(synth.voices._order[CH]) <= 257
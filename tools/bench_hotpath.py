@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Benchmark do caminho MIDI -> synth sem hardware.
+
+Substitui `fluidsynth` por um Synth que só registra as chamadas e `rtmidi`
+por um stub sem portas, gera SF2 mínimos para os arquivos citados em cada
+config e alimenta MidiBridge._handle_message com fluxos sintéticos:
+
+  notes    enxurrada de note on/off em acordes
+  cc       varreduras densas de CC (volumes, expressão, CC não mapeado)
+  sustain  notas com pedal de sustain entrando e saindo
+  banks    notas com trocas de banco (next/prev) no meio do fluxo
+
+Para cada config e fluxo reporta eventos/s e a distribuição de latência
+por evento. O resultado vai para um JSON; com --compare outro JSON é usado
+como referência.
+
+Uso:
+  python tools/bench_hotpath.py [--events N] [--output bench.json]
+                                [--compare old.json]
+                                [config.yaml config-raspberry.yaml ...]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import types
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DEFAULT_CONFIGS = (
+    'config.yaml', 'config-raspberry.yaml', 'config-nektar-lx-25.yaml',
+)
+
+
+# ---------------- FAKES -----------------
+class RecordingSynth:
+    """Substituto de fluidsynth.Synth que só registra as chamadas."""
+
+    def __init__(self, *args, **kwargs):
+        self.calls = []
+        self._next_sfid = 1
+
+    def _record(self, *call):
+        self.calls.append(call)
+
+    def setting(self, key, value):
+        pass
+
+    def get_setting(self, key):
+        return None
+
+    def start(self, driver=None, device=None, **kwargs):
+        return 0
+
+    def sfload(self, path, update_midi_preset=0):
+        sfid = self._next_sfid
+        self._next_sfid += 1
+        return sfid
+
+    def sfunload(self, sfid, update_midi_preset=0):
+        return 0
+
+    def program_select(self, chan, sfid, bank, preset):
+        self._record('program_select', chan, sfid, bank, preset)
+        return 0
+
+    def program_change(self, chan, prg):
+        self._record('program_change', chan, prg)
+
+    def noteon(self, chan, key, vel):
+        self._record('noteon', chan, key, vel)
+
+    def noteoff(self, chan, key):
+        self._record('noteoff', chan, key)
+
+    def cc(self, chan, ctrl, val):
+        self._record('cc', chan, ctrl, val)
+
+    def pitch_bend(self, chan, val):
+        self._record('pitch_bend', chan, val)
+
+    def get_active_voice_count(self):
+        return 0
+
+    def get_samples(self, length=1024):
+        raise NotImplementedError
+
+    def delete(self):
+        pass
+
+
+class StubMidiIn:
+    def get_ports(self):
+        return []
+
+    def open_port(self, index):
+        pass
+
+    def set_callback(self, callback):
+        pass
+
+
+def install_fakes():
+    fake_fs = types.ModuleType('fluidsynth')
+    fake_fs.Synth = RecordingSynth
+    fake_midi = types.ModuleType('rtmidi')
+    fake_midi.MidiIn = StubMidiIn
+    sys.modules['fluidsynth'] = fake_fs
+    sys.modules['rtmidi'] = fake_midi
+    sys.path.insert(0, ROOT)
+
+
+# ---------------- SF2 -----------------
+def _chunk(cid, data):
+    pad = b'\0' if len(data) & 1 else b''
+    return cid + struct.pack('<I', len(data)) + data + pad
+
+
+def write_minimal_sf2(path, presets):
+    """SF2 com INFO, sdta vazio e pdta/phdr com os presets dados."""
+    phdr = b''
+    for i, (bank, prog, name) in enumerate(list(presets) + [(0, 0, 'EOP')]):
+        raw = name.encode('latin-1')[:20]
+        phdr += struct.pack('<20sHHHIII', raw, prog, bank, i, 0, 0, 0)
+    body = (
+        b'sfbk'
+        + _chunk(b'LIST', b'INFO' + _chunk(b'ifil', struct.pack('<HH', 2, 1)))
+        + _chunk(b'LIST', b'sdta' + _chunk(b'smpl', b''))
+        + _chunk(b'LIST', b'pdta' + _chunk(b'phdr', phdr))
+    )
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'RIFF' + struct.pack('<I', len(body)) + body)
+
+
+def prepare_workdir(workdir, cfg_data):
+    presets = {}
+    for bank in cfg_data.get('banks', []):
+        for inst in bank.get('instruments', []):
+            presets.setdefault(inst['file'], set()).add(
+                (inst.get('bank', 0), inst.get('preset', 0), inst['name'][:20])
+            )
+    for path, entries in presets.items():
+        target = path if os.path.isabs(path) else os.path.join(workdir, path)
+        write_minimal_sf2(target, sorted(entries))
+
+
+# ---------------- STREAMS -----------------
+def stream_notes(n, rng, cfg):
+    out = []
+    while len(out) < n:
+        root = rng.randrange(36, 84)
+        chord = [root, root + 4, root + 7, root + 12]
+        out += [[0x90, note, rng.randrange(40, 127)] for note in chord]
+        out += [[0x80, note, 0] for note in chord]
+    return out[:n]
+
+
+def stream_cc(n, rng, cfg):
+    volume_ccs = sorted({
+        inst.get('volume_cc')
+        for b in cfg.get('banks', []) for inst in b.get('instruments', [])
+        if inst.get('volume_cc') is not None
+    })
+    ccs = volume_ccs + [11, 74]
+    out = []
+    while len(out) < n:
+        cc = rng.choice(ccs)
+        out += [[0xB0, cc, v] for v in range(0, 128, 4)]
+    return out[:n]
+
+
+def stream_sustain(n, rng, cfg):
+    out = []
+    while len(out) < n:
+        out.append([0xB0, 64, 127])
+        for _ in range(4):
+            note = rng.randrange(36, 96)
+            out += [[0x90, note, 100], [0x80, note, 0]]
+        out.append([0xB0, 64, 0])
+    return out[:n]
+
+
+def stream_banks(n, rng, cfg):
+    actions = cfg.get('midi', {}).get('actions', {})
+    switches = [
+        [0xB0, actions[a]['cc'], actions[a].get('value', 127)]
+        for a in ('next_bank', 'prev_bank') if isinstance(actions.get(a), dict)
+    ]
+    out = []
+    while len(out) < n:
+        for _ in range(16):
+            note = rng.randrange(36, 96)
+            out += [[0x90, note, 100], [0x80, note, 0]]
+        if switches:
+            out.append(rng.choice(switches))
+    return out[:n]
+
+
+STREAMS = {
+    'notes': stream_notes,
+    'cc': stream_cc,
+    'sustain': stream_sustain,
+    'banks': stream_banks,
+}
+
+
+# ---------------- RUN -----------------
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[idx]
+
+
+def wait_banks_ready(synth, timeout=10.0):
+    names = [b.get('name') for b in synth.cfg.data.get('banks', [])]
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(synth.bank_state(n) in ('ready', 'failed') for n in names):
+            return
+        time.sleep(0.01)
+
+
+def run_stream(midi, synth, events):
+    handle = midi._handle_message
+    clock = time.perf_counter_ns
+    lat = []
+    append = lat.append
+    synth.fs.calls.clear()
+    t_start = clock()
+    for data in events:
+        t0 = clock()
+        handle(data, 0.0)
+        append(clock() - t0)
+    elapsed = (clock() - t_start) / 1e9
+    lat.sort()
+    return {
+        'events': len(events),
+        'fluidsynth_calls': len(synth.fs.calls),
+        'events_per_s': round(len(events) / elapsed, 1) if elapsed else 0.0,
+        'mean_us': round(sum(lat) / len(lat) / 1000, 3),
+        'p50_us': round(percentile(lat, 0.50) / 1000, 3),
+        'p90_us': round(percentile(lat, 0.90) / 1000, 3),
+        'p99_us': round(percentile(lat, 0.99) / 1000, 3),
+        'max_us': round(lat[-1] / 1000, 3),
+    }
+
+
+def bench_config(cfg_file, n_events, seed):
+    import yaml
+    from app import config as config_mod
+    from app import logs
+    from app.config import Config
+    from app.synth import SynthModule
+    from app.midi import MidiBridge
+
+    with open(os.path.join(ROOT, cfg_file), 'r', encoding='utf-8') as f:
+        cfg_data = yaml.safe_load(f) or {}
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    try:
+        prepare_workdir(workdir, cfg_data)
+        shutil.copy(os.path.join(ROOT, cfg_file),
+                    os.path.join(workdir, 'config.yaml'))
+        os.chdir(workdir)
+        config_mod.CFG_FILE = 'config.yaml'
+        logs.set_level('*', 'warn')
+
+        cfg = Config()
+        # O benchmark chama _handle_message direto, sem thread de dispatch
+        cfg.data.setdefault('midi', {})['dispatch'] = {'mode': 'callback'}
+        synth = SynthModule(cfg)
+        midi = MidiBridge(cfg, synth)
+        wait_banks_ready(synth)
+
+        results = {}
+        for name, make in STREAMS.items():
+            events = make(n_events, random.Random(seed), cfg.data)
+            results[name] = run_stream(midi, synth, events)
+        synth.loader.stop()
+        return results
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_results(report, baseline=None):
+    for cfg_file, streams in report['results'].items():
+        print(f"\n{cfg_file}")
+        print(f"  {'stream':<8} {'eventos/s':>12} {'p50 µs':>8} "
+              f"{'p99 µs':>8} {'max µs':>9}  {'fs calls':>8}")
+        previous = (baseline or {}).get('results', {}).get(cfg_file, {})
+        for name, r in streams.items():
+            line = (f"  {name:<8} {r['events_per_s']:>12.0f} "
+                    f"{r['p50_us']:>8.2f} {r['p99_us']:>8.2f} "
+                    f"{r['max_us']:>9.2f}  {r['fluidsynth_calls']:>8}")
+            base = previous.get(name)
+            if base and base.get('events_per_s'):
+                ratio = r['events_per_s'] / base['events_per_s']
+                line += f"  ({ratio:.2f}x vs base)"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark do caminho MIDI -> synth sem hardware'
+    )
+    parser.add_argument('configs', nargs='*', default=list(DEFAULT_CONFIGS))
+    parser.add_argument('--events', type=int, default=20000,
+                        help='eventos por fluxo')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', default='bench.json')
+    parser.add_argument('--compare', help='JSON de uma execução anterior')
+    args = parser.parse_args()
+
+    install_fakes()
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'events_per_stream': args.events,
+        'results': {},
+    }
+    for cfg_file in args.configs:
+        report['results'][cfg_file] = bench_config(
+            cfg_file, args.events, args.seed
+        )
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_results(report, baseline)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nresultados gravados em {args.output}")
+
+
+if __name__ == '__main__':
+    main()
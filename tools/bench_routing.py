@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark do fan-out de notas do SynthModule.
+
+Compara o loop antigo (varre self.instruments a cada nota) com a tabela de
+roteamento compilada. Usa um Synth nulo e os módulos falsos de
+bench_hotpath (fluidsynth/rtmidi), então não precisa de placa de som, de
+soundfonts nem do pyfluidsynth instalado.
+
+Uso: python tools/bench_routing.py [instrumentos] [acordes]
+"""
+
+import sys
+import time
+
+from bench_hotpath import install_fakes
+
+install_fakes()
+
+from app.synth import SynthModule  # noqa: E402
+from app.sustain import SustainEngine  # noqa: E402
+from app.voices import VoiceBudget  # noqa: E402
+
+
+class NullSynth:
+    def noteon(self, chan, key, vel):
+        pass
+
+    def noteoff(self, chan, key):
+        pass
+
+
+def legacy_note_on(synth, channel, note, vel):
+    for inst in synth.instruments.values():
+        if inst['volume'] > 0:
+            if inst['min_note'] <= note <= inst['max_note']:
+                synth.fs.noteon(inst['channel'], note, vel)
+
+
+def legacy_note_off(synth, channel, note):
+    for inst in synth.instruments.values():
+        if inst['volume'] > 0:
+            if inst['min_note'] <= note <= inst['max_note']:
+                synth.fs.noteoff(inst['channel'], note)
+
+
+def build_synth(n_instruments):
+    synth = SynthModule.__new__(SynthModule)
+    synth.fs = NullSynth()
+    synth.instruments = {}
+    # Mesmo estado de rastreamento de notas e pedais que o __init__ monta;
+    # sem polyphony/max_voices o orçamento de vozes fica inativo
+    synth.voices = VoiceBudget(synth, 0)
+    synth.sustain = SustainEngine(synth)
+    synth.forget_notes()
+    for i in range(n_instruments):
+        synth.instruments[f'inst{i}'] = {
+            'channel': i,
+            'volume': 100,
+            'min_note': 12 * (i % 3),
+            'max_note': 127 - 12 * (i % 2),
+            'input_channel': None,
+        }
+    synth._rebuild_note_routes()
+    return synth
+
+
+def run(on, off, synth, chords):
+    chord = (48, 52, 55, 60, 64, 67, 72, 76)
+    t0 = time.perf_counter()
+    for _ in range(chords):
+        for note in chord:
+            on(synth, 0, note, 100)
+        for note in chord:
+            off(synth, 0, note)
+    return time.perf_counter() - t0
+
+
+def main():
+    n_instruments = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    chords = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    synth = build_synth(n_instruments)
+    events = chords * 16
+
+    legacy = run(legacy_note_on, legacy_note_off, synth, chords)
+    routed = run(SynthModule.note_on, SynthModule.note_off, synth, chords)
+
+    print(f"instrumentos={n_instruments} eventos={events}")
+    print(f"  loop antigo : {legacy * 1e9 / events:8.1f} ns/evento")
+    print(f"  tabela      : {routed * 1e9 / events:8.1f} ns/evento")
+    print(f"  ganho       : {legacy / routed:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
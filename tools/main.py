@@ -4,14 +4,18 @@ import time
 import yaml
 import threading
 import os
-import re
+import sys
 import fluidsynth
 import rtmidi
 from flask import Flask, jsonify, request
-from sf2utils.sf2parse import Sf2File
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+)
+from app.sf2 import read_presets  # noqa: E402
+
 CFG_FILE = "config.yaml"
 MIDI_MAP_FILE = "midi_map.yaml"
 
@@ -302,20 +306,7 @@ def run_http_app(synth: SynthModule, host="0.0.0.0", port=5000):
                 continue
 
             try:
-                with open(file_path, "rb") as f:
-                    sf2 = Sf2File(f)
-                    presets_list = []
-
-                    for preset in sf2.presets:
-                        s = str(preset)
-                        m = re.match(r"Preset\[(\d+):(\d+)\]\s*([^\d].*?)(?:\s+\d+ bag\(s\).*)?$", s)
-                        if m:
-                            bank, prog, pname = m.groups()
-                            presets_list.append({
-                                "bank": bank,
-                                "preset": prog,
-                                "name": pname.strip()
-                            })
+                presets_list = read_presets(file_path)
 
                 out[name] = {
                     "file": inst["sf"],
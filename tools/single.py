@@ -2,9 +2,13 @@
 import rtmidi
 import fluidsynth
 import time
-import re
-from sf2utils.sf2parse import Sf2File
 import os
+import sys
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+)
+from app.sf2 import read_presets  # noqa: E402
 
 # ---------------- CONFIG -----------------
 SF2_FILE = "sounds/organ/virtual.sf2"
@@ -16,19 +20,10 @@ MIDI_DRIVER = "pulseaudio"
 if not os.path.exists(SF2_FILE):
     raise FileNotFoundError(f"{SF2_FILE} não encontrado")
 
-with open(SF2_FILE, "rb") as f:
-    sf2 = Sf2File(f)
-    presets = []
-    for preset in sf2.presets:
-        s = str(preset)
-        m = re.match(r"Preset\[(\d+):(\d+)\]\s*([^\d].*?)(?:\s+\d+ bag\(s\).*)?$", s)
-        if m:
-            bank, prog, pname = m.groups()
-            presets.append({
-                "bank": int(bank),
-                "program": int(prog),
-                "name": pname.strip()
-            })
+presets = [
+    {"bank": p["bank"], "program": p["preset"], "name": p["name"]}
+    for p in read_presets(SF2_FILE)
+]
 
 if not presets:
     raise ValueError("Nenhum preset encontrado no SF2")